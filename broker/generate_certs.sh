@@ -0,0 +1,48 @@
+#!/bin/bash
+
+# 生成自簽名 TLS 憑證（開發/測試用）
+# 用法: ./generate_certs.sh [輸出目錄] [額外的主機名或 IP，以逗號分隔]
+# 例如: ./generate_certs.sh certs 140.134.60.218,mqtt.example.com
+set -e
+
+OUT_DIR="${1:-certs}"
+EXTRA_NAMES="${2:-}"
+DAYS=365
+
+mkdir -p "$OUT_DIR"
+cd "$OUT_DIR"
+
+# 伺服器憑證的 subjectAltName：客戶端以主機名或 IP 驗證憑證（不再比對 CN）
+SAN="DNS:localhost,IP:127.0.0.1"
+IFS=',' read -ra NAMES <<< "$EXTRA_NAMES"
+for name in "${NAMES[@]}"; do
+    if [[ "$name" =~ ^[0-9.]+$ ]]; then
+        SAN="$SAN,IP:$name"
+    elif [ -n "$name" ]; then
+        SAN="$SAN,DNS:$name"
+    fi
+done
+
+echo "生成 CA 憑證..."
+openssl genrsa -out ca.key 2048 2>/dev/null
+openssl req -new -x509 -key ca.key -out ca.crt -days $DAYS \
+  -subj "/C=TW/ST=Taiwan/L=Taipei/O=MQTT-Gear/CN=MQTT-CA"
+
+echo "生成伺服器憑證 ($SAN)..."
+openssl genrsa -out server.key 2048 2>/dev/null
+openssl req -new -key server.key -out server.csr \
+  -subj "/C=TW/ST=Taiwan/L=Taipei/O=MQTT-Gear/CN=localhost"
+printf "subjectAltName=%s\nextendedKeyUsage=serverAuth\n" "$SAN" > server.ext
+openssl x509 -req -in server.csr -CA ca.crt -CAkey ca.key \
+  -CAcreateserial -out server.crt -days $DAYS -extfile server.ext 2>/dev/null
+
+# 設置文件權限（server.key 需讓容器內的 mosquitto 用戶讀取）
+chmod 644 server.key server.crt ca.crt
+
+# 清理臨時文件
+rm -f server.csr server.ext ca.key ca.srl
+
+echo "✅ 憑證已生成於 $(pwd)"
+echo "   ca.crt      - CA 憑證（客戶端以 MQTT_TLS_CA 或 --cafile 指定）"
+echo "   server.crt  - 伺服器憑證"
+echo "   server.key  - 伺服器私鑰"
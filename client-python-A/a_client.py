@@ -3,8 +3,21 @@ import time
 import uuid
 import threading
 import logging
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, Callable
 import paho.mqtt.client as mqtt
+import numpy as np
+import chunked
+from aggregators import Aggregator, FeatureStats, GridHeatmap
+import clock_sync
+import codec
+import dedup
+import profiling
+import tls
+import mqtt_v5
+from flow_control import FlowController
+from journal import Journal
+from session import ControlLane, Session, SessionAborted, SessionManager, abort_payload
+from spatial_index import SpatialIndex
 
 # 配置日誌
 logging.basicConfig(
@@ -20,78 +33,163 @@ PORT = int(os.getenv("MQTT_PORT", "4883"))              # 標準 MQTT 端口
 ID = os.getenv("MQTT_CLIENT_ID", "id1")
 CLIENT_ID = f"A-{ID}"
 KEEPALIVE = int(os.getenv("MQTT_KEEPALIVE", "45"))
+PROTOCOL = os.getenv("MQTT_PROTOCOL", mqtt_v5.PROTOCOL_V311)     # "311" 或 "5"
+SESSION_EXPIRY = int(os.getenv("MQTT_SESSION_EXPIRY", "3600"))  # v5 session 保留秒數
+CHUNK_TIMEOUT = float(os.getenv("MQTT_CHUNK_TIMEOUT", "2.0"))   # 等待缺少分塊的秒數
+CHUNK_RESEND_ROUNDS = int(os.getenv("MQTT_CHUNK_RESEND_ROUNDS", "2"))
+FLOW_INITIAL_WINDOW = float(os.getenv("MQTT_FLOW_INITIAL_WINDOW", "4"))  # B 未宣告 credit 時的起始視窗
+FLOW_MAX_WINDOW = float(os.getenv("MQTT_FLOW_MAX_WINDOW", "256"))
+FLOW_CONTROL = os.getenv("MQTT_FLOW_CONTROL", "1") != "0"              # 0 表示關閉流量控制
+RECENT_WINDOW = float(os.getenv("MQTT_RECENT_WINDOW", "300"))   # 辨識重複/晚到結果的時間窗（秒）
+RECENT_CAPACITY = int(os.getenv("MQTT_RECENT_CAPACITY", "4096"))
+JOURNAL_PATH = os.getenv("MQTT_JOURNAL", "")   # run_algorithm 的崩潰安全紀錄檔，空字串表示不記錄
+CONTROL_LANE = os.getenv("MQTT_CONTROL_LANE", "1") != "0"  # abort 使用獨立連線，0 表示與主連線共用
+HEATMAP_BINS = int(os.getenv("MQTT_HEATMAP_BINS", "32"))    # 熱圖每軸格數，範圍取自 config/setting
+SPATIAL_CELL = float(os.getenv("MQTT_SPATIAL_CELL", "0"))   # 空間索引格寬，0 表示依掃描範圍自動決定
+SPATIAL_RESET = os.getenv("MQTT_SPATIAL_RESET", "0") != "0"  # 1 表示每次執行演算法前清空空間索引
 
 # Topic 定義
 TOP_CTRL_START = f"v1/{ID}/ctrl/start"       # B→A
 TOP_CTRL_END   = f"v1/{ID}/ctrl/end"         # A→B
+TOP_CTRL_ABORT = f"v1/{ID}/ctrl/abort"       # A↔B，中止 session（高優先權控制通道）
 TOP_CMD_POINT  = f"v1/{ID}/cmd/point"        # A→B
 TOP_RESULT     = f"v1/{ID}/telemetry/result" # B→A
 TOP_SETTING    = f"v1/{ID}/config/setting"   # retained
 TOP_STATUS     = f"v1/{ID}/status"
+TOP_RESPONSE   = f"{TOP_RESULT}/{CLIENT_ID}" # B→A，v5 Response Topic
+TOP_CHUNK      = f"v1/{ID}/telemetry/chunk"  # B→A，大型陣列的二進位分塊
+TOP_CHUNK_RESEND = f"v1/{ID}/cmd/chunk_resend"  # A→B，要求重送缺少的分塊
 
 class MQTTClient:
-    def __init__(self):
+    def __init__(self, protocol: str = PROTOCOL, client_id: str = CLIENT_ID, flow_share: float = 1.0,
+                 shared_results: bool = False):
         self.client = None
         self.is_connected = False
+        self.protocol = mqtt_v5.parse_protocol(protocol)
+        self.client_id = client_id
+        # v5 回覆主題依 client ID 區分，多個 A 連線各自只收到自己的結果
+        self.response_topic = f"{TOP_RESULT}/{client_id}"
+        # v3.1.1 沒有回覆主題，多個 worker 共用 telemetry/result；其他 worker 的結果直接丟棄，不計為未知
+        self.shared_results = shared_results
         # 等待表：req_id → (Event, result_payload)
         self._pending: Dict[str, Tuple[threading.Event, Any]] = {}
         self._pending_lock = threading.Lock()
+        # v5 發送端 topic alias
+        self._aliases = mqtt_v5.TopicAliasTable()
+        # 頻譜分塊重組；v5 的分塊與結果一樣送到自己的回覆主題下
+        self._chunks = chunked.ChunkReassembler()
+        self.chunk_topic = f"{self.response_topic}/chunk"
+        # 發送端壓縮；B 在 config/setting 宣告支援的編碼器後才啟用
+        self._codec = codec.PayloadCodec()
+        # 流量控制：依 B 狀態中的 credit 或 AIMD 視窗限制在途的 cmd/point
+        # 多個程序共用同一組 B 時，flow_share 為本程序可使用的 credit 比例
+        self.flow = FlowController(FLOW_INITIAL_WINDOW, maximum=FLOW_MAX_WINDOW,
+                                   enabled=FLOW_CONTROL, share=flow_share)
+        # 最近完成的 req_id：重複投遞與晚到的結果不再當作未知 req_id
+        self._completed = dedup.RecentlyCompleted(RECENT_WINDOW, RECENT_CAPACITY)
+        self.result_counters = dedup.ResultCounters()
+        # 依結果中的奈秒時間標記估計 A/B 時鐘偏移並分解延遲
+        self.timing = clock_sync.LatencyBreakdown()
+        # 結果的線上統計：每個結果 O(1) 更新，執行中可隨時查詢
+        self.feature_stats = FeatureStats()
+        self.heatmap = GridHeatmap(HEATMAP_BINS, HEATMAP_BINS)
+        # 已量測點的空間索引：近鄰/半徑查詢與 IDW 估計
+        self.spatial = SpatialIndex(SPATIAL_CELL or None)
+        self.aggregators: List[Aggregator] = [self.feature_stats, self.heatmap, self.spatial]
+        self._settings: Dict[str, Any] = {}
+        # B 在 config/setting 宣告使用 v5 時，req_id 只放在 Correlation Data
+        self._peer_v5 = False
+        # 晚到結果的回呼 (req_id, result)；未設定時直接丟棄。於 MQTT 網路線程呼叫，應儘快返回
+        self.on_late_result: Optional[Callable[[str, Dict[str, Any]], None]] = None
+        # 量測 session：START 去重/取代，abort 時喚醒所有等待中的請求
+        self.sessions = SessionManager(RECENT_WINDOW, on_cancel=lambda _: self.flow.wake())
+        self.control: Optional[ControlLane] = None
+
+    @property
+    def is_v5(self) -> bool:
+        return self.protocol == mqtt_v5.PROTOCOL_V5
         
-    def setup_client(self):
-        """設置 MQTT 客戶端"""
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID, clean_session=False, protocol=mqtt.MQTTv311)
+    def setup_client(self, client: Optional[mqtt.Client] = None,
+                     control_client: Optional[mqtt.Client] = None):
+        """
+        設置 MQTT 客戶端（可傳入相容的替身客戶端，例如 local_bus.LocalClient）
+        control_client 為 abort 使用的獨立連線；傳入替身客戶端時只有一併傳入才啟用
+        """
+        if client is None and control_client is None and CONTROL_LANE:
+            control_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{self.client_id}-ctrl",
+                                         protocol=mqtt_v5.paho_protocol(self.protocol))
+            tls.apply(control_client)
+        if control_client is not None:
+            self.control = ControlLane(control_client, TOP_CTRL_ABORT, self._on_abort)
+        if client is not None:
+            self.client = client
+        elif self.is_v5:
+            # v5 不使用 clean_session，改由 connect 時的 clean_start + Session Expiry 保留 session
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id, clean_session=False, protocol=mqtt.MQTTv311)
+        if client is None:
+            tls.apply(self.client)
         
         # 匿名連接，不需要用戶名密碼
         
         # 設置遺囑
-        will_payload = json.dumps({
-            "online": False, 
-            "sender": "A", 
-            "ts": int(time.time()),
-            "state": "disconnected"
-        })
+        will_payload = self._status_payload("disconnected", online=False)
         self.client.will_set(TOP_STATUS, will_payload, qos=1, retain=True)
         
         # 設置回調函數
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        profiling.instrument(self.client, "A.")
+        if self.control is not None:
+            profiling.instrument(self.control.client, "A.ctrl.")
         
     def on_connect(self, client: mqtt.Client, userdata, flags, rc, properties=None):
         """連接成功回調"""
         if rc == 0:
             self.is_connected = True
-            logger.info("A 客戶端連接成功")
+            logger.info(f"A 客戶端連接成功 (MQTT {'v5' if self.is_v5 else 'v3.1.1'})")
             
             # 訂閱主題
             subs = [
                 (TOP_CTRL_START, 1), 
                 (TOP_RESULT, 1), 
-                (TOP_SETTING, 1)
+                (TOP_CHUNK, 1),
+                (TOP_SETTING, 1),
+                (TOP_STATUS, 1),
+                (f"{TOP_STATUS}/+", 1)   # 共享訂閱模式下各 B 實例的 credit
             ]
+            if self.control is None:
+                subs.append((TOP_CTRL_ABORT, 1))
+            if self.is_v5:
+                subs.append((self.response_topic, 1))
+                subs.append((self.chunk_topic, 1))
+                # alias 只在單一連線內有效，依 CONNACK 的上限重設
+                self._aliases.reset(getattr(properties, "TopicAliasMaximum", 0))
             client.subscribe(subs)
             
             # 發送上線狀態（retained）
-            status_payload = json.dumps({
-                "online": True, 
-                "sender": "A", 
-                "ts": int(time.time()), 
-                "state": "idle"
-            })
+            status_payload = self._status_payload("idle")
             client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
             logger.info("已發送上線狀態")
         else:
             logger.error(f"A 客戶端連接失敗，錯誤碼：{rc}")
             
-    def on_disconnect(self, client, userdata, rc, properties=None):
+    def on_disconnect(self, client, userdata, flags, rc, properties=None):
         """斷線回調"""
         self.is_connected = False
         logger.warning(f"A 客戶端斷線，錯誤碼：{rc}")
         
     def on_message(self, client: mqtt.Client, userdata, msg: mqtt.MQTTMessage):
         """接收消息回調"""
+        # 頻譜分塊為二進位格式，不經 JSON 解析
+        if msg.topic in (TOP_CHUNK, self.chunk_topic):
+            self._on_chunk(msg.payload)
+            return
+
         try:
-            data = json.loads(msg.payload.decode("utf-8"))
+            data = codec.loads(msg.payload)
             logger.info(f"收到消息 - Topic: {msg.topic}, Data: {data}")
         except Exception as e:
             logger.error(f"解析消息錯誤: {e}, topic: {msg.topic}")
@@ -100,147 +198,497 @@ class MQTTClient:
         # 處理控制開始消息
         if msg.topic == TOP_CTRL_START and data.get("type") == "start":
             logger.info(f"[A] 收到 START 信號: {data}")
-            # 在新線程中運行演算法，避免阻塞 MQTT 循環
-            threading.Thread(target=self.run_algorithm, daemon=True).start()
+            self._on_start(data)
+
+        # 處理中止消息（未使用獨立控制連線時）
+        elif msg.topic == TOP_CTRL_ABORT and data.get("type") == "abort":
+            self._on_abort(data)
 
-        # 處理結果消息
-        elif msg.topic == TOP_RESULT and data.get("type") == "result_feature_set":
-            req_id = data.get("req_id")
+        # 處理結果消息（v5 回覆帶 Correlation Data，v3.1.1 則在 JSON 內）
+        elif msg.topic in (TOP_RESULT, self.response_topic) and data.get("type") == "result_feature_set":
+            req_id = mqtt_v5.correlation_id(msg) or data.get("req_id")
             if not req_id:
                 logger.warning("結果消息缺少 req_id")
                 return
+            if isinstance(data.get("timing"), dict):
+                data["timing"]["t_arrive_ns"] = clock_sync.received_ns(msg)
                 
             with self._pending_lock:
                 item = self._pending.get(req_id)
+                if item and item[1] is None:
+                    # 更新結果（重試造成的第二份結果保留第一份）
+                    self._pending[req_id] = (item[0], data)
                 
-            if item:
-                ev, _ = item
-                # 更新結果並喚醒等待線程
-                with self._pending_lock:
-                    self._pending[req_id] = (ev, data)
-                ev.set()
+            if item and item[1] is None:
+                # 喚醒等待線程
+                item[0].set()
                 logger.info(f"[A] 收到結果 req_id={req_id}")
+            elif item:
+                self.result_counters.incr("duplicate")
             else:
-                logger.warning(f"收到未知 req_id 的結果: {req_id}")
+                self._on_stale_result(req_id, data)
+
+        # 處理 B 的狀態（credit 與排隊數）
+        elif msg.topic == TOP_STATUS or msg.topic.startswith(f"{TOP_STATUS}/"):
+            if data.get("sender") == "B":
+                self.flow.update(msg.topic, data)
 
         # 處理設定消息
         elif msg.topic == TOP_SETTING:
             logger.info(f"[A] 收到設定更新: {data}")
+            self._configure_codec(data.get("compression"))
+            self._peer_v5 = data.get("protocol") == mqtt_v5.PROTOCOL_V5
+            self._settings = data
+            for agg in self.aggregators:
+                try:
+                    agg.configure(data)
+                except ValueError as e:
+                    logger.error(f"[A] {agg.name} 設定錯誤: {e}")
+
+    def _on_start(self, data: Dict[str, Any]):
+        """重複的 START 忽略；新的 session 取代執行中的 session"""
+        session, superseded = self.sessions.start(data.get("session_id"), data.get("job_id"),
+                                                  supersede=bool(data.get("supersede")))
+        if session is None:
+            logger.info(f"[A] 忽略重複的 START (session_id={data.get('session_id')}, "
+                        f"job_id={data.get('job_id')})")
+            return
+        if superseded:
+            logger.warning(f"[A] session {superseded.session_id} 被 {session.session_id} 取代")
+            self._publish_abort(superseded.session_id, "superseded")
+        # 在新線程中運行演算法，避免阻塞 MQTT 循環
+        threading.Thread(target=profiling.wrap("A.run_algorithm", self.run_algorithm),
+                         args=(session,), daemon=True).start()
+
+    def _on_abort(self, data: Dict[str, Any]):
+        """B 或操作員要求中止；在網路線程直接處理，不經任何佇列"""
+        if data.get("type") != "abort" or data.get("sender") == "A":
+            return
+        session = self.sessions.abort(data.get("session_id"), data.get("reason") or "aborted")
+        if session:
+            logger.warning(f"[A] session {session.session_id} 已中止，取消 {len(session.pending())} 個等待中的請求")
+
+    def abort_session(self, session_id: Optional[str] = None, reason: str = "operator") -> bool:
+        """
+        中止指定（或目前）的 session：等待中的請求立即返回，
+        並通知 B 丟棄該 session 排隊中的 cmd/point
+        """
+        session = self.sessions.abort(session_id, reason)
+        session_id = session.session_id if session else session_id
+        if not session_id:
+            return False
+        self._publish_abort(session_id, reason)
+        return True
+
+    def _publish_abort(self, session_id: str, reason: str):
+        payload = abort_payload(session_id, "A", reason)
+        if self.control is not None:
+            self.control.publish(payload)
+        else:
+            self.client.publish(TOP_CTRL_ABORT, payload, qos=1)
+
+    def _status_payload(self, state: str, online: bool = True) -> str:
+        """A 端狀態；附帶可解碼的壓縮格式，讓 B 選擇結果的編碼器"""
+        return json.dumps({
+            "online": online,
+            "sender": "A",
+            "ts": int(time.time()),
+            "state": state,
+            "compression": codec.advertisement()
+        })
+
+    def _configure_codec(self, advertised: Optional[Dict[str, Any]]):
+        """依 B 宣告的壓縮能力選擇 cmd/point 的編碼器；未宣告時不壓縮"""
+        advertised = advertised or {}
+        name = codec.negotiate(advertised.get("codecs"))
+        self._codec = codec.PayloadCodec(
+            name,
+            threshold=advertised.get("threshold", codec.DEFAULT_THRESHOLD),
+            use_dict=codec.RESULT_DICT_ID in advertised.get("dictionaries", [])
+        )
+        if name:
+            logger.info(f"[A] 啟用訊息壓縮: {name}")
+
+    def _on_stale_result(self, req_id: str, data: Dict[str, Any]):
+        """不在等待表中的結果：重複投遞直接丟棄，晚到的結果交給回呼"""
+        state = self._completed.get(req_id)
+        if state == dedup.DONE:
+            self.result_counters.incr("duplicate")
+            logger.debug(f"[A] 丟棄重複結果 req_id={req_id}")
+        elif state == dedup.ABANDONED:
+            self.result_counters.incr("late")
+            if self.on_late_result:
+                self.on_late_result(req_id, data)
+            else:
+                logger.debug(f"[A] 丟棄晚到結果 req_id={req_id}")
+        elif self.shared_results:
+            logger.debug(f"[A] 略過其他 worker 的結果 req_id={req_id}")
+        else:
+            self.result_counters.incr("unknown")
+            logger.warning(f"收到未知 req_id 的結果: {req_id}")
+
+    def result_metrics(self) -> Dict[str, int]:
+        """重複、晚到與未知 req_id 結果的數量"""
+        return self.result_counters.snapshot()
+
+    def add_aggregator(self, aggregator: Aggregator) -> Aggregator:
+        """加入自訂的線上統計；已收到的設定會立即套用"""
+        if self._settings:
+            aggregator.configure(self._settings)
+        self.aggregators.append(aggregator)
+        return aggregator
+
+    def aggregate_snapshot(self) -> Dict[str, Any]:
+        """所有 aggregator 目前的狀態"""
+        return {agg.name: agg.snapshot() for agg in self.aggregators}
+
+    def _aggregate(self, result: Dict[str, Any]):
+        point = result.get("point") or {}
+        x, y = point.get("x"), point.get("y")
+        features, values = result.get("features") or [], result.get("values") or []
+        if x is None or y is None:
+            return
+        for agg in self.aggregators:
+            try:
+                agg.update(float(x), float(y), features, values)
+            except Exception as e:
+                logger.error(f"[A] {agg.name} 更新失敗: {e}")
+
+    def latency_summary(self) -> Dict[str, Any]:
+        """各延遲成分的分布與各 B 實例的時鐘偏移/漂移估計"""
+        return self.timing.snapshot()
+
+    def _on_chunk(self, payload: bytes):
+        """寫入頻譜分塊；陣列完整且結果已到時喚醒等待線程"""
+        try:
+            fed = self._chunks.feed(payload, accept=self._is_pending)
+        except ValueError as e:
+            logger.error(f"解析分塊錯誤: {e}")
+            return
+        if not fed or not fed[1]:
+            return
+        with self._pending_lock:
+            item = self._pending.get(fed[0])
+        if item and item[1] is not None:
+            item[0].set()
+
+    def _is_pending(self, req_id: str) -> bool:
+        with self._pending_lock:
+            return req_id in self._pending
             
-    def send_point_and_wait(self, x: float, y: float, timeout: float = 5.0, retries: int = 2) -> Optional[Dict]:
+    def send_point_and_wait(self, x: float, y: float, timeout: float = 5.0, retries: int = 2,
+                            req_id: Optional[str] = None,
+                            session: Optional[Session] = None) -> Optional[Dict]:
         """
         發送 cmd/point，等待對應 req_id 的 telemetry/result。
-        逾時重試（使用相同 req_id 以達到幂等）。
+        逾時重試（使用相同 req_id 以達到幂等）；續跑時可傳入原本的 req_id。
+        session 被中止時立即拋出 SessionAborted。
         """
         if not self.is_connected:
             logger.error("MQTT 未連接，無法發送點位")
             return None
             
-        req_id = str(uuid.uuid4())
+        req_id = req_id or str(uuid.uuid4())
         payload = {
             "type": "move_point",
             "point": {"x": x, "y": y},
             "ts": int(time.time()),
-            "sender": "A",
-            "req_id": req_id
+            "sender": "A"
         }
+        if not (self.is_v5 and self._peer_v5):
+            # 雙方都是 v5 時 req_id 只在 Correlation Data；C# B 等未宣告 v5 的 B 只從 JSON 讀取並以此去重
+            payload["req_id"] = req_id
+        if session:
+            # B 據此丟棄已中止 session 的排隊指令
+            payload["session_id"] = session.session_id
+            session.check()
+        cancel = session.cancel_event if session else None
         
+        # 等待發送名額（B 的 credit 或 AIMD 視窗）
+        while True:
+            ticket = self.flow.acquire(timeout * (retries + 1), cancel)
+            if ticket:
+                break
+            if session:
+                session.check()
+            # B 仍在宣告 credit 表示在線且忙碌，繼續等待；離線時遺囑會移除其 credit
+            if not self.flow.credit_mode:
+                raise TimeoutError(f"req_id={req_id} 等待 B 的處理容量逾時")
+            logger.info(f"[A] B 仍忙碌，繼續等待發送名額 (req_id={req_id})")
+
         ev = threading.Event()
         with self._pending_lock:
             self._pending[req_id] = (ev, None)
+        if session:
+            session.track(req_id, ev)
 
-        attempt = 0
-        while attempt <= retries:
-            attempt += 1
-            
-            # 發送點位命令
-            self.client.publish(TOP_CMD_POINT, json.dumps(payload), qos=1)
-            logger.info(f"[A] 發送點位 ({x},{y}), 嘗試 {attempt}, req_id={req_id}")
-            
-            # 等待結果
-            if ev.wait(timeout):
-                # 取回結果
-                with self._pending_lock:
-                    _, result = self._pending.pop(req_id, (None, None))
-                logger.info(f"[A] 獲得結果 req_id={req_id}: {result}")
-                return result
-            else:
-                logger.warning(f"[A] 等待結果逾時 (req_id={req_id}), 重試...")
+        success = False
+        try:
+            attempt = 0
+            resend = True
+            while attempt <= retries:
+                attempt += 1
+                
+                # 發送點位命令（B 仍在排隊處理時不重送，只延長等待）
+                if resend:
+                    self._publish_point(req_id, payload, timeout)
+                    logger.info(f"[A] 發送點位 ({x},{y}), 嘗試 {attempt}, req_id={req_id}")
+                
+                # 等待結果
+                if ev.wait(timeout):
+                    if session and session.cancelled:
+                        break
+                    # 取回結果（含分塊頻譜的重組）
+                    result = self._collect_result(req_id, ev)
+                    logger.info(f"[A] 獲得結果 req_id={req_id}: {result}")
+                    success = True
+                    return result
+                self.flow.on_timeout(ticket)
+                resend = not self.flow.backlogged()
+                if resend:
+                    logger.warning(f"[A] 等待結果逾時 (req_id={req_id}), 重試...")
+                else:
+                    logger.warning(f"[A] 等待結果逾時 (req_id={req_id})，B 仍有排隊，延長等待")
+
+            # 最終失敗或 session 中止，清理等待表
+            with self._pending_lock:
+                self._pending.pop(req_id, None)
+                self._completed.add(req_id, dedup.ABANDONED)
+            self._chunks.discard(req_id)
+            if session:
+                session.check()
+            raise TimeoutError(f"req_id={req_id} 在 {retries+1} 次嘗試後仍未收到結果")
+        finally:
+            if session:
+                session.untrack(req_id)
+            self.flow.release(success)
 
-        # 最終失敗，清理等待表
+    def measure_or_estimate(self, x: float, y: float, radius: float, min_neighbors: int = 3,
+                            tolerance: Optional[float] = None, k: int = 8, power: float = 2.0,
+                            timeout: float = 5.0, retries: int = 2,
+                            session: Optional[Session] = None) -> Optional[Dict]:
+        """
+        radius 內已有至少 min_neighbors 個量測點（且各特徵鄰點的加權標準差不超過 tolerance）時，
+        以 IDW 估計取代量測，回傳的結果帶 "estimated": True；否則發送 cmd/point
+        """
+        estimate = self.spatial.interpolate(x, y, k=k, power=power, radius=radius)
+        if estimate and estimate["neighbors"] >= min_neighbors and (
+                tolerance is None or all(s <= tolerance for s in estimate["spread"].values())):
+            names = list(estimate["values"])
+            logger.info(f"[A] 點位 ({x},{y}) 以 {estimate['neighbors']} 個鄰點估計，略過量測")
+            return {
+                "type": "result_feature_set",
+                "point": {"x": x, "y": y},
+                "features": names,
+                "values": [estimate["values"][n] for n in names],
+                "estimated": True,
+                "spread": estimate["spread"],
+                "neighbors": estimate["neighbors"]
+            }
+        return self.send_point_and_wait(x, y, timeout, retries, session=session)
+
+    def send_point_journaled(self, journal: Journal, index: int, x: float, y: float,
+                             timeout: float = 5.0, retries: int = 2,
+                             session: Optional[Session] = None) -> Optional[Dict]:
+        """
+        經 journal 發送第 index 個點位
+        已成功的點位直接回傳紀錄的結果；曾派送過的點位沿用原本的 req_id
+        """
+        recorded = journal.result(index)
+        if recorded is not None:
+            logger.info(f"[A] 點位 #{index} 已完成（紀錄），略過")
+            return recorded
+        req_id = journal.req_id(index) or str(uuid.uuid4())
+        journal.dispatch(index, req_id, x, y)
+        try:
+            result = self.send_point_and_wait(x, y, timeout, retries, req_id=req_id, session=session)
+        except TimeoutError as e:
+            journal.complete(index, req_id, "timeout", error=str(e))
+            raise
+        journal.complete(index, req_id, "success" if result else "failed", result)
+        return result
+
+    def _collect_result(self, req_id: str, ev: threading.Event) -> Optional[Dict]:
+        """取出結果；分塊頻譜以重組後的 NumPy 陣列取代描述"""
+        with self._pending_lock:
+            _, result = self._pending.get(req_id, (None, None))
+        timing = result.get("timing") if result else None
+        if isinstance(timing, dict) and "t_arrive_ns" in timing:
+            source = (result.get("metadata") or {}).get("instance") or "B"
+            parts = self.timing.add(timing, timing["t_arrive_ns"], source)
+            if parts:
+                result["latency_ms"] = parts
+        spectrum = result.get("spectrum") if result else None
+        if isinstance(spectrum, dict) and spectrum.get("encoding") == "chunked":
+            result["spectrum"] = self._await_chunks(req_id, ev, spectrum)
         with self._pending_lock:
             self._pending.pop(req_id, None)
-        raise TimeoutError(f"req_id={req_id} 在 {retries+1} 次嘗試後仍未收到結果")
+            self._completed.add(req_id, dedup.DONE)
+        if result:
+            self._aggregate(result)
+        return result
 
-    def run_algorithm(self):
-        """示範演算法：順序下兩個點，逐點等待結果，再發 end"""
-        logger.info("[A] 開始執行演算法")
+    def _await_chunks(self, req_id: str, ev: threading.Event, desc: Dict) -> Optional[np.ndarray]:
+        """等待分塊到齊；逾時則要求 B 重送缺少的分塊"""
+        total = int(desc.get("chunks", 1))
+        for attempt in range(CHUNK_RESEND_ROUNDS + 1):
+            ev.clear()
+            array = self._chunks.take(req_id)
+            if array is not None:
+                return array
+            if ev.wait(CHUNK_TIMEOUT) or attempt == CHUNK_RESEND_ROUNDS:
+                continue
+            missing = self._chunks.missing(req_id, total)
+            logger.warning(f"[A] req_id={req_id} 缺少 {len(missing)}/{total} 個分塊，要求重送")
+            self.client.publish(TOP_CHUNK_RESEND, json.dumps({
+                "type": "chunk_resend",
+                "req_id": req_id,
+                "missing": missing,
+                "sender": "A"
+            }), qos=1)
+        array = self._chunks.take(req_id)
+        if array is None:
+            logger.error(f"[A] req_id={req_id} 的頻譜分塊在重送後仍不完整")
+            self._chunks.discard(req_id)
+        return array
+
+    def _publish_point(self, req_id: str, payload: Dict[str, Any], timeout: float):
+        """發送 cmd/point；v5 附帶回覆主題、關聯資料與逾期（QoS 1 不使用 topic alias）"""
+        # 每次（重）送都重新標記，B 回傳時原樣帶回
+        payload["t_send_ns"] = clock_sync.now_ns()
+        if not self.is_v5:
+            self.client.publish(TOP_CMD_POINT, self._codec.encode(payload), qos=1)
+            return
+        # 逾期設為單次等待時間：A 已放棄的指令由 broker 丟棄，不再被延遲執行
+        self._aliases.publish(
+            self.client, TOP_CMD_POINT, self._codec.encode(payload), 1,
+            lambda alias: mqtt_v5.request_properties(req_id, self.response_topic, timeout, alias))
+
+    def run_algorithm(self, session: Optional[Session] = None, reset_spatial: bool = SPATIAL_RESET):
+        """
+        示範演算法：順序下兩個點，逐點等待結果，再發 end；session 中止時提前結束
+        空間索引預設跨執行保留，reset_spatial=True 時一併清空
+        """
+        if session is None:
+            session, _ = self.sessions.start()
+        logger.info(f"[A] 開始執行演算法 (session_id={session.session_id})")
+        # 統計只涵蓋本次執行；跨執行的 aggregator（空間索引）保留
+        for agg in self.aggregators:
+            if agg.per_run or (reset_spatial and agg is self.spatial):
+                agg.reset()
         
         # 更新狀態為運行中
-        status_payload = json.dumps({
-            "online": True, 
-            "sender": "A", 
-            "ts": int(time.time()), 
-            "state": "running"
-        })
+        status_payload = self._status_payload("running")
         self.client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
         
         # 定義要測試的點位
         points = [(10, 5), (12.3, -7.5), (0, 0), (-5.2, 8.1)]
         successful_points = []
-        
-        for i, (x, y) in enumerate(points):
-            try:
-                logger.info(f"[A] 處理第 {i+1}/{len(points)} 個點位")
-                result = self.send_point_and_wait(x, y, timeout=8.0, retries=2)
+
+        journal = None
+        try:
+            # 崩潰安全紀錄：上次未完成時從中斷處續跑
+            journal = Journal(JOURNAL_PATH, points) if JOURNAL_PATH else None
+            if journal and journal.resumed:
+                logger.info(f"[A] 從紀錄 {JOURNAL_PATH} 續跑，已完成 {len(journal.state.completed)} 個點位")
+            for i, (x, y) in enumerate(points):
+                try:
+                    logger.info(f"[A] 處理第 {i+1}/{len(points)} 個點位")
+                    if journal:
+                        result = self.send_point_journaled(journal, i, x, y, timeout=8.0, retries=2,
+                                                           session=session)
+                    else:
+                        result = self.send_point_and_wait(x, y, timeout=8.0, retries=2, session=session)
                 
-                if result:
-                    successful_points.append((x, y, result))
-                    # 這裡可以加入資料分析邏輯
-                    features = result.get("features", [])
-                    values = result.get("values", [])
-                    logger.info(f"[A] 點位 ({x},{y}) 完成，獲得 {len(features)} 個特徵")
-                else:
-                    logger.error(f"[A] 點位 ({x},{y}) 未獲得結果")
+                    if result:
+                        successful_points.append((x, y, result))
+                        # 這裡可以加入資料分析邏輯
+                        features = result.get("features", [])
+                        values = result.get("values", [])
+                        logger.info(f"[A] 點位 ({x},{y}) 完成，獲得 {len(features)} 個特徵")
+                    else:
+                        logger.error(f"[A] 點位 ({x},{y}) 未獲得結果")
                     
-            except TimeoutError as e:
-                logger.error(f"[A] 點位 ({x},{y}) 處理失敗: {e}")
-                # 根據需求決定是否繼續或中止
-                continue
+                except TimeoutError as e:
+                    logger.error(f"[A] 點位 ({x},{y}) 處理失敗: {e}")
+                    # 根據需求決定是否繼續或中止
+                    continue
+                except SessionAborted as e:
+                    logger.warning(f"[A] {e}")
+                    break
             
-            # 點位間的間隔
-            time.sleep(1)
+                # 點位間的間隔（中止時立即結束）
+                if session.cancel_event.wait(1):
+                    break
+        except OSError as e:
+            # 紀錄無法開啟或寫入（磁碟已滿、I/O 錯誤）：以中止結束本次執行
+            logger.error(f"[A] 紀錄 {JOURNAL_PATH} 失敗，中止執行: {e}")
+            self.abort_session(session.session_id, f"journal: {e}")
+        except ValueError as e:
+            if journal is not None or not JOURNAL_PATH:
+                raise
+            # 紀錄屬於另一批點位
+            logger.error(f"[A] {e}，中止執行")
+            self.abort_session(session.session_id, f"journal: {e}")
+        finally:
+            # 任何例外都要關閉紀錄、結束 session 並送出 END，否則之後的 START 會被拒絕
+            self._finish_run(session, points, successful_points, journal)
+
+    def _finish_run(self, session: Session, points: List[Tuple[float, float]],
+                    successful_points: List, journal: Optional[Journal]):
+        """關閉紀錄、結束 session，發送 END 與最終狀態"""
+        if journal:
+            try:
+                # 中止的執行不寫結束標記，之後可從紀錄續跑
+                if not session.cancelled:
+                    journal.finish()
+                journal.close()
+            except OSError as e:
+                logger.error(f"[A] 紀錄 {JOURNAL_PATH} 寫入失敗: {e}")
+                self.sessions.abort(session.session_id, f"journal: {e}")
+        aborted = session.cancelled
+        self.sessions.finish(session)
 
         # 發送結束信號
+        summary = {
+            "total_points": len(points),
+            "successful_points": len(successful_points),
+            "failed_points": len(points) - len(successful_points)
+        }
+        if aborted:
+            summary["aborted"] = session.reason
+        summary["feature_stats"] = self.feature_stats.snapshot()
+        summary["heatmap"] = self.heatmap.snapshot()
         end_payload = json.dumps({
             "type": "end",
+            "session_id": session.session_id,
             "ts": int(time.time()),
             "sender": "A",
-            "summary": {
-                "total_points": len(points),
-                "successful_points": len(successful_points),
-                "failed_points": len(points) - len(successful_points)
-            }
+            "summary": summary
         })
         self.client.publish(TOP_CTRL_END, end_payload, qos=1)
         logger.info("[A] 已發送 END 信號")
         
-        # 更新狀態為完成
-        status_payload = json.dumps({
-            "online": True, 
-            "sender": "A", 
-            "ts": int(time.time()), 
-            "state": "completed"
-        })
-        self.client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
+        # 更新狀態為完成；被取代的 session 不覆寫新 session 的 running 狀態
+        if self.sessions.current is None:
+            status_payload = self._status_payload("aborted" if aborted else "completed")
+            self.client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
         
-        logger.info(f"[A] 演算法執行完成，成功處理 {len(successful_points)} 個點位")
+        logger.info(f"[A] 演算法{'已中止' if aborted else '執行完成'}，成功處理 {len(successful_points)} 個點位，"
+                    f"結果去重統計: {self.result_metrics()}, 延遲分解: {self.latency_summary()}")
 
     def connect(self):
         """連接到 MQTT Broker"""
         try:
-            logger.info(f"正在連接到 MQTT Broker {BROKER_HOST}:{PORT}")
-            self.client.connect(BROKER_HOST, PORT, keepalive=KEEPALIVE)
+            port = tls.port(PORT)
+            logger.info(f"正在連接到 MQTT Broker {BROKER_HOST}:{port}{'（TLS）' if tls.enabled() else ''}")
+            if self.is_v5:
+                self.client.connect(BROKER_HOST, port, keepalive=KEEPALIVE, clean_start=False,
+                                    properties=mqtt_v5.connect_properties(SESSION_EXPIRY))
+            else:
+                self.client.connect(BROKER_HOST, port, keepalive=KEEPALIVE)
+            if self.control is not None:
+                self.control.connect(BROKER_HOST, port, KEEPALIVE)
             return True
         except Exception as e:
             logger.error(f"連接 MQTT Broker 失敗: {e}")
@@ -254,18 +702,15 @@ class MQTTClient:
         """斷開連接"""
         if self.client and self.is_connected:
             # 發送離線狀態
-            status_payload = json.dumps({
-                "online": False, 
-                "sender": "A", 
-                "ts": int(time.time()),
-                "state": "disconnected"
-            })
+            status_payload = self._status_payload("disconnected", online=False)
             self.client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
             self.client.disconnect()
+        if self.control is not None:
+            self.control.close()
 
-def main():
+def main(protocol: str = PROTOCOL):
     """主函數"""
-    mqtt_client = MQTTClient()
+    mqtt_client = MQTTClient(protocol)
     
     try:
         # 設置客戶端
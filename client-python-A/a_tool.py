@@ -9,14 +9,215 @@ import json
 import time
 import sys
 import logging
-from a_client import MQTTClient, logger
+import math
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from a_client import MQTTClient, logger, PROTOCOL, CLIENT_ID
+from clock_sync import LatencyBreakdown
+import dedup
+from journal import Journal
+import profiling
+import tls
 
-def run_interactive_mode():
-    """互動模式 - 手動輸入點位"""
+INTERACTIVE_HELP = """指令:
+  x,y                 發送一個點位（可一次貼上多個，以空白或 ; 分隔: 0,0 10,0; 20,0）
+  paste               逐行貼上點位清單，空行結束
+  load FILE           將點位文件排入佇列
+  status (s)          顯示進行中與排隊的點位
+  clear               取消尚未發送的點位
+  help (?)            顯示本說明
+  quit (q)            等待排隊與進行中的點位完成後退出（先 clear 可只等進行中的）"""
+
+def parse_point_list(text: str, bounds: Optional[Tuple[float, float, float, float]] = None
+                     ) -> List[Tuple[float, float]]:
+    """
+    解析一行內的一個或多個 x,y（以空白或 ; 分隔）
+    格式錯誤、座標不是有限值，或指定 bounds (x_min, x_max, y_min, y_max) 時超出範圍，拋出 ValueError
+    """
+    points = []
+    for token in text.replace(';', ' ').split():
+        parts = token.split(',')
+        if len(parts) != 2:
+            raise ValueError(f"格式錯誤: {token}")
+        try:
+            x, y = float(parts[0]), float(parts[1])
+        except ValueError:
+            raise ValueError(f"格式錯誤: {token}") from None
+        if not (math.isfinite(x) and math.isfinite(y)):
+            raise ValueError(f"座標不是有限值: {token}")
+        if bounds and not (bounds[0] <= x <= bounds[1] and bounds[2] <= y <= bounds[3]):
+            raise ValueError(f"點位 ({x}, {y}) 超出掃描範圍 {list(bounds)}")
+        points.append((x, y))
+    return points
+
+class InteractiveDispatcher:
+    """
+    互動模式的派送器：輸入線程只負責排入點位，最多 inflight 個點位同時等待結果，
+    結果由 worker 線程完成時即輸出（附延遲）
+    """
+
+    def __init__(self, client: MQTTClient, inflight: int = 4, timeout: float = 10.0, retries: int = 1):
+        self.client = client
+        self.timeout = timeout
+        self.retries = retries
+        self._pool = ThreadPoolExecutor(max_workers=max(1, inflight), thread_name_prefix="interactive")
+        self._lock = threading.Lock()
+        self._print_lock = threading.Lock()
+        self._next = 0
+        self._queued: Dict[int, Tuple[Tuple[float, float], float, Future]] = {}
+        self._running: Dict[int, Tuple[Tuple[float, float], float]] = {}
+        self.succeeded = 0
+        self.failed = 0
+        self.latencies: List[float] = []
+
+    def echo(self, message: str):
+        """背景線程輸出時保留輸入提示"""
+        with self._print_lock:
+            print(f"\r{message}")
+            if sys.stdin.isatty():
+                print("> ", end="", flush=True)
+
+    def submit(self, points: List[Tuple[float, float]]):
+        with self._lock:
+            for point in points:
+                self._next += 1
+                index = self._next
+                future = self._pool.submit(self._run, index, point)
+                self._queued[index] = (point, time.monotonic(), future)
+        print(f"已排入 {len(points)} 個點位（進行中 {len(self._running)}，排隊 {len(self._queued)}）")
+
+    def _run(self, index: int, point: Tuple[float, float]):
+        x, y = point
+        with self._lock:
+            _, queued_at, _ = self._queued.pop(index, (point, time.monotonic(), None))
+            started = time.monotonic()
+            self._running[index] = (point, started)
+        waited = started - queued_at
+        try:
+            result = self.client.send_point_and_wait(x, y, timeout=self.timeout, retries=self.retries)
+            error = None if result else "未收到結果"
+        except Exception as e:
+            result, error = None, str(e)
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._running.pop(index, None)
+            if result:
+                self.succeeded += 1
+                self.latencies.append(elapsed_ms)
+            else:
+                self.failed += 1
+        queue_note = f"，排隊 {waited:.1f}s" if waited >= 0.05 else ""
+        if not result:
+            self.echo(f"✗ #{index} ({x}, {y}) {error}（{elapsed_ms:.0f}ms{queue_note}）")
+            return
+        values = result.get('values') or [0]
+        parts = result.get('latency_ms')
+        detail = (f"（去程 {parts['network_out']:.1f} / 排隊 {parts['queue']:.1f} / 處理 {parts['processing']:.1f}"
+                  f" / 回程 {parts['network_back']:.1f}）") if parts else ""
+        self.echo(f"✓ #{index} ({x}, {y}) {elapsed_ms:.1f}ms{detail}{queue_note}  "
+                  f"特徵 {len(result.get('features', []))}，數值 {min(values):.3f} ~ {max(values):.3f}")
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            running = sorted(self._running.items())
+            queued = sorted(self._queued.items())
+            latencies = sorted(self.latencies)
+        print(f"進行中 {len(running)}，排隊 {len(queued)}，成功 {self.succeeded}，失敗 {self.failed}")
+        for index, ((x, y), started) in running:
+            print(f"  #{index} ({x}, {y}) 已等待 {now - started:.1f}s")
+        for index, ((x, y), queued_at, _) in queued[:10]:
+            print(f"  #{index} ({x}, {y}) 排隊中 {now - queued_at:.1f}s")
+        if len(queued) > 10:
+            print(f"  ...另有 {len(queued) - 10} 個排隊中")
+        if latencies:
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"  延遲 p50 {latencies[len(latencies) // 2]:.1f}ms, p99 {p99:.1f}ms")
+        flow = self.client.flow.snapshot()
+        if flow["mode"] != "off":
+            # 超過 B 的處理容量時，進行中的點位在 A 端等待發送名額
+            print(f"  流量控制 {flow['mode']}: 已發送 {flow['in_flight']}/{flow['limit']}")
+
+    def clear(self) -> int:
+        """取消尚未開始的點位"""
+        with self._lock:
+            cancelled = [i for i, (_, _, f) in self._queued.items() if f.cancel()]
+            for i in cancelled:
+                self._queued.pop(i, None)
+        return len(cancelled)
+
+    def close(self, wait: bool = True):
+        """wait 時完成所有已排入的點位；否則取消排隊中的點位，不等待進行中的"""
+        if not wait:
+            cancelled = self.clear()
+            if cancelled:
+                print(f"已取消 {cancelled} 個排隊中的點位")
+        else:
+            with self._lock:
+                remaining = len(self._running) + len(self._queued)
+            if remaining:
+                print(f"等待 {remaining} 個點位完成...（Ctrl+C 直接退出）")
+        self._pool.shutdown(wait=wait)
+
+def handle_command(dispatcher: InteractiveDispatcher, user_input: str,
+                   read_line: Callable[[], str] = input) -> bool:
+    """
+    處理一行互動輸入；回傳 False 表示退出
+    B 已宣告掃描範圍時，超出範圍的點位不排入
+    """
+    user_input = user_input.strip()
+    command, _, arg = user_input.partition(' ')
+    command = command.lower()
+    bounds = dispatcher.client.heatmap.bounds
+
+    if not user_input:
+        return True
+    if command in ['quit', 'q', 'exit']:
+        return False
+    if command in ['help', '?']:
+        print(INTERACTIVE_HELP)
+    elif command in ['status', 's']:
+        dispatcher.status()
+    elif command == 'clear':
+        print(f"已取消 {dispatcher.clear()} 個排隊中的點位")
+    elif command == 'load':
+        points = load_points(arg.strip()) if arg.strip() else None
+        if points:
+            dispatcher.submit(points)
+    elif command == 'paste':
+        print("貼上點位（每行一個或多個 x,y），空行結束:")
+        points = []
+        while True:
+            try:
+                line = read_line().strip()
+            except EOFError:
+                break
+            if not line:
+                break
+            if line.startswith('#'):
+                continue
+            try:
+                points.extend(parse_point_list(line, bounds))
+            except ValueError as e:
+                print(f"警告: {e}，跳過: {line}")
+        if points:
+            dispatcher.submit(points)
+    else:
+        try:
+            dispatcher.submit(parse_point_list(user_input, bounds))
+        except ValueError as e:
+            print(f"錯誤: {e}；請輸入正確格式 (例: 10.5,-7.2) 或 help 查看指令")
+    return True
+
+def run_interactive_mode(protocol: str = PROTOCOL, inflight: int = 4):
+    """互動模式 - 手動輸入點位；輸入、派送與結果輸出互不阻塞"""
     print("=== 互動模式 ===")
-    print("輸入點位座標，按 Ctrl+C 退出")
+    print(f"輸入點位座標，最多 {inflight} 個點位同時進行；輸入 help 顯示指令，按 Ctrl+C 退出")
     
-    client = MQTTClient()
+    client = MQTTClient(protocol)
     client.setup_client()
     
     if not client.connect():
@@ -24,56 +225,45 @@ def run_interactive_mode():
         return
         
     # 在背景啟動 MQTT 循環
-    import threading
     mqtt_thread = threading.Thread(target=client.start_loop, daemon=True)
     mqtt_thread.start()
     
     # 等待連接建立
     time.sleep(2)
     
+    dispatcher = InteractiveDispatcher(client, inflight)
+    wait = True
     try:
         while True:
-            print("\n請輸入點位座標 (格式: x,y) 或 'quit' 退出:")
-            user_input = input("> ").strip()
-            
-            if user_input.lower() in ['quit', 'q', 'exit']:
-                break
-                
             try:
-                x, y = map(float, user_input.split(','))
-                print(f"發送點位: ({x}, {y})")
-                
-                result = client.send_point_and_wait(x, y, timeout=10.0, retries=1)
-                if result:
-                    print(f"✓ 成功收到結果:")
-                    print(f"  特徵數量: {len(result.get('features', []))}")
-                    print(f"  數值範圍: {min(result.get('values', [0])):.3f} ~ {max(result.get('values', [0])):.3f}")
-                else:
-                    print("✗ 未收到結果")
-                    
-            except ValueError:
-                print("錯誤: 請輸入正確格式 (例: 10.5,-7.2)")
-            except Exception as e:
-                print(f"錯誤: {e}")
+                user_input = input("> ")
+            except EOFError:
+                break
+            if not handle_command(dispatcher, user_input):
+                break
                 
     except KeyboardInterrupt:
         print("\n正在退出...")
+        wait = False
     finally:
+        try:
+            dispatcher.close(wait)
+        except KeyboardInterrupt:
+            dispatcher.close(False)
+        print(f"成功: {dispatcher.succeeded}，失敗: {dispatcher.failed}")
         client.disconnect()
 
-def run_batch_mode(points_file: str):
-    """批次模式 - 從文件讀取點位"""
-    print(f"=== 批次模式 - 讀取文件: {points_file} ===")
-    
+def load_points(points_file: str) -> Optional[List[Tuple[float, float]]]:
+    """讀取點位文件 (格式: x,y 每行一個，# 開頭為註解)"""
     try:
         with open(points_file, 'r') as f:
             lines = f.readlines()
     except FileNotFoundError:
         print(f"錯誤: 找不到文件 {points_file}")
-        return
+        return None
     except Exception as e:
         print(f"錯誤: 無法讀取文件 {e}")
-        return
+        return None
     
     # 解析點位
     points = []
@@ -89,12 +279,81 @@ def run_batch_mode(points_file: str):
     
     if not points:
         print("錯誤: 沒有找到有效的點位")
-        return
+        return None
         
     print(f"找到 {len(points)} 個點位")
+    return points
+
+def _json_default(obj):
+    """NumPy 陣列（重組後的頻譜）轉為 JSON 列表"""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"無法序列化的型別: {type(obj).__name__}")
+
+def save_batch_results(results: List[Dict], successful: int, extra_summary: Optional[Dict] = None):
+    """保存批次結果到文件"""
+    output_file = f"batch_results_{int(time.time())}.json"
+    summary = {
+        'total': len(results),
+        'successful': successful,
+        'failed': len(results) - successful
+    }
+    summary.update(extra_summary or {})
+    try:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump({
+                'timestamp': time.time(),
+                'summary': summary,
+                'results': results
+            }, f, indent=2, ensure_ascii=False, default=_json_default)
+        print(f"結果已保存到: {output_file}")
+    except Exception as e:
+        print(f"警告: 無法保存結果文件: {e}")
+
+def open_journal(path: Optional[str], points: List[Tuple[float, float]]) -> Optional[Journal]:
+    """開啟批次紀錄；上次未完成時顯示續跑進度"""
+    if not path:
+        return None
+    journal = Journal(path, points)
+    if journal.resumed:
+        print(f"從紀錄 {path} 續跑：已完成 {len(journal.state.completed)}/{len(points)} 個點位")
+    return journal
+
+def print_client_summary(metrics: Dict[str, int], latency: Dict, handshakes: Optional[Dict[str, int]]):
+    """批次結束時的結果去重、延遲分解與 TLS 統計（單程序與多程序共用）"""
+    print(f"重複結果: {metrics['duplicate']}, 晚到結果: {metrics['late']}")
+    for name, s in latency['components_ms'].items():
+        if s['count']:
+            print(f"  {name:<13} 平均 {s['mean']:.1f}ms, p50 {s['p50']:.1f}ms, p99 {s['p99']:.1f}ms")
+    for source, clock in latency['clocks'].items():
+        print(f"  時鐘 {source}: 偏移 {clock['offset_ms']}ms, 最小往返 {clock['min_delay_ms']}ms, "
+              f"漂移 {clock['drift_ppm']}ppm")
+    if handshakes:
+        print(f"TLS 握手: {handshakes['handshakes']} 次，session 續用 {handshakes['resumed']} 次")
+
+def close_journal(journal: Journal):
+    """關閉紀錄；寫入失敗時只警告，未落盤的點位下次續跑時重新派送"""
+    try:
+        journal.close()
+    except OSError as e:
+        print(f"警告: {e}")
+
+def run_batch_mode(points_file: str, protocol: str = PROTOCOL, interval: float = 1.0,
+                   journal_path: Optional[str] = None):
+    """批次模式 - 從文件讀取點位"""
+    print(f"=== 批次模式 - 讀取文件: {points_file} ===")
+    
+    points = load_points(points_file)
+    if not points:
+        return
+    try:
+        journal = open_journal(journal_path, points)
+    except ValueError as e:
+        print(f"錯誤: {e}")
+        return
     
     # 執行批次處理
-    client = MQTTClient()
+    client = MQTTClient(protocol)
     client.setup_client()
     
     if not client.connect():
@@ -102,7 +361,6 @@ def run_batch_mode(points_file: str):
         return
         
     # 在背景啟動 MQTT 循環
-    import threading
     mqtt_thread = threading.Thread(target=client.start_loop, daemon=True)
     mqtt_thread.start()
     
@@ -111,13 +369,18 @@ def run_batch_mode(points_file: str):
     
     results = []
     successful = 0
+    finished = False
     
     try:
         for i, (x, y) in enumerate(points, 1):
             print(f"[{i}/{len(points)}] 處理點位 ({x}, {y})...")
+            recorded = journal is not None and journal.result(i - 1) is not None
             
             try:
-                result = client.send_point_and_wait(x, y, timeout=10.0, retries=2)
+                if journal:
+                    result = client.send_point_journaled(journal, i - 1, x, y, timeout=10.0, retries=2)
+                else:
+                    result = client.send_point_and_wait(x, y, timeout=10.0, retries=2)
                 if result:
                     results.append({
                         'point': {'x': x, 'y': y},
@@ -125,7 +388,14 @@ def run_batch_mode(points_file: str):
                         'status': 'success'
                     })
                     successful += 1
-                    print(f"  ✓ 成功")
+                    parts = result.get('latency_ms')
+                    if recorded:
+                        print(f"  ✓ 成功（紀錄）")
+                    elif parts:
+                        print(f"  ✓ 成功 {parts['total']:.1f}ms (去程 {parts['network_out']:.1f} / 排隊 {parts['queue']:.1f}"
+                              f" / 處理 {parts['processing']:.1f} / 回程 {parts['network_back']:.1f})")
+                    else:
+                        print(f"  ✓ 成功")
                 else:
                     results.append({
                         'point': {'x': x, 'y': y},
@@ -142,36 +412,246 @@ def run_batch_mode(points_file: str):
                 print(f"  ✗ 錯誤: {e}")
             
             # 點位間間隔
-            if i < len(points):
-                time.sleep(1)
+            if i < len(points) and interval > 0 and not recorded:
+                time.sleep(interval)
+        finished = True
                 
     except KeyboardInterrupt:
         print("\n收到中斷信號，正在停止...")
     finally:
         client.disconnect()
+        metrics = client.result_metrics()
+        latency = client.latency_summary()
+        if journal:
+            # 中斷時不寫結束標記，下次以同一紀錄檔續跑
+            try:
+                if finished:
+                    journal.finish()
+            except OSError as e:
+                print(f"警告: {e}")
+            finally:
+                close_journal(journal)
         
         # 輸出總結
         print(f"\n=== 批次處理完成 ===")
         print(f"總點位數: {len(points)}")
         print(f"成功: {successful}")
         print(f"失敗: {len(points) - successful}")
+        handshakes = tls.stats()
+        print_client_summary(metrics, latency, handshakes)
         
         # 保存結果到文件
-        output_file = f"batch_results_{int(time.time())}.json"
-        try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'timestamp': time.time(),
-                    'summary': {
-                        'total': len(points),
-                        'successful': successful,
-                        'failed': len(points) - successful
-                    },
-                    'results': results
-                }, f, indent=2, ensure_ascii=False)
-            print(f"結果已保存到: {output_file}")
-        except Exception as e:
-            print(f"警告: 無法保存結果文件: {e}")
+        extra = {'result_metrics': metrics, 'latency': latency}
+        if handshakes:
+            extra['tls'] = handshakes
+        if journal:
+            extra['journal'] = journal.stats()
+        save_batch_results(results, successful, extra)
+
+def partition_points(points: List[Tuple[float, float]], workers: int,
+                     strategy: str = "roundrobin") -> List[List[Tuple[int, float, float]]]:
+    """
+    將點位分配給各 worker，保留原始索引以便合併
+    roundrobin: 依序輪流分配；spatial: 依 (x, y) 排序後切成連續區塊，減少每台設備的移動距離
+    """
+    indexed = [(i, x, y) for i, (x, y) in enumerate(points)]
+    if strategy == "spatial":
+        indexed.sort(key=lambda p: (p[1], p[2]))
+        size, extra = divmod(len(indexed), workers)
+        parts, start = [], 0
+        for w in range(workers):
+            end = start + size + (1 if w < extra else 0)
+            parts.append(indexed[start:end])
+            start = end
+        return parts
+    return [indexed[w::workers] for w in range(workers)]
+
+def _batch_worker(worker_id: int, items: List[Tuple[int, float, float]], protocol: str,
+                  interval: float, out_queue, verbose: bool = False,
+                  journal_path: Optional[str] = None, workers: int = 1):
+    """
+    worker 程序：獨立的 client ID 與連線，逐點回傳 (索引, 結果記錄)，
+    結束時回傳 (None, 統計)；B 宣告的 credit 由 workers 個程序平分
+    """
+    if not verbose:
+        # 各 worker 的日誌會交錯輸出，只保留錯誤
+        logger.setLevel(logging.ERROR)
+    client = MQTTClient(protocol, client_id=f"{CLIENT_ID}-w{worker_id}", flow_share=1.0 / workers,
+                        shared_results=workers > 1)
+    client.setup_client()
+    if not client.connect():
+        for index, x, y in items:
+            out_queue.put((index, {'point': {'x': x, 'y': y}, 'status': 'error',
+                                   'error': '無法連接到 MQTT Broker', 'worker': worker_id}))
+        out_queue.put((None, {'worker': worker_id}))
+        return
+    client.client.loop_start()
+    
+    # 等待連接建立
+    deadline = time.time() + 5
+    while not client.is_connected and time.time() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5)
+
+    # 各 worker 使用自己的紀錄檔；分配方式固定，續跑時拿到相同的點位
+    journal = Journal(f"{journal_path}.w{worker_id}", [(x, y) for _, x, y in items]) \
+        if journal_path else None
+    finished = False
+    try:
+        for n, (index, x, y) in enumerate(items, 1):
+            record = {'point': {'x': x, 'y': y}, 'worker': worker_id}
+            recorded = journal is not None and journal.result(n - 1) is not None
+            try:
+                if journal:
+                    result = client.send_point_journaled(journal, n - 1, x, y, timeout=10.0, retries=2)
+                else:
+                    result = client.send_point_and_wait(x, y, timeout=10.0, retries=2)
+                if result:
+                    record.update(result=result, status='success')
+                else:
+                    record['status'] = 'timeout'
+            except Exception as e:
+                record.update(status='error', error=str(e))
+            out_queue.put((index, record))
+            if n < len(items) and interval > 0 and not recorded:
+                time.sleep(interval)
+        finished = True
+    finally:
+        if journal:
+            try:
+                if finished:
+                    journal.finish()
+            except OSError as e:
+                logger.error(str(e))
+            finally:
+                close_journal(journal)
+        client.disconnect()
+        client.client.loop_stop()
+        profiling.stop()
+        out_queue.put((None, {
+            'worker': worker_id,
+            'result_metrics': client.result_metrics(),
+            'timing': client.timing,
+            'tls': tls.stats(),
+            'journal': journal.stats() if journal else None
+        }))
+
+def merge_worker_stats(worker_stats: List[Dict]):
+    """合併各 worker 的結果去重計數、延遲直方圖、TLS 與紀錄統計，格式與單程序批次相同"""
+    metrics = dedup.ResultCounters().snapshot()
+    latency = LatencyBreakdown()
+    handshakes: Dict[str, int] = {}
+    journals: Dict[str, float] = {}
+    for stats in sorted(worker_stats, key=lambda s: s['worker']):
+        for name, count in (stats.get('result_metrics') or {}).items():
+            metrics[name] = metrics.get(name, 0) + count
+        if stats.get('timing') is not None:
+            # 各 worker 各自估計時鐘偏移，以 worker 編號區分
+            latency.merge(stats['timing'], f" (w{stats['worker']})")
+        for name, count in (stats.get('tls') or {}).items():
+            handshakes[name] = handshakes.get(name, 0) + count
+        for name in ('records', 'commits', 'fsync_ms'):
+            if stats.get('journal'):
+                journals[name] = journals.get(name, 0) + stats['journal'][name]
+    if journals:
+        journals['records_per_commit'] = round(journals['records'] / journals['commits'], 2) \
+            if journals['commits'] else 0.0
+    return metrics, latency.snapshot(), handshakes or None, journals or None
+
+def run_batch_workers(points_file: str, workers: int, protocol: str = PROTOCOL,
+                      interval: float = 1.0, strategy: str = "roundrobin", verbose: bool = False,
+                      journal_path: Optional[str] = None):
+    """多程序批次模式 - 分割點位給 N 個程序，依原始順序合併結果"""
+    print(f"=== 批次模式 ({workers} workers, {strategy}) - 讀取文件: {points_file} ===")
+    
+    points = load_points(points_file)
+    if not points:
+        return
+    workers = max(1, min(workers, len(points)))
+    if protocol != "5":
+        print("提示: v3.1.1 下所有 worker 共用結果主題，建議使用 --protocol 5 以各自的回覆主題接收結果")
+
+    ctx = multiprocessing.get_context("spawn")
+    out_queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_batch_worker,
+                    args=(w, part, protocol, interval, out_queue, verbose, journal_path, workers),
+                    daemon=True)
+        for w, part in enumerate(partition_points(points, workers, strategy))
+    ]
+    start = time.time()
+    for p in procs:
+        p.start()
+
+    # 重排緩衝：結果可能亂序到達，依原始索引連續輸出
+    results: List[Optional[Dict]] = [None] * len(points)
+    pending: Dict[int, Dict] = {}
+    next_index = 0
+    done_workers = 0
+    received = 0
+    successful = 0
+    per_worker: Dict[int, int] = {w: 0 for w in range(workers)}
+    worker_stats: List[Dict] = []
+
+    try:
+        while done_workers < workers:
+            try:
+                index, record = out_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    break
+                continue
+            if index is None:
+                done_workers += 1
+                worker_stats.append(record)
+                continue
+            received += 1
+            per_worker[record['worker']] += 1
+            if record['status'] == 'success':
+                successful += 1
+            pending[index] = record
+            while next_index in pending:
+                rec = pending.pop(next_index)
+                results[next_index] = rec
+                mark = "✓" if rec['status'] == 'success' else "✗"
+                print(f"[{received}/{len(points)}] #{next_index + 1} ({rec['point']['x']}, "
+                      f"{rec['point']['y']}) {mark} {rec['status']} (worker {rec['worker']})")
+                next_index += 1
+    except KeyboardInterrupt:
+        print("\n收到中斷信號，正在停止...")
+    finally:
+        for p in procs:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+
+    elapsed = time.time() - start
+    for i, (x, y) in enumerate(points):
+        if results[i] is None:
+            results[i] = {'point': {'x': x, 'y': y}, 'status': 'error', 'error': '未完成'}
+
+    print(f"\n=== 批次處理完成 ===")
+    print(f"總點位數: {len(points)}")
+    print(f"成功: {successful}")
+    print(f"失敗: {len(points) - successful}")
+    print(f"耗時: {elapsed:.1f} 秒, 吞吐量: {received / elapsed:.2f} 點/秒" if elapsed > 0 else "")
+    print(f"各 worker 處理數: {per_worker}")
+    metrics, latency, handshakes, journals = merge_worker_stats(worker_stats)
+    print_client_summary(metrics, latency, handshakes)
+
+    extra = {
+        'workers': workers,
+        'partition': strategy,
+        'elapsed': elapsed,
+        'per_worker': per_worker,
+        'result_metrics': metrics,
+        'latency': latency
+    }
+    if handshakes:
+        extra['tls'] = handshakes
+    if journals:
+        extra['journal'] = journals
+    save_batch_results(results, successful, extra)
 
 def generate_sample_points(output_file: str):
     """生成範例點位文件"""
@@ -211,8 +691,14 @@ def main():
 範例用法:
   %(prog)s                          # 啟動正常模式 (等待 B 端觸發)
   %(prog)s --interactive            # 互動模式 (手動輸入點位)
+  %(prog)s --interactive --inflight 8   # 互動模式最多 8 個點位同時進行
   %(prog)s --batch points.txt       # 批次模式 (從文件讀取)
   %(prog)s --generate sample.txt    # 生成範例點位文件
+  %(prog)s --batch points.txt --protocol 5   # 使用 MQTT v5 request/response
+  %(prog)s --batch points.txt --workers 4 --protocol 5   # 4 個程序並行批次
+  %(prog)s --batch points.txt --journal run.jsonl        # 崩潰後以同一指令續跑
+  %(prog)s --batch points.txt --profile prof.folded      # 剖析回調耗時與 loop-lag
+  %(prog)s --batch points.txt --tls --cafile ../broker/certs/ca.crt  # TLS 連線 (端口 4884)
         """
     )
     
@@ -222,25 +708,70 @@ def main():
         help='啟動互動模式，手動輸入點位'
     )
     
+    parser.add_argument(
+        '--inflight',
+        type=int,
+        default=4,
+        help='互動模式同時進行的點位數，其餘排隊 (默認: 4)'
+    )
+    
     parser.add_argument(
         '--batch', '-b',
         metavar='FILE',
         help='批次模式，從指定文件讀取點位 (格式: x,y 每行一個)'
     )
     
+    parser.add_argument(
+        '--workers', '-w',
+        type=int,
+        default=1,
+        help='批次模式的並行程序數，每個程序使用獨立的 client ID 與連線 (默認: 1)'
+    )
+    
+    parser.add_argument(
+        '--partition',
+        choices=['roundrobin', 'spatial'],
+        default='roundrobin',
+        help='多程序時的點位分配方式 (默認: roundrobin)'
+    )
+    
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=1.0,
+        help='批次模式點位間隔秒數 (默認: 1.0)'
+    )
+    
+    parser.add_argument(
+        '--journal', '-j',
+        metavar='FILE',
+        help='批次模式的崩潰安全紀錄檔；中斷後以相同指令重新執行即從中斷處續跑'
+    )
+    
     parser.add_argument(
         '--generate', '-g',
         metavar='FILE',  
         help='生成範例點位文件'
     )
     
+    parser.add_argument(
+        '--protocol',
+        choices=['311', '5'],
+        default=PROTOCOL,
+        help=f'MQTT 協議版本 (默認: {PROTOCOL})'
+    )
+    
     parser.add_argument(
         '--verbose', '-v',
         action='store_true',
         help='顯示詳細日誌'
     )
     
+    profiling.add_arguments(parser)
+    tls.add_arguments(parser)
     args = parser.parse_args()
+    profiling.configure_from_args(args)
+    tls.configure_from_args(args)
     
     # 設置日誌級別
     if args.verbose:
@@ -250,14 +781,17 @@ def main():
     if args.generate:
         generate_sample_points(args.generate)
     elif args.interactive:
-        run_interactive_mode()
+        run_interactive_mode(args.protocol, args.inflight)
+    elif args.batch and args.workers > 1:
+        run_batch_workers(args.batch, args.workers, args.protocol, args.interval,
+                          args.partition, args.verbose, args.journal)
     elif args.batch:
-        run_batch_mode(args.batch)
+        run_batch_mode(args.batch, args.protocol, args.interval, args.journal)
     else:
         # 正常模式
         print("=== 正常模式 - 等待 B 端觸發 START 信號 ===")
         from a_client import main as normal_main
-        normal_main()
+        normal_main(args.protocol)
 
 if __name__ == "__main__":
     main()
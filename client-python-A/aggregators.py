@@ -0,0 +1,240 @@
+"""
+結果的線上統計
+MQTTClient 每收到一個結果就呼叫各 aggregator 的 update()，每次更新 O(1)、記憶體固定，
+執行中隨時可取 snapshot()，END 的 summary 不需要再掃描一次全部結果
+- FeatureStats：各特徵的 Welford 平均/變異數與最小/最大值
+- GridHeatmap：掃描範圍的格點熱圖（各格各特徵的平均值與量測數），範圍取自 config/setting
+"""
+
+import abc
+import math
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def parse_bounds(value) -> Optional[Tuple[float, float, float, float]]:
+    """
+    解析掃描範圍 (x_min, x_max, y_min, y_max)
+    接受 config/setting 的 {"scan_area": {...}}、頂層的 x_min/x_max/y_min/y_max，或 "x_min,x_max,y_min,y_max"
+    """
+    if not value:
+        return None
+    if isinstance(value, str):
+        parts = [float(v) for v in value.split(",")]
+        if len(parts) != 4:
+            raise ValueError(f"掃描範圍格式應為 x_min,x_max,y_min,y_max: {value}")
+        bounds = tuple(parts)
+    elif isinstance(value, dict):
+        area = value.get("scan_area", value)
+        if not isinstance(area, dict) or not all(k in area for k in ("x_min", "x_max", "y_min", "y_max")):
+            return None
+        bounds = tuple(float(area[k]) for k in ("x_min", "x_max", "y_min", "y_max"))
+    else:
+        bounds = tuple(float(v) for v in value)
+    x_min, x_max, y_min, y_max = bounds
+    if not (x_max > x_min and y_max > y_min):
+        raise ValueError(f"掃描範圍無效: {bounds}")
+    return bounds
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and math.isfinite(value)
+
+
+class Aggregator(abc.ABC):
+    """
+    aggregator 介面
+    update() 於收到結果的線程呼叫，應儘快返回；configure() 於收到 config/setting 時呼叫
+    per_run 為 True 時每次執行演算法前 reset()，False 表示跨執行累積
+    """
+
+    name = "aggregator"
+    per_run = True
+
+    @abc.abstractmethod
+    def update(self, x: float, y: float, features: Sequence[str], values: Sequence[float]):
+        """加入一個結果；features 與 values 依序對應"""
+
+    def configure(self, settings: Dict[str, Any]):
+        pass
+
+    def reset(self):
+        pass
+
+    @abc.abstractmethod
+    def snapshot(self) -> Dict[str, Any]:
+        """目前的統計狀態（可 JSON 序列化）"""
+
+
+class _Welford:
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+
+class FeatureStats(Aggregator):
+    """各特徵的平均、變異數（樣本）、標準差與最小/最大值"""
+
+    name = "feature_stats"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _Welford] = {}
+        self.results = 0
+
+    def update(self, x, y, features, values):
+        with self._lock:
+            self.results += 1
+            for name, value in zip(features, values):
+                if not _is_number(value):
+                    continue
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = _Welford()
+                stats.add(float(value))
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self.results = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            out = {}
+            for name, s in self._stats.items():
+                variance = s.m2 / (s.count - 1) if s.count > 1 else 0.0
+                out[name] = {
+                    "count": s.count,
+                    "mean": round(s.mean, 6),
+                    "variance": round(variance, 6),
+                    "std": round(math.sqrt(variance), 6),
+                    "min": s.min,
+                    "max": s.max
+                }
+            return out
+
+
+class GridHeatmap(Aggregator):
+    """
+    bins_x × bins_y 格點上各特徵的累計平均與量測數；
+    平均以各特徵各格自己的樣本數計算，部分結果缺少的特徵不會被拉向 0
+    範圍未知（B 尚未宣告 scan_area）時只計數，不配置格點；範圍外的點計入 outside
+    """
+
+    name = "heatmap"
+
+    def __init__(self, bins_x: int = 32, bins_y: int = 32,
+                 bounds: Optional[Tuple[float, float, float, float]] = None):
+        self.bins_x = bins_x
+        self.bins_y = bins_y
+        self._lock = threading.Lock()
+        self.bounds: Optional[Tuple[float, float, float, float]] = None
+        self._counts: Optional[np.ndarray] = None
+        self._means: Dict[str, np.ndarray] = {}
+        self._feature_counts: Dict[str, np.ndarray] = {}
+        self.outside = 0
+        self.unbinned = 0
+        if bounds:
+            self.set_bounds(bounds)
+
+    def set_bounds(self, bounds: Tuple[float, float, float, float]):
+        """設定範圍；範圍改變時清除已累計的格點"""
+        bounds = parse_bounds(bounds)
+        with self._lock:
+            if bounds == self.bounds:
+                return
+            self.bounds = bounds
+            self._counts = np.zeros((self.bins_y, self.bins_x), dtype=np.int64)
+            self._means = {}
+            self._feature_counts = {}
+            self.outside = 0
+
+    def configure(self, settings):
+        bounds = parse_bounds(settings)
+        if bounds:
+            self.set_bounds(bounds)
+
+    def cell(self, x: float, y: float) -> Optional[Tuple[int, int]]:
+        """(列, 行) 索引；範圍外為 None。上界落在最後一格"""
+        if self.bounds is None:
+            return None
+        x_min, x_max, y_min, y_max = self.bounds
+        if not (x_min <= x <= x_max and y_min <= y <= y_max):
+            return None
+        col = min(self.bins_x - 1, int((x - x_min) / (x_max - x_min) * self.bins_x))
+        row = min(self.bins_y - 1, int((y - y_min) / (y_max - y_min) * self.bins_y))
+        return row, col
+
+    def update(self, x, y, features, values):
+        with self._lock:
+            if self._counts is None:
+                self.unbinned += 1
+                return
+            idx = self.cell(x, y)
+            if idx is None:
+                self.outside += 1
+                return
+            self._counts[idx] += 1
+            for name, value in zip(features, values):
+                if not _is_number(value):
+                    continue
+                grid = self._means.get(name)
+                if grid is None:
+                    grid = self._means[name] = np.full((self.bins_y, self.bins_x), np.nan)
+                    self._feature_counts[name] = np.zeros((self.bins_y, self.bins_x), dtype=np.int64)
+                counts = self._feature_counts[name]
+                counts[idx] += 1
+                # 各格第一筆以前為 NaN；累計平均 m += (v - m) / n，n 為此特徵在此格的樣本數
+                prev = grid[idx]
+                grid[idx] = value if math.isnan(prev) else prev + (value - prev) / counts[idx]
+
+    def reset(self):
+        with self._lock:
+            if self._counts is not None:
+                self._counts[:] = 0
+            self._means = {}
+            self._feature_counts = {}
+            self.outside = 0
+            self.unbinned = 0
+
+    def grid(self, feature: str) -> Optional[np.ndarray]:
+        """某特徵的格點平均（沒有量測的格為 NaN）；回傳複本"""
+        with self._lock:
+            grid = self._means.get(feature)
+            return None if grid is None else grid.copy()
+
+    def counts(self, feature: Optional[str] = None) -> Optional[np.ndarray]:
+        """各格的結果數；指定 feature 時為該特徵的樣本數"""
+        with self._lock:
+            counts = self._counts if feature is None else self._feature_counts.get(feature)
+            return None if counts is None else counts.copy()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            covered = int(np.count_nonzero(self._counts)) if self._counts is not None else 0
+            return {
+                "bounds": list(self.bounds) if self.bounds else None,
+                "bins": [self.bins_x, self.bins_y],
+                "cells_covered": covered,
+                "coverage": round(covered / (self.bins_x * self.bins_y), 4),
+                "outside": self.outside,
+                "unbinned": self.unbinned,
+                "features": sorted(self._means)
+            }
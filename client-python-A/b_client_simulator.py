@@ -4,14 +4,24 @@ B 客戶端模擬器
 用於測試與 A 客戶端的 MQTT 通信
 """
 
+import argparse
 import json
 import time
 import uuid
 import threading
 import logging
-import random
 from typing import Dict, Any, Optional
 import paho.mqtt.client as mqtt
+import chunked
+import clock_sync
+import codec
+from aggregators import parse_bounds
+import dedup
+import profiling
+import tls
+import mqtt_v5
+from session import ControlLane, abort_payload
+from sim_engine import BatchGenerator, SimulatorEngine, FEATURE_SETS, parse_latency_model
 
 # 配置日誌
 logging.basicConfig(
@@ -27,29 +37,112 @@ PORT = int(os.getenv("MQTT_PORT", "4883"))
 ID = os.getenv("MQTT_CLIENT_ID", "id1")
 CLIENT_ID = f"B-{ID}"
 KEEPALIVE = int(os.getenv("MQTT_KEEPALIVE", "45"))
+PROTOCOL = os.getenv("MQTT_PROTOCOL", mqtt_v5.PROTOCOL_V311)     # "311" 或 "5"
+SESSION_EXPIRY = int(os.getenv("MQTT_SESSION_EXPIRY", "3600"))
+SHARE_GROUP = os.getenv("MQTT_SHARE_GROUP", "")             # 共享訂閱群組，空字串表示不共享
+INSTANCE_ID = os.getenv("MQTT_B_INSTANCE", "")              # 共享模式下的實例識別碼
+STATUS_INTERVAL = float(os.getenv("MQTT_STATUS_INTERVAL", "5"))  # 負載狀態回報間隔（秒）
+MAX_CONCURRENCY = int(os.getenv("MQTT_B_CONCURRENCY", "0"))    # 同時處理上限，0 表示不限
+CHUNK_ELEMENTS = int(os.getenv("MQTT_CHUNK_ELEMENTS", "4096"))  # 每個頻譜分塊的元素數
+COMPRESSION = os.getenv("MQTT_COMPRESSION", "none")           # none、auto 或指定編碼器
+COMPRESS_THRESHOLD = int(os.getenv("MQTT_COMPRESS_THRESHOLD", str(codec.DEFAULT_THRESHOLD)))
+CONTROL_LANE = os.getenv("MQTT_CONTROL_LANE", "1") != "0"  # abort 使用獨立連線，0 表示與主連線共用
+SCAN_AREA = os.getenv("MQTT_SCAN_AREA", "")   # 掃描範圍 "x_min,x_max,y_min,y_max"，於設定中宣告
 
 # Topic 定義 - 與 A 客戶端對應
 TOP_CTRL_START = f"v1/{ID}/ctrl/start"       # B→A
 TOP_CTRL_END   = f"v1/{ID}/ctrl/end"         # A→B
+TOP_CTRL_ABORT = f"v1/{ID}/ctrl/abort"       # A↔B，中止 session（高優先權控制通道）
 TOP_CMD_POINT  = f"v1/{ID}/cmd/point"        # A→B
 TOP_RESULT     = f"v1/{ID}/telemetry/result" # B→A
 TOP_SETTING    = f"v1/{ID}/config/setting"   # retained
 TOP_STATUS     = f"v1/{ID}/status"
+TOP_CHUNK      = f"v1/{ID}/telemetry/chunk"  # B→A，大型陣列的二進位分塊
+TOP_CHUNK_RESEND = f"v1/{ID}/cmd/chunk_resend"  # A→B，要求重送缺少的分塊
 
 class BMQTTClient:
-    def __init__(self):
+    def __init__(self, protocol: str = PROTOCOL, share_group: str = SHARE_GROUP,
+                 instance_id: str = INSTANCE_ID, max_concurrency: int = MAX_CONCURRENCY,
+                 engine: Optional[SimulatorEngine] = None):
         self.client = None
         self.is_connected = False
-        self.processing_delay = 2.0  # 模擬處理時間（秒）
+        self.processing_delay = 2.0  # 模擬處理時間（秒），engine 未設定延遲模型時使用
+        # 結果產生與延遲模型
+        self.engine = engine or SimulatorEngine(sampling_rate=100)
+        # 同時完成處理的點位合併成一次 generate_batch
+        self.generator = BatchGenerator(self.engine)
+        # 頻譜格式：chunked 以二進位分塊傳送，json 直接放在結果 JSON 內
+        self.spectrum_format = "chunked"
+        self.chunk_elements = CHUNK_ELEMENTS
+        self._chunk_cache = chunked.ChunkCache()
+        # 結果壓縮：none 關閉，auto 依 A 宣告的能力選最快的編碼器，或指定 zlib/zstd/lz4
+        self.compression = COMPRESSION
+        self.compress_threshold = COMPRESS_THRESHOLD
+        self._codec = codec.PayloadCodec()
+        # 掃描範圍：A 以此配置熱圖格點
+        self.scan_area = parse_bounds(SCAN_AREA)
+        self.protocol = mqtt_v5.parse_protocol(protocol)
+        # v5 回覆主題的 topic alias
+        self._aliases = mqtt_v5.TopicAliasTable()
+
+        # 共享訂閱：多個實例經 $share/<group>/ 分攤 cmd/point，各自回報負載
+        self.share_group = share_group or None
+        self.instance_id = instance_id or (uuid.uuid4().hex[:6] if self.share_group else "")
+        self.client_id = f"{CLIENT_ID}-{self.instance_id}" if self.instance_id else CLIENT_ID
+        self.status_topic = f"{TOP_STATUS}/{self.instance_id}" if self.share_group else TOP_STATUS
+        self.cmd_subscription = (f"$share/{self.share_group}/{TOP_CMD_POINT}"
+                                 if self.share_group else TOP_CMD_POINT)
+
+        # 負載統計；max_concurrency 模擬單一實例（單一設備）的處理能力
+        self.max_concurrency = max_concurrency
+        self._slot_cond = threading.Condition()
+        self._free_slots = max_concurrency
+        self._load_lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.dropped = 0
+
+        # 已中止的 session：排隊中與之後到達的該 session 指令直接丟棄
+        self._aborted = dedup.RecentlyCompleted(window=3600.0)
+        self.session_id: Optional[str] = None   # 本端最後送出的 START
+        self.control: Optional[ControlLane] = None
+        self._status_thread: Optional[threading.Thread] = None
+        self._status_stop = threading.Event()
+
+    @property
+    def is_v5(self) -> bool:
+        return self.protocol == mqtt_v5.PROTOCOL_V5
         
-    def setup_client(self):
-        """設置 MQTT 客戶端"""
-        self.client = mqtt.Client(
-            mqtt.CallbackAPIVersion.VERSION2, 
-            client_id=CLIENT_ID, 
-            clean_session=False, 
-            protocol=mqtt.MQTTv311
-        )
+    def setup_client(self, client: Optional[mqtt.Client] = None,
+                     control_client: Optional[mqtt.Client] = None):
+        """
+        設置 MQTT 客戶端（可傳入相容的替身客戶端，例如 local_bus.LocalClient）
+        control_client 為 abort 使用的獨立連線；傳入替身客戶端時只有一併傳入才啟用
+        """
+        if client is None and control_client is None and CONTROL_LANE:
+            control_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"{self.client_id}-ctrl",
+                                         protocol=mqtt_v5.paho_protocol(self.protocol))
+            tls.apply(control_client)
+        if control_client is not None:
+            self.control = ControlLane(control_client, TOP_CTRL_ABORT, self._on_abort)
+        if client is not None:
+            self.client = client
+        elif self.is_v5:
+            self.client = mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2, 
+                client_id=self.client_id, 
+                protocol=mqtt.MQTTv5
+            )
+        else:
+            self.client = mqtt.Client(
+                mqtt.CallbackAPIVersion.VERSION2, 
+                client_id=self.client_id, 
+                clean_session=False, 
+                protocol=mqtt.MQTTv311
+            )
+        if client is None:
+            tls.apply(self.client)
         
         # 設置遺囑
         will_payload = json.dumps({
@@ -58,36 +151,41 @@ class BMQTTClient:
             "ts": int(time.time()),
             "state": "disconnected"
         })
-        self.client.will_set(TOP_STATUS, will_payload, qos=1, retain=True)
+        self.client.will_set(self.status_topic, will_payload, qos=1, retain=True)
         
         # 設置回調函數
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
+        profiling.instrument(self.client, "B.")
+        if self.control is not None:
+            profiling.instrument(self.control.client, "B.ctrl.")
         
     def on_connect(self, client: mqtt.Client, userdata, flags, rc, properties=None):
         """連接成功回調"""
         if rc == 0:
             self.is_connected = True
-            logger.info("B 客戶端連接成功")
+            logger.info(f"B 客戶端連接成功 (MQTT {'v5' if self.is_v5 else 'v3.1.1'}, client_id={self.client_id})")
+            if self.is_v5:
+                self._aliases.reset(getattr(properties, "TopicAliasMaximum", 0))
             
             # 訂閱主題
             subs = [
                 (TOP_CTRL_END, 1),   # 監聽 A 端結束信號
-                (TOP_CMD_POINT, 1),  # 監聽 A 端點位命令
+                (self.cmd_subscription, 1),  # 監聽 A 端點位命令（共享模式下由群組分攤）
+                (TOP_CHUNK_RESEND, 1),  # 監聽分塊重送請求（只有持有快取的實例會回應）
                 (TOP_STATUS, 1)      # 監聽狀態更新
             ]
+            if self.control is None:
+                subs.append((TOP_CTRL_ABORT, 1))
             client.subscribe(subs)
             
-            # 發送上線狀態（retained）
-            status_payload = json.dumps({
-                "online": True, 
-                "sender": "B", 
-                "ts": int(time.time()), 
-                "state": "ready"
-            })
-            client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
-            logger.info("B 客戶端已發送上線狀態")
+            # 發送上線狀態（retained），並定期回報本實例負載
+            self.publish_status()
+            logger.info(f"B 客戶端已發送上線狀態 ({self.status_topic})")
+            if self._status_thread is None:
+                self._status_thread = threading.Thread(target=self._status_loop, daemon=True)
+                self._status_thread.start()
             
             # 發送初始設定（retained）
             self.send_initial_settings()
@@ -95,7 +193,7 @@ class BMQTTClient:
         else:
             logger.error(f"B 客戶端連接失敗，錯誤碼：{rc}")
             
-    def on_disconnect(self, client, userdata, rc, properties=None):
+    def on_disconnect(self, client, userdata, flags, rc, properties=None):
         """斷線回調"""
         self.is_connected = False
         logger.warning(f"B 客戶端斷線，錯誤碼：{rc}")
@@ -103,20 +201,36 @@ class BMQTTClient:
     def on_message(self, client: mqtt.Client, userdata, msg: mqtt.MQTTMessage):
         """接收消息回調"""
         try:
-            data = json.loads(msg.payload.decode("utf-8"))
+            data = codec.loads(msg.payload)
             logger.info(f"B 收到消息 - Topic: {msg.topic}, Data: {data}")
         except Exception as e:
             logger.error(f"B 解析消息錯誤: {e}, topic: {msg.topic}")
             return
 
-        # 處理點位命令
+        # 處理點位命令（v5 依 Response Topic / Correlation Data 回覆）
         if msg.topic == TOP_CMD_POINT and data.get("type") == "move_point":
+            if self._is_aborted(data.get("session_id")):
+                # broker 佇列中已中止 session 的指令，不佔用處理線程
+                with self._load_lock:
+                    self.dropped += 1
+                logger.info(f"[B] 丟棄已中止 session 的點位 req_id={mqtt_v5.correlation_id(msg) or data.get('req_id')}")
+                return
+            reply = (mqtt_v5.response_topic(msg), getattr(msg.properties, "CorrelationData", None))
             threading.Thread(
-                target=self.process_point_command, 
-                args=(data,), 
+                target=profiling.wrap("B.process_point_command", self.process_point_command), 
+                args=(data,) + reply, 
+                kwargs={"received_ns": clock_sync.received_ns(msg)},
                 daemon=True
             ).start()
 
+        # 處理分塊重送請求
+        elif msg.topic == TOP_CHUNK_RESEND and data.get("type") == "chunk_resend":
+            self.resend_chunks(data.get("req_id"), data.get("missing", []))
+
+        # 處理中止信號（未使用獨立控制連線時）
+        elif msg.topic == TOP_CTRL_ABORT and data.get("type") == "abort":
+            self._on_abort(data)
+
         # 處理結束信號
         elif msg.topic == TOP_CTRL_END and data.get("type") == "end":
             logger.info(f"[B] 收到 A 端結束信號: {data}")
@@ -126,74 +240,286 @@ class BMQTTClient:
             sender = data.get("sender")
             if sender == "A":
                 logger.info(f"[B] A 端狀態: {data.get('state')}")
+                if "compression" in data:
+                    self._configure_codec(data["compression"])
+
+    def _on_abort(self, data: Dict[str, Any]):
+        """A 或操作員中止 session；在網路線程直接處理，不經任何佇列"""
+        session_id = data.get("session_id")
+        if data.get("type") != "abort" or not session_id or self._is_aborted(session_id):
+            return
+        self._mark_aborted(session_id)
+        logger.warning(f"[B] session {session_id} 已中止 ({data.get('reason')})，丟棄排隊中的指令")
+
+    def _mark_aborted(self, session_id: str):
+        self._aborted.add(session_id)
+        with self._slot_cond:
+            # 喚醒排隊中的指令，讓已中止 session 的指令放棄等待
+            self._slot_cond.notify_all()
+
+    def _is_aborted(self, session_id: Optional[str]) -> bool:
+        return bool(session_id) and self._aborted.get(session_id) is not None
+
+    def abort_session(self, session_id: Optional[str] = None, reason: str = "operator") -> bool:
+        """中止指定（預設為本端最後送出的）session，並通知 A"""
+        session_id = session_id or self.session_id
+        if not session_id:
+            return False
+        self._mark_aborted(session_id)
+        payload = abort_payload(session_id, "B", reason)
+        if self.control is not None:
+            self.control.publish(payload)
+        else:
+            self.client.publish(TOP_CTRL_ABORT, payload, qos=1)
+        logger.info(f"[B] 已發送中止信號 session_id={session_id}")
+        return True
+
+    def _configure_codec(self, advertised: Optional[Dict[str, Any]]):
+        """依 A 宣告可解碼的格式選擇結果的編碼器"""
+        if self.compression == "none":
+            return
+        advertised = advertised or {}
+        preferred = codec.PREFERENCE if self.compression == "auto" else (self.compression,)
+        name = codec.negotiate(advertised.get("codecs"), preferred)
+        if name == self._codec.codec:
+            return
+        self._codec = codec.PayloadCodec(
+            name,
+            threshold=self.compress_threshold,
+            use_dict=codec.RESULT_DICT_ID in advertised.get("dictionaries", [])
+        )
+        logger.info(f"[B] 結果壓縮: {name or '停用'}")
                 
     def send_initial_settings(self):
         """發送初始設定到 retained topic"""
         settings = {
             "version": "1.0",
-            "features": ["temperature", "pressure", "vibration", "speed"],
-            "sampling_rate": 100,
+            "features": self.engine.features,
+            "sampling_rate": self.engine.sampling_rate,
+            "analysis_mode": self.engine.analysis_mode,
+            "spectrum_size": self.engine.spectrum_size,
+            "spectrum_format": self.spectrum_format,
             "precision": 0.01,
+            # v5 時 A 的 req_id 只放在 Correlation Data
+            "protocol": self.protocol,
             "sender": "B",
             "ts": int(time.time())
         }
+        if self.scan_area:
+            settings["scan_area"] = dict(zip(("x_min", "x_max", "y_min", "y_max"), self.scan_area))
+        if self.compression != "none":
+            # 宣告本端可解碼的格式，A 據此壓縮 cmd/point
+            settings["compression"] = codec.advertisement(self.compress_threshold)
         
         self.client.publish(TOP_SETTING, json.dumps(settings), qos=1, retain=True)
         logger.info("[B] 已發送初始設定")
         
-    def process_point_command(self, data: Dict[str, Any]):
-        """處理點位命令並回傳結果"""
-        req_id = data.get("req_id")
+    def process_point_command(self, data: Dict[str, Any], reply_topic: Optional[str] = None,
+                              correlation: Optional[bytes] = None, received_ns: Optional[int] = None):
+        """處理點位命令並回傳結果；received_ns 為收到指令的時間（time.time_ns()）"""
+        req_id = mqtt_v5.decode_correlation(correlation) if correlation else data.get("req_id")
+        session_id = data.get("session_id")
         point = data.get("point", {})
         x = point.get("x", 0)
         y = point.get("y", 0)
         
+        with self._load_lock:
+            self.queued += 1
+        acquired = self._acquire_slot(session_id)
+        with self._load_lock:
+            self.queued -= 1
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.dropped += 1
+        if not acquired:
+            logger.info(f"[B] session {session_id} 已中止，丟棄排隊中的點位 req_id={req_id}")
+            if self.is_connected and self.max_concurrency > 0:
+                self.publish_status()
+            return
+        # 奈秒時間標記：A 的發送時間原樣帶回，A 據此估計時鐘偏移與各段延遲
+        timing = {"t_recv_ns": received_ns or clock_sync.now_ns(), "t_start_ns": clock_sync.now_ns()}
+        if "t_send_ns" in data:
+            timing["t_send_ns"] = data["t_send_ns"]
         logger.info(f"[B] 開始處理點位 ({x},{y}), req_id={req_id}")
+        try:
+            self._process_point(req_id, x, y, reply_topic, correlation, session_id, timing)
+        finally:
+            with self._load_lock:
+                self.in_flight -= 1
+                self.processed += 1
+            if self.max_concurrency > 0:
+                self._release_slot()
+                # 有容量上限時每次完成都更新 credit，A 據此發送下一個點位
+                if self.is_connected:
+                    self.publish_status()
+
+    def _acquire_slot(self, session_id: Optional[str]) -> bool:
+        """取得處理名額；排隊期間所屬 session 被中止時放棄並回傳 False"""
+        if self.max_concurrency <= 0:
+            return not self._is_aborted(session_id)
+        with self._slot_cond:
+            waiting = self._free_slots <= 0
+        if waiting and self.is_connected:
+            # 需要排隊時立即宣告，A 逾時時據此延長等待而不是重送
+            self.publish_status()
+        with self._slot_cond:
+            while self._free_slots <= 0 and not self._is_aborted(session_id):
+                self._slot_cond.wait()
+            if self._is_aborted(session_id):
+                return False
+            self._free_slots -= 1
+            return True
+
+    def _release_slot(self):
+        with self._slot_cond:
+            self._free_slots += 1
+            # 被喚醒的可能是已中止的指令，全部喚醒避免名額閒置
+            self._slot_cond.notify_all()
+
+    def _process_point(self, req_id: Optional[str], x: float, y: float,
+                       reply_topic: Optional[str], correlation: Optional[bytes],
+                       session_id: Optional[str] = None, timing: Optional[Dict[str, int]] = None):
+        """模擬量測並發送結果"""
+        # 模擬處理時間（依延遲模型抽樣）
+        delay = self.engine.sample_latency(x, y, default=self.processing_delay)
+        time.sleep(delay)
         
-        # 模擬處理時間
-        time.sleep(self.processing_delay)
-        
-        # 生成模擬數據
-        features = ["temperature", "pressure", "vibration", "speed"]
-        values = [
-            round(20 + random.uniform(-5, 15), 2),  # temperature
-            round(1013 + random.uniform(-50, 50), 1),  # pressure
-            round(random.uniform(0, 10), 3),  # vibration
-            round(random.uniform(10, 100), 1)  # speed
-        ]
-        
-        # 添加一些基於座標的變化
-        values[0] += abs(x) * 0.1  # 溫度隨 x 變化
-        values[1] += abs(y) * 0.5  # 壓力隨 y 變化
+        # 生成模擬數據（數值隨座標變化）
+        features = self.engine.features
+        values, spectrum = self.generator.generate(x, y)
         
         result_payload = {
             "type": "result_feature_set",
-            "req_id": req_id,
             "point": {"x": x, "y": y},
             "features": features,
             "values": values,
             "metadata": {
-                "processing_time": self.processing_delay,
+                "processing_time": round(delay, 6),
                 "quality": "good",
-                "sensor_status": "normal"
+                "sensor_status": "normal",
+                "instance": self.instance_id or None
             },
             "ts": int(time.time()),
             "sender": "B"
         }
+        if req_id and not (self.is_v5 and reply_topic and correlation):
+            # v5 回覆以 Correlation Data 帶回 req_id，JSON 內不再重複
+            result_payload["req_id"] = req_id
+        if spectrum is not None:
+            result_payload["sampling_rate"] = self.engine.sampling_rate
+            if self.spectrum_format == "chunked" and req_id:
+                # 先送分塊再送結果，A 收到結果時陣列通常已重組完成
+                result_payload["spectrum"] = chunked.describe(spectrum, self.chunk_elements)
+                chunk_topic = f"{reply_topic}/chunk" if self.is_v5 and reply_topic else TOP_CHUNK
+                self._chunk_cache.put(req_id, spectrum, chunk_topic)
+                self.publish_chunks(req_id)
+            else:
+                result_payload["spectrum"] = spectrum.tolist()
         
-        # 發送結果
-        self.client.publish(TOP_RESULT, json.dumps(result_payload), qos=1)
+        # 發送結果（處理期間 session 已中止時 A 不再等待，不送出）
+        if self._is_aborted(session_id):
+            logger.info(f"[B] session {session_id} 已中止，不發送結果 req_id={req_id}")
+            return
+        if timing is not None:
+            timing["t_reply_ns"] = clock_sync.now_ns()
+            result_payload["timing"] = timing
+        self.publish_result(result_payload, reply_topic, correlation)
         logger.info(f"[B] 已發送結果 req_id={req_id}, 特徵數: {len(features)}")
 
-    def send_start_signal(self):
-        """發送開始信號給 A 端"""
+    def publish_result(self, result_payload: Dict[str, Any], reply_topic: Optional[str] = None,
+                       correlation: Optional[bytes] = None):
+        """發送結果：有 Response Topic 時回覆至該主題並帶回 Correlation Data"""
+        if not (self.is_v5 and reply_topic):
+            self.client.publish(TOP_RESULT, self._codec.encode(result_payload), qos=1)
+            return
+        self._aliases.publish(self.client, reply_topic, self._codec.encode(result_payload), 1,
+                              lambda alias: mqtt_v5.response_properties(correlation, alias))
+
+    def publish_chunks(self, req_id: str, seqs=None) -> int:
+        """發送快取中陣列的分塊，回傳發送數"""
+        cached = self._chunk_cache.get(req_id)
+        if cached is None:
+            return 0
+        array, topic = cached
+        chunks = chunked.encode_chunks(req_id, array, self.chunk_elements, seqs)
+        for payload in chunks:
+            self.client.publish(topic, payload, qos=1)
+        return len(chunks)
+
+    def resend_chunks(self, req_id: Optional[str], missing):
+        """回應 A 的分塊重送請求；不在本實例快取中的請求直接忽略"""
+        if not req_id:
+            return
+        sent = self.publish_chunks(req_id, [int(seq) for seq in missing])
+        if sent:
+            logger.info(f"[B] 已重送 {sent} 個分塊 req_id={req_id}")
+
+    def load_snapshot(self) -> Dict[str, Any]:
+        """本實例目前的負載"""
+        with self._load_lock:
+            return {
+                "instance": self.instance_id or None,
+                "group": self.share_group,
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "processed": self.processed,
+                "dropped": self.dropped
+            }
+
+    def flow_snapshot(self) -> Optional[Dict[str, int]]:
+        """credit 宣告：window 為同時處理上限，available 為剩餘容量；不限併發時不宣告"""
+        if self.max_concurrency <= 0:
+            return None
+        with self._load_lock:
+            return {
+                "window": self.max_concurrency,
+                "available": max(0, self.max_concurrency - self.in_flight - self.queued),
+                "queue_depth": self.queued
+            }
+
+    def publish_status(self, online: bool = True):
+        """發送本實例狀態與負載（retained）"""
+        load = self.load_snapshot()
+        if online:
+            state = "busy" if load["in_flight"] or load["queued"] else "ready"
+        else:
+            state = "disconnected"
+        status = {
+            "online": online,
+            "sender": "B",
+            "ts": int(time.time()),
+            "state": state,
+            "load": load
+        }
+        flow = self.flow_snapshot() if online else None
+        if flow:
+            status["flow"] = flow
+        status_payload = json.dumps(status)
+        self.client.publish(self.status_topic, status_payload, qos=1, retain=True)
+
+    def _status_loop(self):
+        """定期回報負載，只在負載變化時發送"""
+        last = None
+        while not self._status_stop.wait(STATUS_INTERVAL):
+            load = self.load_snapshot()
+            if self.is_connected and load != last:
+                self.publish_status()
+                last = load
+
+    def send_start_signal(self, job_id: Optional[str] = None, supersede: bool = False):
+        """
+        發送開始信號給 A 端
+        A 依 session_id 去重；相同 job_id 的 START 在執行中時被忽略，supersede=True 則取代
+        """
         if not self.is_connected:
             logger.error("MQTT 未連接，無法發送開始信號")
             return False
             
+        self.session_id = str(uuid.uuid4())
         start_payload = {
             "type": "start",
-            "session_id": str(uuid.uuid4()),
+            "session_id": self.session_id,
             "ts": int(time.time()),
             "sender": "B",
             "config": {
@@ -201,16 +527,27 @@ class BMQTTClient:
                 "timeout": 30
             }
         }
+        if job_id:
+            start_payload["job_id"] = job_id
+        if supersede:
+            start_payload["supersede"] = True
         
         self.client.publish(TOP_CTRL_START, json.dumps(start_payload), qos=1)
-        logger.info("[B] 已發送 START 信號給 A 端")
+        logger.info(f"[B] 已發送 START 信號給 A 端 (session_id={self.session_id})")
         return True
 
     def connect(self):
         """連接到 MQTT Broker"""
         try:
-            logger.info(f"B 正在連接到 MQTT Broker {BROKER_HOST}:{PORT}")
-            self.client.connect(BROKER_HOST, PORT, keepalive=KEEPALIVE)
+            port = tls.port(PORT)
+            logger.info(f"B 正在連接到 MQTT Broker {BROKER_HOST}:{port}{'（TLS）' if tls.enabled() else ''}")
+            if self.is_v5:
+                self.client.connect(BROKER_HOST, port, keepalive=KEEPALIVE, clean_start=False,
+                                    properties=mqtt_v5.connect_properties(SESSION_EXPIRY))
+            else:
+                self.client.connect(BROKER_HOST, port, keepalive=KEEPALIVE)
+            if self.control is not None:
+                self.control.connect(BROKER_HOST, port, KEEPALIVE)
             return True
         except Exception as e:
             logger.error(f"B 連接 MQTT Broker 失敗: {e}")
@@ -218,20 +555,67 @@ class BMQTTClient:
             
     def disconnect(self):
         """斷開連接"""
+        self._status_stop.set()
         if self.client and self.is_connected:
             # 發送離線狀態
-            status_payload = json.dumps({
-                "online": False, 
-                "sender": "B", 
-                "ts": int(time.time()),
-                "state": "disconnected"
-            })
-            self.client.publish(TOP_STATUS, status_payload, qos=1, retain=True)
+            self.publish_status(online=False)
             self.client.disconnect()
+        if self.control is not None:
+            self.control.close()
 
 def main():
     """主函數"""
-    b_client = BMQTTClient()
+    parser = argparse.ArgumentParser(description="B 客戶端模擬器")
+    parser.add_argument('--protocol', choices=['311', '5'], default=PROTOCOL,
+                        help=f'MQTT 協議版本 (默認: {PROTOCOL})')
+    parser.add_argument('--share-group', default=SHARE_GROUP,
+                        help='以 $share/<group>/ 共享訂閱 cmd/point，多個實例分攤負載')
+    parser.add_argument('--instance', default=INSTANCE_ID,
+                        help='實例識別碼 (共享模式下默認隨機產生)')
+    parser.add_argument('--delay', type=float, default=2.0, help='模擬處理時間（秒）')
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY,
+                        help='同時處理的點位上限，0 表示不限')
+    parser.add_argument('--seed', type=int, help='隨機種子，固定後結果與延遲序列可重現')
+    parser.add_argument('--latency', metavar='SPEC',
+                        help='延遲模型，例如 fixed:2.0、lognormal:0.5,0.3、travel:100,0.2、'
+                             'spike:0.01,10+lognormal:0.5,0.3 (默認使用 --delay 固定延遲)')
+    parser.add_argument('--features', choices=sorted(FEATURE_SETS), default='basic',
+                        help='特徵集合 (vibration 與 C# B 端相同)')
+    parser.add_argument('--spectrum', type=int, default=0, metavar='N',
+                        help='每個結果附帶 N 點功率頻譜 (full_spectrum 模式)')
+    parser.add_argument('--sampling-rate', type=int,
+                        help='取樣率 (默認: 有頻譜時 1000，否則 100)')
+    parser.add_argument('--spectrum-format', choices=['chunked', 'json'], default='chunked',
+                        help='頻譜傳送格式：chunked 二進位分塊，json 放在結果 JSON 內 (默認: chunked)')
+    parser.add_argument('--chunk-elements', type=int, default=CHUNK_ELEMENTS,
+                        help=f'每個分塊的元素數 (默認: {CHUNK_ELEMENTS})')
+    parser.add_argument('--compression', choices=['none', 'auto'] + codec.available_codecs(),
+                        default=COMPRESSION,
+                        help='結果壓縮：none 關閉，auto 依 A 端能力選最快的編碼器 (默認: none)')
+    parser.add_argument('--compress-threshold', type=int, default=COMPRESS_THRESHOLD,
+                        help=f'不使用字典時，小於此位元組數的訊息不壓縮 (默認: {COMPRESS_THRESHOLD})')
+    parser.add_argument('--scan-area', metavar='X_MIN,X_MAX,Y_MIN,Y_MAX', default=SCAN_AREA,
+                        help='於 config/setting 宣告掃描範圍，A 據此配置熱圖格點')
+    profiling.add_arguments(parser)
+    tls.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure_from_args(args)
+    tls.configure_from_args(args)
+
+    engine = SimulatorEngine(
+        seed=args.seed,
+        feature_set=args.features,
+        spectrum_size=args.spectrum,
+        sampling_rate=args.sampling_rate or (1000 if args.spectrum else 100),
+        latency=parse_latency_model(args.latency) if args.latency else None
+    )
+    b_client = BMQTTClient(args.protocol, args.share_group, args.instance, args.concurrency, engine)
+    b_client.processing_delay = args.delay
+    b_client.spectrum_format = args.spectrum_format
+    b_client.chunk_elements = args.chunk_elements
+    b_client.compression = args.compression
+    b_client.compress_threshold = args.compress_threshold
+    b_client.scan_area = parse_bounds(args.scan_area)
     
     try:
         # 設置客戶端
@@ -251,6 +635,8 @@ def main():
             print("\n=== B 客戶端控制台 ===")
             print("指令:")
             print("  s - 發送 START 信號給 A 端")
+            print("  a - 中止目前的 session（A 取消等待，B 丟棄排隊指令）")
+            print("  l - 顯示本實例負載")
             print("  q - 退出")
             print("  h - 顯示幫助")
             
@@ -260,11 +646,18 @@ def main():
                     
                     if cmd == 's':
                         b_client.send_start_signal()
+                    elif cmd == 'a':
+                        if not b_client.abort_session():
+                            print("尚未發送 START，沒有可中止的 session")
+                    elif cmd == 'l':
+                        print(json.dumps(b_client.load_snapshot(), ensure_ascii=False))
                     elif cmd == 'q':
                         break
                     elif cmd == 'h':
                         print("指令:")
                         print("  s - 發送 START 信號給 A 端")
+                        print("  a - 中止目前的 session（A 取消等待，B 丟棄排隊指令）")
+                        print("  l - 顯示本實例負載")
                         print("  q - 退出")
                         print("  h - 顯示幫助")
                     else:
@@ -281,6 +674,7 @@ def main():
         logger.error(f"B 客戶端運行錯誤: {e}")
     finally:
         b_client.disconnect()
+        profiling.stop()
         logger.info("B 客戶端已關閉")
 
 if __name__ == "__main__":
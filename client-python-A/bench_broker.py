@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+mini_broker 吞吐量測試
+broker 在本程序的背景線程執行，發布端與訂閱端各在獨立程序中以原始 socket 收送
+（預先編碼的 PUBLISH、批次 PUBACK），量測 broker 每秒轉送的訊息數與端到端延遲；
+結果同時列出 broker 自己的計數器（MiniBroker.stats()），可作為效能回歸的基準
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import time
+from typing import List
+
+from mini_broker import MiniBroker, _packet, _string
+
+
+def _connect_packet(client_id: str) -> bytes:
+    body = _string(b"MQTT") + bytes((4, 0x02)) + (60).to_bytes(2, "big") + _string(client_id.encode())
+    return _packet(0x10, body)
+
+
+async def _read_packets(reader: asyncio.StreamReader):
+    """逐一產生 (標頭, 內容)"""
+    buf = bytearray()
+    while True:
+        data = await reader.read(262144)
+        if not data:
+            return
+        buf += data
+        pos = 0
+        while len(buf) - pos >= 2:
+            length, shift, i, complete = 0, 0, pos + 1, False
+            while i < len(buf):
+                byte = buf[i]
+                i += 1
+                length |= (byte & 0x7F) << shift
+                if not byte & 0x80:
+                    complete = True
+                    break
+                shift += 7
+            if not complete or i + length > len(buf):
+                break
+            yield buf[pos], bytes(buf[i:i + length])
+            pos = i + length
+        del buf[:pos]
+
+
+async def _subscriber(port: int, index: int, topic: str, qos: int, expected: int,
+                      latencies: List[float], ready: asyncio.Event) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(_connect_packet(f"bench-sub-{index}"))
+    writer.write(_packet(0x82, (1).to_bytes(2, "big") + _string(topic.encode()) + bytes((qos,))))
+    received = 0
+    acks = bytearray()
+    async for header, body in _read_packets(reader):
+        kind = header >> 4
+        if kind == 9:
+            ready.set()
+        elif kind == 3:
+            received += 1
+            topic_len = int.from_bytes(body[:2], "big")
+            pos = 2 + topic_len
+            if (header >> 1) & 0x03:
+                acks += b"\x40\x02" + body[pos:pos + 2]
+                pos += 2
+            if received % 10 == 0:
+                latencies.append((time.time_ns() - int.from_bytes(body[pos:pos + 8], "big")) / 1e6)
+            if received >= expected:
+                break
+        # 確認需在 broker 的 inflight 視窗用完前送出
+        if acks and (len(acks) >= 256 or received >= expected):
+            writer.write(bytes(acks))
+            acks.clear()
+    if acks:
+        writer.write(bytes(acks))
+    writer.write(b"\xe0\x00")
+    await writer.drain()
+    writer.close()
+    return received
+
+
+async def _publisher(port: int, index: int, topic: str, qos: int, messages: int, size: int) -> int:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(_connect_packet(f"bench-pub-{index}"))
+    await reader.readexactly(4)
+    acked = 0
+
+    async def count_acks():
+        nonlocal acked
+        async for header, _ in _read_packets(reader):
+            if header >> 4 == 4:
+                acked += 1
+                if acked >= messages:
+                    return
+
+    ack_task = asyncio.create_task(count_acks()) if qos else None
+    topic_bytes = _string(topic.encode())
+    padding = b"x" * max(0, size - 8)
+    for n in range(messages):
+        stamp = time.time_ns().to_bytes(8, "big")
+        if qos:
+            body = topic_bytes + (n % 65535 + 1).to_bytes(2, "big") + stamp + padding
+            writer.write(_packet(0x32, body))
+        else:
+            writer.write(_packet(0x30, topic_bytes + stamp + padding))
+        if n % 256 == 255:
+            await writer.drain()
+    await writer.drain()
+    if ack_task is not None:
+        await ack_task
+    writer.write(b"\xe0\x00")
+    await writer.drain()
+    writer.close()
+    return messages
+
+
+def _run_subscribers(port, count, topic, qos, expected, ready, out):
+    async def run():
+        latencies: List[float] = []
+        events = [asyncio.Event() for _ in range(count)]
+        tasks = [asyncio.create_task(_subscriber(port, i, topic, qos, expected, latencies, events[i]))
+                 for i in range(count)]
+        for ev in events:
+            await ev.wait()
+        ready.set()
+        received = await asyncio.gather(*tasks)
+        out.put(("sub", sum(received), time.time(), latencies))
+    asyncio.run(run())
+
+
+def _run_publishers(port, count, qos, messages, size, start, out):
+    async def run():
+        start.wait()
+        begin = time.time()
+        await asyncio.gather(*[_publisher(port, i, f"bench/{i}/data", qos, messages, size)
+                               for i in range(count)])
+        out.put(("pub", count * messages, begin, time.time()))
+    asyncio.run(run())
+
+
+def run_case(broker: MiniBroker, publishers: int, subscribers: int, messages: int,
+             size: int, qos: int, topic: str, timeout: float):
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    ready = ctx.Event()
+    port = broker.ports["plain"]
+    expected = publishers * messages
+    before = broker.stats()
+    subs = ctx.Process(target=_run_subscribers,
+                       args=(port, subscribers, topic, qos, expected, ready, out), daemon=True)
+    pubs = ctx.Process(target=_run_publishers,
+                       args=(port, publishers, qos, messages, size, ready, out), daemon=True)
+    subs.start()
+    pubs.start()
+    results = {}
+    deadline = time.time() + timeout
+    while len(results) < 2 and time.time() < deadline:
+        try:
+            item = out.get(timeout=1)
+        except Exception:
+            continue
+        results[item[0]] = item
+    for p in (subs, pubs):
+        p.join(timeout=2)
+        if p.is_alive():
+            p.terminate()
+    after = broker.stats()
+    if "pub" not in results or "sub" not in results:
+        print(f"  逾時：{timeout:.0f} 秒內未完成（broker 已收 {after['published'] - before['published']}，"
+              f"已送 {after['delivered'] - before['delivered']}）")
+        return
+    _, _, begin, pub_end = results["pub"]
+    _, received, sub_end, latencies = results["sub"]
+    elapsed = sub_end - begin
+    delivered = after["delivered"] - before["delivered"]
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+    print(f"  發布 {expected} 則（{expected / (pub_end - begin):.0f} msg/s），"
+          f"訂閱端收到 {received}/{expected * subscribers}，耗時 {elapsed:.2f}s")
+    print(f"  broker 轉送 {delivered / elapsed:.0f} msg/s，丟棄 {after['dropped'] - before['dropped']}，"
+          f"延遲 p50 {statistics.median(latencies) if latencies else 0:.1f}ms / p99 {p99:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mini_broker 吞吐量測試")
+    parser.add_argument('--publishers', '-p', type=int, default=4, help='發布連線數 (默認: 4)')
+    parser.add_argument('--subscribers', '-s', type=int, default=1, help='訂閱連線數 (默認: 1)')
+    parser.add_argument('--messages', '-n', type=int, default=25000, help='每個發布連線的訊息數 (默認: 25000)')
+    parser.add_argument('--size', type=int, default=64, help='訊息大小（位元組，默認: 64）')
+    parser.add_argument('--qos', default="0,1", help='測試的 QoS 列表 (默認: 0,1)')
+    parser.add_argument('--topic', default="bench/+/data", help='訂閱主題 (默認: bench/+/data)')
+    parser.add_argument('--timeout', type=float, default=120.0, help='每個測試的秒數上限 (默認: 120)')
+    args = parser.parse_args()
+
+    # QoS 1 的訊息在訂閱端確認前都在 inflight 或佇列中，佇列上限需容納整批
+    broker = MiniBroker(port=0, max_inflight=1000,
+                        max_queued=args.publishers * args.messages).start_background()
+    for qos in (int(q) for q in args.qos.split(",")):
+        print(f"QoS {qos}: {args.publishers} 發布 × {args.messages} 則 → {args.subscribers} 訂閱 "
+              f"（{args.topic}，{args.size} 位元組）")
+        run_case(broker, args.publishers, args.subscribers, args.messages, args.size, qos,
+                 args.topic, args.timeout)
+    print(f"\nbroker 計數: {broker.stats()}")
+    broker.stop_background()
+
+
+if __name__ == "__main__":
+    main()
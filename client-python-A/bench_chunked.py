@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+大型頻譜結果：JSON 列表與二進位分塊的比較
+量測 A 端解析時間與峰值記憶體（相對於原始陣列大小的倍數），不需要 broker
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import chunked
+
+
+def _measure(fn: Callable[[], np.ndarray], repeat: int) -> Tuple[float, int, np.ndarray]:
+    """回傳 (最佳耗時秒數, 峰值記憶體位元組, 結果)"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_size(size: int, chunk_elements: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    rng = np.random.default_rng(0)
+    spectrum = rng.lognormal(-3.0, 0.5, size).astype(np.float32)
+    raw = spectrum.nbytes
+    req_id = "00000000-0000-0000-0000-000000000000"
+
+    # JSON：整個陣列放在結果 JSON 的列表內
+    start = time.perf_counter()
+    json_payload = json.dumps({"type": "result_feature_set", "req_id": req_id,
+                               "spectrum": spectrum.tolist()}).encode()
+    json_encode = time.perf_counter() - start
+
+    def parse_json() -> np.ndarray:
+        data = json.loads(json_payload.decode("utf-8"))
+        return np.asarray(data["spectrum"], dtype=np.float32)
+
+    # 分塊：二進位分塊直接寫入預先配置的緩衝區
+    start = time.perf_counter()
+    chunks: List[bytes] = chunked.encode_chunks(req_id, spectrum, chunk_elements)
+    chunk_encode = time.perf_counter() - start
+
+    def parse_chunks() -> np.ndarray:
+        reassembler = chunked.ChunkReassembler()
+        for payload in chunks:
+            reassembler.feed(payload)
+        return reassembler.take(req_id)
+
+    report = {}
+    for name, encode, wire, parse in (
+        ("json", json_encode, len(json_payload), parse_json),
+        ("chunked", chunk_encode, sum(len(c) for c in chunks), parse_chunks),
+    ):
+        elapsed, peak, result = _measure(parse, repeat)
+        assert np.array_equal(result, spectrum), f"{name} 重組結果不一致"
+        report[name] = {
+            "encode_ms": encode * 1000,
+            "parse_ms": elapsed * 1000,
+            "wire_bytes": wire,
+            "peak_ratio": peak / raw
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="頻譜 JSON 列表與二進位分塊比較")
+    parser.add_argument('--sizes', default="1000,10000,100000,1000000",
+                        help='陣列元素數列表 (默認: 1000,10000,100000,1000000)')
+    parser.add_argument('--chunk-elements', type=int, default=4096, help='每個分塊的元素數')
+    parser.add_argument('--repeat', type=int, default=3, help='計時重複次數，取最佳值')
+    args = parser.parse_args()
+
+    print(f"{'元素數':<10} {'格式':<8} {'編碼(ms)':<10} {'解析(ms)':<10} {'傳輸(bytes)':<14} 峰值/原始")
+    for size in (int(v) for v in args.sizes.split(",")):
+        report = bench_size(size, args.chunk_elements, args.repeat)
+        for name, r in report.items():
+            print(f"{size:<10} {name:<8} {r['encode_ms']:<10.2f} {r['parse_ms']:<10.2f} "
+                  f"{r['wire_bytes']:<14} {r['peak_ratio']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+訊息壓縮：CPU 時間與傳輸位元組的取捨
+以模擬器產生的結果訊息比較各編碼器（含共用字典）的壓縮率與編碼/解碼耗時，不需要 broker
+"""
+
+import argparse
+import json
+import time
+import uuid
+from typing import Callable, List, Optional, Tuple
+
+import codec
+from sim_engine import SimulatorEngine
+
+
+def _messages(kind: str, count: int, seed: int) -> List[bytes]:
+    """產生與 B 端相同格式的 result_feature_set 訊息"""
+    feature_set, spectrum = {
+        "basic": ("basic", 0),
+        "vibration": ("vibration", 0),
+        "spectrum": ("vibration", 1000),
+    }[kind]
+    engine = SimulatorEngine(seed=seed, feature_set=feature_set, spectrum_size=spectrum)
+    messages = []
+    for i in range(count):
+        x, y = float(i % 50), float(i // 50)
+        values, array = engine.generate(x, y)
+        payload = {
+            "type": "result_feature_set",
+            "point": {"x": x, "y": y},
+            "features": engine.features,
+            "values": values,
+            "metadata": {"processing_time": 2.0, "quality": "good",
+                         "sensor_status": "normal", "instance": None},
+            "ts": int(time.time()),
+            "sender": "B",
+            "req_id": str(uuid.UUID(int=i))
+        }
+        if array is not None:
+            payload["sampling_rate"] = engine.sampling_rate
+            payload["spectrum"] = array.tolist()
+        messages.append(json.dumps(payload).encode("utf-8"))
+    return messages
+
+
+def _time(fn: Callable[[], None], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(messages: List[bytes], name: Optional[str], use_dict: bool,
+          threshold: int, repeat: int) -> Tuple[int, float, float]:
+    """回傳 (總傳輸位元組, 每則編碼微秒, 每則解碼微秒)"""
+    encoder = codec.PayloadCodec(name, threshold=threshold, use_dict=use_dict)
+    encoded = [encoder.encode(m) for m in messages]
+    assert all(codec.decode(e) == m for e, m in zip(encoded, messages)), "解碼結果不一致"
+    n = len(messages)
+    enc = _time(lambda: [encoder.encode(m) for m in messages], repeat) / n * 1e6
+    dec = _time(lambda: [codec.decode(e) for e in encoded], repeat) / n * 1e6
+    return sum(len(e) for e in encoded), enc, dec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="訊息壓縮的 CPU 與位元組比較")
+    parser.add_argument('--kinds', default="basic,vibration,spectrum",
+                        help='訊息種類：basic、vibration、spectrum(1000 點 JSON 頻譜) (默認: 全部)')
+    parser.add_argument('--count', type=int, default=200, help='每種訊息的數量')
+    parser.add_argument('--threshold', type=int, default=codec.DEFAULT_THRESHOLD,
+                        help='不使用字典時的壓縮門檻（位元組）')
+    parser.add_argument('--repeat', type=int, default=3, help='計時重複次數，取最佳值')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    variants: List[Tuple[str, Optional[str], bool]] = [("none", None, False)]
+    for name in codec.available_codecs():
+        variants.append((name, name, False))
+        if codec.supports_dict(name):
+            variants.append((f"{name}+dict", name, True))
+    print(f"可用編碼器: {', '.join(codec.available_codecs())}")
+
+    print(f"{'訊息':<10} {'編碼器':<11} {'平均(bytes)':<12} {'比例':<8} {'編碼(us)':<10} 解碼(us)")
+    for kind in args.kinds.split(","):
+        messages = _messages(kind, args.count, args.seed)
+        raw = sum(len(m) for m in messages)
+        for label, name, use_dict in variants:
+            total, enc, dec = bench(messages, name, use_dict, args.threshold, args.repeat)
+            print(f"{kind:<10} {label:<11} {total / len(messages):<12.0f} {total / raw:<8.2f} "
+                  f"{enc:<10.1f} {dec:.1f}")
+
+
+if __name__ == "__main__":
+    main()
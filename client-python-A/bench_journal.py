@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+崩潰安全紀錄的額外開銷
+使用 local_bus 的程序內替身，比較不記錄、記錄（每批 fsync）時的批次吞吐量，
+並模擬中斷後以同一紀錄檔續跑
+"""
+
+import argparse
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from a_client import MQTTClient, CLIENT_ID
+from b_client_simulator import BMQTTClient
+from journal import Journal
+from local_bus import LocalBroker
+
+
+def run_batch(points: List[Tuple[float, float]], concurrency: int, delay: float,
+              journal_path: Optional[str] = None, fsync: bool = True,
+              stop_after: Optional[int] = None) -> Dict:
+    """以 concurrency 個線程送出點位；stop_after 模擬處理到一半中斷（不寫結束標記）"""
+    broker = LocalBroker()
+    b_client = BMQTTClient()
+    b_client.processing_delay = delay
+    b_client.setup_client(broker.client(b_client.client_id))
+    b_client.connect()
+    b_client.client.loop_start()
+
+    a_client = MQTTClient()
+    a_client.setup_client(broker.client(CLIENT_ID))
+    a_client.connect()
+    threading.Thread(target=a_client.start_loop, daemon=True).start()
+    while not (a_client.is_connected and b_client.is_connected):
+        time.sleep(0.01)
+
+    journal = Journal(journal_path, points, fsync=fsync) if journal_path else None
+    skipped = len(journal.state.completed) if journal else 0
+    indices = range(len(points) if stop_after is None else stop_after)
+
+    def one(i: int):
+        x, y = points[i]
+        if journal:
+            return a_client.send_point_journaled(journal, i, x, y, timeout=10.0, retries=0)
+        return a_client.send_point_and_wait(x, y, timeout=10.0, retries=0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, indices))
+    elapsed = time.perf_counter() - start
+
+    stats = None
+    if journal:
+        if stop_after is None:
+            journal.finish()
+        journal.close()
+        stats = journal.stats()
+    a_client.disconnect()
+    b_client.disconnect()
+    return {
+        "completed": sum(1 for r in results if r),
+        "skipped": skipped,
+        "processed": b_client.load_snapshot()["processed"],
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed > 0 else 0.0,
+        "journal": stats
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次紀錄（group commit fsync）開銷測試")
+    parser.add_argument('--requests', '-n', type=int, default=500, help='點位數 (默認: 500)')
+    parser.add_argument('--concurrency', '-c', type=int, default=16, help='A 端併發數 (默認: 16)')
+    parser.add_argument('--delay', type=float, default=0.1, help='B 每點處理秒數 (默認: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3, help='重複次數，取最佳吞吐量')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    points = [(float(i % 50), float(i // 50)) for i in range(args.requests)]
+    tmpdir = tempfile.mkdtemp(prefix="journal_bench_")
+
+    base = max((run_batch(points, args.concurrency, args.delay) for _ in range(args.repeat)),
+               key=lambda r: r["throughput"])
+    print(f"{'模式':<14} {'吞吐量(點/s)':<14} {'開銷':<8} 紀錄")
+    print(f"{'不記錄':<14} {base['throughput']:<14.1f} {'-':<8}")
+    for label, fsync in (("記錄(無fsync)", False), ("記錄+fsync", True)):
+        runs = []
+        for _ in range(args.repeat):
+            path = tempfile.mktemp(suffix=".jsonl", dir=tmpdir)
+            runs.append(run_batch(points, args.concurrency, args.delay, path, fsync=fsync))
+        r = max(runs, key=lambda r: r["throughput"])
+        overhead = (base["throughput"] - r["throughput"]) / base["throughput"] * 100
+        print(f"{label:<14} {r['throughput']:<14.1f} {overhead:<7.1f}% {r['journal']}")
+
+    # 中斷後續跑：前一半完成後「崩潰」，再以同一紀錄檔執行整批
+    path = tempfile.mktemp(suffix=".jsonl", dir=tmpdir)
+    first = run_batch(points, args.concurrency, args.delay, path, stop_after=len(points) // 2)
+    second = run_batch(points, args.concurrency, args.delay, path)
+    print(f"續跑: 第一次完成 {first['completed']}，第二次略過 {second['skipped']}、"
+          f"B 處理 {second['processed']}、合計完成 {second['completed']}/{len(points)}")
+
+
+if __name__ == "__main__":
+    main()
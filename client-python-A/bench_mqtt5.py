@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+MQTT v3.1.1 與 v5 request/response 模式比較
+在同一程序內啟動 A 與 B 模擬器（處理延遲為 0）逐點往返：
+- 位元組：擷取 A 與 B 實際發出的 cmd/point 與結果（含 timing 等欄位、屬性與 topic alias），
+  計算每次往返的 PUBLISH 封包大小
+- 延遲：send_point_and_wait 往返時間；paho 未設定 TCP_NODELAY，小封包會被 Nagle 演算法
+  與延遲確認卡住約 40ms，預設在 on_socket_open 設定（--nagle 保留 paho 預設）
+未指定 --host 時在程序內啟動 mini_broker
+"""
+
+import argparse
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List, Tuple
+
+
+def _varint_len(n: int) -> int:
+    """MQTT 可變長度整數的位元組數"""
+    size = 1
+    while n >= 128:
+        n //= 128
+        size += 1
+    return size
+
+
+def publish_size(topic: str, payload: bytes, qos: int = 1, props=None, v5: bool = False) -> int:
+    """計算一個 PUBLISH 封包在線路上的總位元組數"""
+    remaining = 2 + len(topic.encode("utf-8")) + (2 if qos > 0 else 0) + len(payload)
+    if v5:
+        packed = props.pack() if props is not None else b"\x00"
+        remaining += len(packed)
+    return 1 + _varint_len(remaining) + remaining
+
+
+def _nodelay(client, userdata, sock):
+    if isinstance(sock, socket.socket):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _capture(paho_client, totals: Dict[str, int], key: str, match, v5: bool):
+    """包裝 paho 的 publish，累計符合 match(topic, props) 的 PUBLISH 封包大小"""
+    publish = paho_client.publish
+
+    def wrapper(topic, payload=None, qos=0, retain=False, properties=None):
+        if match(topic, properties):
+            data = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload or b"")
+            totals[key] += publish_size(topic, data, qos, properties, v5)
+        return publish(topic, payload, qos, retain, properties)
+
+    paho_client.publish = wrapper
+
+
+def _aliased(props) -> bool:
+    return props is not None and getattr(props, "TopicAlias", None) is not None
+
+
+def round_trips(protocol: str, rounds: int, timeout: float,
+                nodelay: bool = True) -> Tuple[List[float], Dict[str, int]]:
+    """啟動 A 與 B，逐點往返；回傳 (往返毫秒數, cmd/result 位元組)"""
+    from a_client import MQTTClient, TOP_CMD_POINT, TOP_RESULT
+    from b_client_simulator import BMQTTClient
+
+    b_client = BMQTTClient(protocol)
+    b_client.processing_delay = 0.0
+    b_client.setup_client()
+    a_client = MQTTClient(protocol)
+    a_client.setup_client()
+    v5 = a_client.is_v5
+    totals = {"cmd": 0, "result": 0}
+    # A 只對 cmd/point 使用 alias，B 只對回覆主題使用 alias
+    _capture(a_client.client, totals, "cmd",
+             lambda topic, props: topic == TOP_CMD_POINT or (not topic and _aliased(props)), v5)
+    _capture(b_client.client, totals, "result",
+             lambda topic, props: topic.startswith(TOP_RESULT) or (not topic and _aliased(props)), v5)
+    if nodelay:
+        a_client.client.on_socket_open = _nodelay
+        b_client.client.on_socket_open = _nodelay
+
+    if not (b_client.connect() and a_client.connect()):
+        raise RuntimeError("無法連接到 MQTT Broker")
+    b_client.client.loop_start()
+    threading.Thread(target=a_client.start_loop, daemon=True).start()
+
+    deadline = time.time() + 5
+    while not (a_client.is_connected and b_client.is_connected) and time.time() < deadline:
+        time.sleep(0.05)
+    if not (a_client.is_connected and b_client.is_connected):
+        raise RuntimeError(f"MQTT {protocol} 連線未建立（broker 是否支援此協議版本？）")
+    time.sleep(0.5)  # 等待訂閱生效與 B 的設定（壓縮宣告）送達
+
+    latencies = []
+    try:
+        for i in range(rounds):
+            start = time.perf_counter()
+            a_client.send_point_and_wait(float(i % 20), float(i % 7), timeout=timeout, retries=0)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        a_client.disconnect()
+        b_client.disconnect()
+        b_client.client.loop_stop()
+    return latencies, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT v3.1.1 / v5 request/response 比較")
+    parser.add_argument('--rounds', '-n', type=int, default=200, help='往返次數 (默認: 200)')
+    parser.add_argument('--timeout', type=float, default=5.0, help='單次等待逾時秒數')
+    parser.add_argument('--host', help='MQTT Broker 地址；未指定時在程序內啟動 mini_broker')
+    parser.add_argument('--port', type=int, help='MQTT Broker 端口 (默認讀取 MQTT_PORT)')
+    parser.add_argument('--nagle', action='store_true', help='不設定 TCP_NODELAY（paho 預設）')
+    parser.add_argument('--bytes-only', action='store_true', help='只列出位元組比較')
+    args = parser.parse_args()
+
+    # 客戶端模組在匯入時讀取環境變數
+    broker = None
+    if args.host:
+        os.environ["MQTT_BROKER_IP"] = args.host
+        if args.port:
+            os.environ["MQTT_PORT"] = str(args.port)
+    else:
+        from mini_broker import MiniBroker
+        broker = MiniBroker(host="127.0.0.1", port=0).start_background()
+        os.environ["MQTT_BROKER_IP"] = "127.0.0.1"
+        os.environ["MQTT_PORT"] = str(broker.ports["plain"])
+    import a_client, b_client_simulator  # noqa: F401  匯入後再調整日誌級別
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for protocol, name in (("311", "v3.1.1"), ("5", "v5")):
+        results[name] = round_trips(protocol, args.rounds, args.timeout, nodelay=not args.nagle)
+    if broker is not None:
+        broker.stop_background()
+
+    print(f"=== 位元組比較 ({args.rounds} 次往返，擷取實際送出的封包) ===")
+    per_trip = {}
+    for name, (_, totals) in results.items():
+        per_trip[name] = (totals["cmd"] + totals["result"]) / args.rounds
+        print(f"  {name:<8} cmd: {totals['cmd']:>8} B  result: {totals['result']:>8} B  "
+              f"每次往返: {per_trip[name]:.1f} B")
+    print(f"  v5 節省: {(1 - per_trip['v5'] / per_trip['v3.1.1']) * 100:.1f}%")
+
+    if args.bytes_only:
+        return
+
+    print(f"\n=== 延遲比較 ({args.rounds} 次往返，TCP_NODELAY: {'關' if args.nagle else '開'}) ===")
+    for name, (latencies, _) in results.items():
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+        print(f"  {name:<8} 平均: {statistics.mean(latencies):.2f} ms  "
+              f"p50: {statistics.median(latencies):.2f} ms  p95: {p95:.2f} ms")
+    if not args.nagle:
+        print("  註: 只設定客戶端的 TCP_NODELAY；Mosquitto 需在設定檔加 set_tcp_nodelay true，"
+              "否則 broker 轉送仍可能被 Nagle 延遲")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+B 端水平擴展測試
+使用 local_bus 的程序內共享訂閱替身，啟動 N 個共享 $share/<group>/ 的 B 模擬器，
+由單一 A 併發送出點位，量測吞吐量與各實例分攤的負載；
+--timeout 設得比排隊時間短時，可比較有無流量控制的重送量
+"""
+
+import argparse
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from a_client import MQTTClient, CLIENT_ID
+from b_client_simulator import BMQTTClient
+from flow_control import FlowController
+from local_bus import LocalBroker
+from sim_engine import SimulatorEngine, parse_latency_model
+
+
+def run_scale(instances: int, requests: int, concurrency: int, delay: float,
+              protocol: str, group: str = "sim", latency: Optional[str] = None,
+              seed: Optional[int] = None, timeout: float = 30.0, flow: bool = True) -> Dict:
+    """以 N 個 B 實例處理 requests 個點位，回傳吞吐量與負載分佈"""
+    broker = LocalBroker()
+
+    b_clients = []
+    for i in range(instances):
+        engine = SimulatorEngine(
+            seed=None if seed is None else seed + i,
+            latency=parse_latency_model(latency) if latency else None
+        )
+        b_client = BMQTTClient(protocol, share_group=group, instance_id=f"b{i}",
+                               max_concurrency=1, engine=engine)
+        b_client.processing_delay = delay
+        b_client.setup_client(broker.client(b_client.client_id))
+        b_client.connect()
+        b_client.client.loop_start()
+        b_clients.append(b_client)
+
+    a_client = MQTTClient(protocol)
+    a_client.flow = FlowController(enabled=flow)
+    a_client.setup_client(broker.client(CLIENT_ID))
+    a_client.connect()
+    threading.Thread(target=a_client.start_loop, daemon=True).start()
+    while not (a_client.is_connected and all(b.is_connected for b in b_clients)):
+        time.sleep(0.01)
+
+    def one(i: int):
+        try:
+            return a_client.send_point_and_wait(float(i % 50), float(i // 50),
+                                                timeout=timeout, retries=2)
+        except TimeoutError:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    # 結果依 req_id 回到 A，metadata.instance 標示實際處理的實例
+    served_by = Counter(r["metadata"]["instance"] for r in results if r)
+    # 重送的點位會被 B 重複處理，等 B 處理完剩餘的排隊再統計
+    while any(b.load_snapshot()["in_flight"] or b.load_snapshot()["queued"] for b in b_clients):
+        time.sleep(0.01)
+    loads = {b.instance_id: b.load_snapshot()["processed"] for b in b_clients}
+
+    a_client.disconnect()
+    for b_client in b_clients:
+        b_client.disconnect()
+    return {
+        "instances": instances,
+        "completed": sum(1 for r in results if r),
+        "elapsed": elapsed,
+        "throughput": requests / elapsed if elapsed > 0 else 0.0,
+        "served_by": dict(served_by),
+        "loads": loads,
+        "processed": sum(loads.values()),
+        "flow": a_client.flow.snapshot()["mode"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="B 端共享訂閱水平擴展測試（程序內替身）")
+    parser.add_argument('--instances', default="1,2,4,8", help='B 實例數列表 (默認: 1,2,4,8)')
+    parser.add_argument('--requests', '-n', type=int, default=200, help='點位數 (默認: 200)')
+    parser.add_argument('--concurrency', '-c', type=int, default=32, help='A 端併發數 (默認: 32)')
+    parser.add_argument('--delay', type=float, default=0.02, help='每點模擬處理秒數 (默認: 0.02)')
+    parser.add_argument('--protocol', choices=['311', '5'], default='311', help='MQTT 協議版本')
+    parser.add_argument('--latency', metavar='SPEC', help='B 端延遲模型 (見 sim_engine.parse_latency_model)')
+    parser.add_argument('--seed', type=int, help='隨機種子，各實例使用 seed + 實例序號')
+    parser.add_argument('--timeout', type=float, default=30.0, help='A 端單次等待秒數 (默認: 30)')
+    parser.add_argument('--no-flow', action='store_true', help='關閉 A 端流量控制（逾時即重送）')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{'實例數':<8} {'流控':<8} {'完成':<8} {'B處理':<8} {'耗時(s)':<10} {'吞吐量(點/s)':<14} 各實例處理數")
+    for n in (int(v) for v in args.instances.split(",")):
+        r = run_scale(n, args.requests, args.concurrency, args.delay, args.protocol,
+                      latency=args.latency, seed=args.seed, timeout=args.timeout,
+                      flow=not args.no_flow)
+        print(f"{r['instances']:<8} {r['flow']:<8} {r['completed']:<8} {r['processed']:<8} "
+              f"{r['elapsed']:<10.2f} {r['throughput']:<14.1f} {r['loads']}")
+        if r["processed"] == r["completed"] and r["served_by"] != r["loads"]:
+            print(f"  警告: 結果來源 {r['served_by']} 與實例回報負載不一致")
+
+
+if __name__ == "__main__":
+    main()
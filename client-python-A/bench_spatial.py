@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+空間索引的查詢效能與 IDW 估計誤差
+以合成的平滑特徵場比較線性掃描與格點分桶索引的 k 近鄰/半徑查詢時間，
+並統計不同半徑下可略過量測的比例與估計誤差
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import Callable, List, Tuple
+
+from spatial_index import SpatialIndex
+
+
+def field(x: float, y: float) -> float:
+    return math.sin(x / 20) + math.cos(y / 15) + 0.01 * x
+
+
+def timed(fn: Callable, queries: List[Tuple[float, float]]) -> float:
+    """每次查詢的平均微秒數"""
+    start = time.perf_counter()
+    for x, y in queries:
+        fn(x, y)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="空間索引查詢與 IDW 估計測試")
+    parser.add_argument('--points', '-n', type=int, default=20000, help='已量測點數 (默認: 20000)')
+    parser.add_argument('--queries', '-q', type=int, default=500, help='查詢數 (默認: 500)')
+    parser.add_argument('--extent', type=float, default=100.0, help='掃描範圍半寬 (默認: 100)')
+    parser.add_argument('--k', type=int, default=8, help='近鄰數 (默認: 8)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    e = args.extent
+    points = [(rng.uniform(-e, e), rng.uniform(-e, e)) for _ in range(args.points)]
+    queries = [(rng.uniform(-e, e), rng.uniform(-e, e)) for _ in range(args.queries)]
+
+    index = SpatialIndex()
+    index.configure({"scan_area": {"x_min": -e, "x_max": e, "y_min": -e, "y_max": e}})
+    start = time.perf_counter()
+    for x, y in points:
+        index.insert(x, y, {"f": field(x, y)})
+    insert_us = (time.perf_counter() - start) / len(points) * 1e6
+
+    radius = 4 * e / math.sqrt(len(points))
+    linear_knn = timed(lambda qx, qy: sorted((math.hypot(x - qx, y - qy), i)
+                                             for i, (x, y) in enumerate(points))[:args.k], queries)
+    linear_radius = timed(lambda qx, qy: [i for i, (x, y) in enumerate(points)
+                                          if math.hypot(x - qx, y - qy) <= radius], queries)
+    print(f"點數 {len(points)}，格寬 {index.cell_size:.3g}，新增 {insert_us:.1f} µs/點")
+    print(f"{'查詢':<18} {'線性掃描(µs)':>14} {'索引(µs)':>10} {'加速':>8}")
+    for label, linear, fn in (
+        (f"{args.k} 近鄰", linear_knn, lambda x, y: index.nearest(x, y, args.k)),
+        (f"半徑 {radius:.2f}", linear_radius, lambda x, y: index.within(x, y, radius)),
+        (f"IDW k={args.k}", None, lambda x, y: index.interpolate(x, y, k=args.k)),
+    ):
+        t = timed(fn, queries)
+        if linear:
+            print(f"{label:<18} {linear:>14.1f} {t:>10.1f} {linear / t:>7.1f}x")
+        else:
+            print(f"{label:<18} {'-':>14} {t:>10.1f} {'-':>8}")
+
+    print(f"\n{'半徑':<8} {'可估計比例':>10} {'平均誤差':>10} {'最大誤差':>10}")
+    for r in (radius / 2, radius, radius * 2):
+        errors = []
+        for x, y in queries:
+            est = index.interpolate(x, y, k=args.k, radius=r)
+            if est and est["neighbors"] >= 3:
+                errors.append(abs(est["values"]["f"] - field(x, y)))
+        ratio = len(errors) / len(queries)
+        mean = sum(errors) / len(errors) if errors else float('nan')
+        print(f"{r:<8.2f} {ratio:>10.1%} {mean:>10.4f} {max(errors, default=float('nan')):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+純 TCP、TLS（完整握手）與 TLS session 續用的連線延遲與吞吐量比較
+- 連線延遲：connect() 到收到 CONNACK，每次使用新的 paho client（模擬重新連線風暴）
+- 吞吐量：單一連線送出 QoS 1 PUBLISH，直到全部收到 PUBACK
+未指定 --host 時以 broker/generate_certs.sh 生成自簽憑證，並在程序內啟動 mini_broker
+（純 TCP 與 TLS 兩個端口）；指定 --host 時連線到實際的 broker，例如 broker/docker-compose-tls.yml 啟動的 Mosquitto
+"""
+
+import argparse
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import time
+from typing import List, Optional
+
+import paho.mqtt.client as mqtt
+
+import tls
+from mini_broker import MiniBroker
+
+CERT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "broker", "generate_certs.sh")
+
+
+def _client(name: str, context: Optional[ssl.SSLContext], insecure: bool) -> mqtt.Client:
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=name, clean_session=True)
+    if context is not None:
+        client.tls_set_context(context)
+        if insecure:
+            client.tls_insecure_set(True)
+    return client
+
+
+def _wait(client: mqtt.Client, done, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("broker 未回應")
+        client.loop(0.05)
+
+
+def measure_connect(host: str, port: int, context: Optional[ssl.SSLContext], rounds: int,
+                    insecure: bool, warmup: int = 1) -> List[float]:
+    """rounds 次新連線的 connect → CONNACK 毫秒數（不計 warmup）"""
+    samples = []
+    for i in range(warmup + rounds):
+        client = _client(f"bench-tls-{os.getpid()}-{i}", context, insecure)
+        connected = []
+        client.on_connect = lambda c, u, f, rc, p=None: connected.append(rc)
+        start = time.perf_counter()
+        client.connect(host, port, keepalive=30)
+        _wait(client, lambda: connected, 10.0)
+        elapsed = time.perf_counter() - start
+        client.disconnect()
+        client.loop(0.01)
+        if i >= warmup:
+            samples.append(elapsed * 1000)
+    return samples
+
+
+def measure_throughput(host: str, port: int, context: Optional[ssl.SSLContext], messages: int,
+                       size: int, insecure: bool) -> float:
+    """單一連線送出 messages 個 QoS 1 訊息，回傳每秒完成的訊息數"""
+    client = _client(f"bench-tls-pub-{os.getpid()}", context, insecure)
+    client.max_inflight_messages_set(256)
+    client.max_queued_messages_set(0)
+    connected, acked = [], [0]
+    client.on_connect = lambda c, u, f, rc, p=None: connected.append(rc)
+
+    def on_publish(c, u, mid, rc=None, p=None):
+        acked[0] += 1
+
+    client.on_publish = on_publish
+    client.connect(host, port, keepalive=30)
+    _wait(client, lambda: connected, 10.0)
+    client.loop_start()
+    payload = os.urandom(size)
+    start = time.perf_counter()
+    for _ in range(messages):
+        client.publish("bench/tls", payload, qos=1)
+    deadline = time.perf_counter() + 60
+    while acked[0] < messages and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    client.loop_stop()
+    return acked[0] / elapsed
+
+
+def _generate_certs(directory: str):
+    subprocess.run(["bash", CERT_SCRIPT, directory], check=True, stdout=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TLS 與 session 續用的連線延遲/吞吐量測試")
+    parser.add_argument('--host', help='實際 broker 位址；未指定時於程序內啟動 mini_broker')
+    parser.add_argument('--port', type=int, default=4883, help='純 TCP 端口 (默認: 4883)')
+    parser.add_argument('--tls-port', type=int, default=tls.TLS_PORT,
+                        help=f'TLS 端口 (默認: {tls.TLS_PORT})')
+    parser.add_argument('--cafile', help='CA 憑證；本機模式默認使用生成的 ca.crt')
+    parser.add_argument('--certs', help='本機模式使用此目錄下已有的 ca.crt/server.crt/server.key')
+    parser.add_argument('--tls-insecure', action='store_true', help='不比對 broker 主機名')
+    parser.add_argument('--connects', '-n', type=int, default=50, help='每種模式的連線次數 (默認: 50)')
+    parser.add_argument('--messages', '-m', type=int, default=5000, help='吞吐量測試訊息數 (默認: 5000)')
+    parser.add_argument('--size', type=int, default=256, help='訊息大小（位元組，默認: 256）')
+    args = parser.parse_args()
+
+    tmp = None
+    host, ports = args.host, {"plain": args.port, "tls": args.tls_port}
+    cafile = args.cafile
+    if host is None:
+        certs = args.certs
+        if certs is None:
+            tmp = tempfile.TemporaryDirectory()
+            certs = tmp.name
+            _generate_certs(certs)
+        server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_ctx.load_cert_chain(os.path.join(certs, "server.crt"), os.path.join(certs, "server.key"))
+        broker = MiniBroker(port=0, ssl_context=server_ctx, tls_port=0).start_background()
+        host, ports = "localhost", broker.ports
+        cafile = cafile or os.path.join(certs, "ca.crt")
+        print(f"本機 broker: 純 TCP {ports['plain']}，TLS {ports['tls']}（自簽憑證 {certs}）")
+
+    modes = {
+        "plain": (ports["plain"], None),
+        "tls": (ports["tls"], tls.create_context(cafile or "", insecure=args.tls_insecure, resume=False)),
+        "tls-resumed": (ports["tls"], tls.create_context(cafile or "", insecure=args.tls_insecure)),
+    }
+    print(f"\n{'模式':<12} {'連線 p50(ms)':>13} {'p99(ms)':>9} {'平均(ms)':>9} {'續用':>7} {'吞吐(msg/s)':>12}")
+    for name, (port, context) in modes.items():
+        samples = measure_connect(host, port, context, args.connects, args.tls_insecure)
+        rate = measure_throughput(host, port, context, args.messages, args.size, args.tls_insecure)
+        samples.sort()
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        resumed = "-"
+        if isinstance(context, tls.ResumingContext) and context.resume:
+            s = context.stats()
+            resumed = f"{s['resumed']}/{s['handshakes']}"
+        print(f"{name:<12} {statistics.median(samples):>13.2f} {p99:>9.2f} {statistics.mean(samples):>9.2f} "
+              f"{resumed:>7} {rate:>12.0f}")
+    if tmp is not None:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
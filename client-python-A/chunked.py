@@ -0,0 +1,196 @@
+"""
+大型頻譜的分塊傳輸格式
+B 端將陣列切成帶序號的二進位分塊（同一 req_id），A 端直接寫入預先配置的 NumPy 緩衝區，
+並能偵測缺少的分塊以便要求重送
+
+分塊格式（little endian）:
+    magic "CK" | version u8 | dtype u8 | seq u32 | total u32 | length u32 | offset u32
+    | id_len u8 | req_id (UTF-8) | 原始陣列資料
+"""
+
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+MAGIC = b"CK"
+VERSION = 1
+_HEADER = struct.Struct("<2sBBIIIIB")
+
+DTYPES: Dict[int, np.dtype] = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f8"),
+    3: np.dtype("<i2"),
+    4: np.dtype("<i4"),
+}
+_DTYPE_CODES = {dt: code for code, dt in DTYPES.items()}
+
+
+class ChunkHeader:
+    """已解析的分塊標頭"""
+    __slots__ = ("req_id", "dtype", "seq", "total", "length", "offset", "data_offset")
+
+    def __init__(self, req_id: str, dtype: np.dtype, seq: int, total: int,
+                 length: int, offset: int, data_offset: int):
+        self.req_id = req_id
+        self.dtype = dtype
+        self.seq = seq
+        self.total = total
+        self.length = length
+        self.offset = offset
+        self.data_offset = data_offset
+
+
+def is_chunk(payload: bytes) -> bool:
+    return payload[:2] == MAGIC
+
+
+def describe(array: np.ndarray, chunk_elements: int) -> Dict:
+    """結果 JSON 內取代陣列的描述"""
+    return {
+        "encoding": "chunked",
+        "dtype": np.dtype(array.dtype).name,
+        "length": int(array.size),
+        "chunks": chunk_count(array.size, chunk_elements)
+    }
+
+
+def chunk_count(length: int, chunk_elements: int) -> int:
+    return max(1, -(-length // chunk_elements))
+
+
+def encode_chunks(req_id: str, array: np.ndarray, chunk_elements: int,
+                  seqs: Optional[Iterable[int]] = None) -> List[bytes]:
+    """將一維陣列切成分塊；seqs 指定只產生部分序號（重送用）"""
+    flat = np.ascontiguousarray(array).reshape(-1)
+    code = _DTYPE_CODES.get(flat.dtype.newbyteorder("<"))
+    if code is None:
+        raise ValueError(f"不支援的陣列型別: {flat.dtype}")
+    flat = flat.astype(DTYPES[code], copy=False)
+    rid = req_id.encode("utf-8")
+    total = chunk_count(flat.size, chunk_elements)
+    chunks = []
+    for seq in (range(total) if seqs is None else seqs):
+        if not 0 <= seq < total:
+            continue
+        offset = seq * chunk_elements
+        header = _HEADER.pack(MAGIC, VERSION, code, seq, total, flat.size, offset, len(rid))
+        chunks.append(header + rid + flat[offset:offset + chunk_elements].tobytes())
+    return chunks
+
+
+def parse_header(payload: bytes) -> ChunkHeader:
+    magic, version, code, seq, total, length, offset, id_len = _HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("不是有效的分塊訊息")
+    if code not in DTYPES:
+        raise ValueError(f"未知的資料型別代碼: {code}")
+    start = _HEADER.size
+    req_id = bytes(payload[start:start + id_len]).decode("utf-8")
+    return ChunkHeader(req_id, DTYPES[code], seq, total, length, offset, start + id_len)
+
+
+class ChunkAssembler:
+    """單一陣列的重組：資料從訊息 payload 直接複製進預先配置的緩衝區"""
+
+    def __init__(self, length: int, dtype: np.dtype, total: int):
+        self.buffer = np.empty(length, dtype=dtype)
+        self.total = total
+        self._received = np.zeros(total, dtype=bool)
+        self.count = 0
+        self.created = time.monotonic()
+
+    def add(self, header: ChunkHeader, payload: bytes) -> bool:
+        """寫入一個分塊，回傳是否已完整；重複分塊會被忽略"""
+        if header.seq >= self.total or self._received[header.seq]:
+            return self.complete
+        # frombuffer 只建立 payload 的視圖，唯一的複製是寫入緩衝區
+        data = np.frombuffer(payload, dtype=self.buffer.dtype, offset=header.data_offset)
+        end = min(header.offset + data.size, self.buffer.size)
+        self.buffer[header.offset:end] = data[:end - header.offset]
+        self._received[header.seq] = True
+        self.count += 1
+        return self.complete
+
+    @property
+    def complete(self) -> bool:
+        return self.count == self.total
+
+    def missing(self) -> List[int]:
+        return np.flatnonzero(~self._received).tolist()
+
+
+class ChunkReassembler:
+    """依 req_id 管理多個重組中的陣列，逾時未完成的會被清除"""
+
+    def __init__(self, max_age: float = 60.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._assemblers: Dict[str, ChunkAssembler] = {}
+
+    def feed(self, payload: bytes, accept=None) -> Optional[Tuple[str, bool]]:
+        """
+        處理一個分塊訊息，回傳 (req_id, 是否完整)
+        accept(req_id) 回傳 False 時略過（例如不是自己送出的請求）
+        """
+        header = parse_header(payload)
+        if accept is not None and not accept(header.req_id):
+            return None
+        with self._lock:
+            assembler = self._assemblers.get(header.req_id)
+            if assembler is None:
+                self._expire()
+                assembler = ChunkAssembler(header.length, header.dtype, header.total)
+                self._assemblers[header.req_id] = assembler
+            return header.req_id, assembler.add(header, payload)
+
+    def is_complete(self, req_id: str) -> bool:
+        with self._lock:
+            assembler = self._assemblers.get(req_id)
+            return bool(assembler and assembler.complete)
+
+    def missing(self, req_id: str, total: int) -> List[int]:
+        """缺少的分塊序號；尚未收到任何分塊時為全部"""
+        with self._lock:
+            assembler = self._assemblers.get(req_id)
+            return assembler.missing() if assembler else list(range(total))
+
+    def take(self, req_id: str) -> Optional[np.ndarray]:
+        """取出已完整的陣列"""
+        with self._lock:
+            assembler = self._assemblers.get(req_id)
+            if assembler and assembler.complete:
+                del self._assemblers[req_id]
+                return assembler.buffer
+            return None
+
+    def discard(self, req_id: str):
+        with self._lock:
+            self._assemblers.pop(req_id, None)
+
+    def _expire(self):
+        now = time.monotonic()
+        for rid in [r for r, a in self._assemblers.items() if now - a.created > self.max_age]:
+            del self._assemblers[rid]
+
+
+class ChunkCache:
+    """B 端保留最近送出的陣列，供 A 要求重送缺少的分塊"""
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[np.ndarray, str]]" = OrderedDict()
+
+    def put(self, req_id: str, array: np.ndarray, topic: str):
+        with self._lock:
+            self._items[req_id] = (array, topic)
+            self._items.move_to_end(req_id)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def get(self, req_id: str) -> Optional[Tuple[np.ndarray, str]]:
+        with self._lock:
+            return self._items.get(req_id)
@@ -0,0 +1,173 @@
+"""
+A/B 時鐘偏移估計與延遲分解
+move_point 與 result_feature_set 以 time.time_ns() 標記四個時間點：
+    t_send_ns   A 發送 cmd/point（A 時鐘）
+    t_recv_ns   B 收到 cmd/point（B 時鐘）
+    t_start_ns  B 取得處理名額、開始量測（B 時鐘）
+    t_reply_ns  B 發送結果（B 時鐘）
+加上 A 收到結果的時間 t_arrive_ns，以 NTP 公式估計偏移（B − A）與往返網路延遲，
+再把單一請求的延遲分解為 network_out / queue / processing / network_back
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from correlator import LatencySketch
+
+COMPONENTS = ("network_out", "queue", "processing", "network_back", "total")
+
+
+def now_ns() -> int:
+    return time.time_ns()
+
+
+def received_ns(msg) -> int:
+    """
+    收到訊息的 wall clock 時間；msg.timestamp 為 time.monotonic()
+    paho 在呼叫回調前才設定，結果約等於回調開始時間；local_bus 在排入時設定，可扣除回調前的排隊
+    """
+    now = time.time_ns()
+    stamp = getattr(msg, "timestamp", None)
+    if not stamp:
+        return now
+    return now - max(0, int((time.monotonic() - stamp) * 1e9))
+
+
+class ClockSync:
+    """
+    NTP 式偏移與漂移估計（單一 B 時鐘相對 A 時鐘）
+    offset = ((t2 - t1) + (t3 - t4)) / 2，delay = (t4 - t1) - (t3 - t2)
+    偏移取最近 filter_size 個樣本中網路延遲最小者（NTP clock filter），
+    漂移以延遲較低的一半樣本對時間做最小平方迴歸
+    """
+
+    def __init__(self, window: int = 64, filter_size: int = 8, min_span: float = 1.0):
+        self.filter_size = filter_size
+        self.min_span_ns = int(min_span * 1e9)
+        self._samples: Deque[Tuple[int, int, int]] = deque(maxlen=window)  # (t1, offset, delay)
+        self.rejected = 0
+
+    def add(self, t1: int, t2: int, t3: int, t4: int) -> Optional[Tuple[int, int]]:
+        """加入一次交換，回傳 (offset_ns, delay_ns)；時間點不一致（延遲為負）時捨棄"""
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0 or t3 < t2:
+            self.rejected += 1
+            return None
+        offset = ((t2 - t1) + (t3 - t4)) // 2
+        self._samples.append((t1, offset, delay))
+        return offset, delay
+
+    def _best(self) -> Optional[Tuple[int, int, int]]:
+        recent = list(self._samples)[-self.filter_size:]
+        return min(recent, key=lambda s: s[2]) if recent else None
+
+    def drift(self) -> Optional[float]:
+        """B 時鐘相對 A 的頻率差（ns/ns）；樣本不足或時間跨度太短時為 None"""
+        samples = sorted(self._samples, key=lambda s: s[2])[:max(2, len(self._samples) // 2)]
+        if len(samples) < 4:
+            return None
+        base = samples[0][0]
+        xs = [s[0] - base for s in samples]
+        if max(xs) - min(xs) < self.min_span_ns:
+            return None
+        ys = [s[1] for s in samples]
+        mx = sum(xs) / len(xs)
+        my = sum(ys) / len(ys)
+        var = sum((x - mx) ** 2 for x in xs)
+        return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / var if var else None
+
+    def offset(self, at_ns: Optional[int] = None) -> Optional[float]:
+        """at_ns（A 時鐘）時的估計偏移；有漂移估計時以參考樣本外插"""
+        best = self._best()
+        if best is None:
+            return None
+        t1, offset, _ = best
+        drift = self.drift() if at_ns is not None else None
+        return offset + drift * (at_ns - t1) if drift is not None else float(offset)
+
+    def snapshot(self) -> Dict[str, Any]:
+        best = self._best()
+        drift = self.drift()
+        return {
+            "samples": len(self._samples),
+            "rejected": self.rejected,
+            "offset_ms": round(best[1] / 1e6, 3) if best else None,
+            "min_delay_ms": round(best[2] / 1e6, 3) if best else None,
+            "drift_ppm": round(drift * 1e6, 3) if drift is not None else None
+        }
+
+
+def breakdown(timing: Dict[str, int], arrive_ns: int, offset_ns: float) -> Dict[str, float]:
+    """單一請求的延遲分解（毫秒）；各段總和等於 total"""
+    t1, t2 = timing["t_send_ns"], timing["t_recv_ns"]
+    start, t3 = timing.get("t_start_ns", t2), timing["t_reply_ns"]
+    return {
+        "network_out": round((t2 - offset_ns - t1) / 1e6, 3),
+        "queue": round((start - t2) / 1e6, 3),
+        "processing": round((t3 - start) / 1e6, 3),
+        "network_back": round((arrive_ns - (t3 - offset_ns)) / 1e6, 3),
+        "total": round((arrive_ns - t1) / 1e6, 3)
+    }
+
+
+class LatencyBreakdown:
+    """依 B 實例維護時鐘估計，並累積各延遲成分的分布"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clocks: Dict[str, ClockSync] = {}
+        self._sketches = {name: LatencySketch() for name in COMPONENTS}
+
+    def add(self, timing: Optional[Dict[str, Any]], arrive_ns: int,
+            source: str = "B") -> Optional[Dict[str, float]]:
+        """加入一筆結果的時間標記；舊版 B 未帶 timing 時回傳 None"""
+        if not timing or not all(k in timing for k in ("t_send_ns", "t_recv_ns", "t_reply_ns")):
+            return None
+        with self._lock:
+            clock = self.clocks.get(source)
+            if clock is None:
+                clock = self.clocks[source] = ClockSync()
+            clock.add(timing["t_send_ns"], timing["t_recv_ns"], timing["t_reply_ns"], arrive_ns)
+            offset = clock.offset(timing["t_send_ns"])
+            if offset is None:
+                return None
+            parts = breakdown(timing, arrive_ns, offset)
+            for name, value in parts.items():
+                self._sketches[name].add(max(0.0, value) / 1000)
+        return parts
+
+    def __getstate__(self):
+        # 多程序批次的 worker 結束時把統計傳回主程序
+        with self._lock:
+            return {"clocks": dict(self.clocks), "sketches": dict(self._sketches)}
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self.clocks = state["clocks"]
+        self._sketches = state["sketches"]
+
+    def merge(self, other: "LatencyBreakdown", label: str = ""):
+        """併入另一個 client 的統計；時鐘估計以 "<實例><label>" 分開保留"""
+        state = other.__getstate__()
+        with self._lock:
+            for name, sketch in state["sketches"].items():
+                self._sketches[name].merge(sketch)
+            for source, clock in state["clocks"].items():
+                self.clocks[f"{source}{label}"] = clock
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "components_ms": {
+                    name: {
+                        "count": s.count,
+                        "mean": round(s.total / s.count * 1000, 3) if s.count else 0.0,
+                        "p50": round(s.quantile(0.5) * 1000, 3),
+                        "p99": round(s.quantile(0.99) * 1000, 3)
+                    }
+                    for name, s in self._sketches.items()
+                },
+                "clocks": {source: clock.snapshot() for source, clock in self.clocks.items()}
+            }
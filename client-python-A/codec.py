@@ -0,0 +1,164 @@
+"""
+訊息壓縮編解碼
+JSON 訊息可選擇性壓縮：zlib 永遠可用，安裝 zstandard / lz4 時可使用更快的編碼器。
+壓縮後的 payload 以 b"\\x00Z" 開頭（JSON 以 "{" 開頭、頻譜分塊以 "CK" 開頭，不會混淆），
+接收端依標頭透明解碼。小型且高度重複的 result_feature_set 可使用共用的預訓練字典
+"""
+
+import json
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # 選用套件
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # 選用套件
+    lz4_frame = None
+
+MAGIC = b"\x00Z"
+CODEC_IDS = {"zlib": 1, "zstd": 2, "lz4": 3}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+PREFERENCE = ("zstd", "lz4", "zlib")   # 協商時的優先順序（快者優先）
+DEFAULT_THRESHOLD = 512                # 無字典時，小於此位元組數的訊息不壓縮
+
+# 共用字典：由 result_feature_set / move_point 的固定欄位組成，
+# 常見字串放在後段（deflate 對距離較近的內容編碼較短）
+RESULT_DICT_ID = 1
+RESULT_DICT = "".join([
+    '"spectrum": {"encoding": "chunked", "dtype": "float32", "length": 1000, "chunks": 1}, ',
+    '"sampling_rate": 1000, "analysis_info": {"duration_ms": 200, "data_points": 200, ',
+    '"algorithm_version": "v2.1.0"}, ',
+    '"features": ["Time_skewness_y", "Time_kurtosis_y", "Time_rms_y", "Time_crestfactor_y", ',
+    '"Powerspectrum_skewness_y", "Powerspectrum_kurtosis_y", "Powerspectrum_rms_y", ',
+    '"Powerspectrum_crestfactor_y"], ',
+    '{"type": "move_point", "point": {"x": 0.0, "y": 0.0}, "ts": 1700000000, "sender": "A", "req_id": "',
+    '"metadata": {"processing_time": 2.0, "quality": "good", "sensor_status": "normal", "instance": null}, ',
+    '{"type": "result_feature_set", "point": {"x": 0.0, "y": 0.0}, ',
+    '"features": ["temperature", "pressure", "vibration", "speed"], "values": [',
+    '], "ts": 1700000000, "sender": "B", "req_id": "',
+]).encode("utf-8")
+
+_DICTIONARIES = {RESULT_DICT_ID: RESULT_DICT}
+_zstd_dicts: Dict[int, Any] = {}
+
+
+def available_codecs() -> List[str]:
+    """本機可用的編碼器"""
+    codecs = ["zlib"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4_frame is not None:
+        codecs.append("lz4")
+    return codecs
+
+
+def supports_dict(codec: str) -> bool:
+    return codec in ("zlib", "zstd")
+
+
+def is_compressed(payload: bytes) -> bool:
+    return payload[:2] == MAGIC
+
+
+def negotiate(remote: Optional[Iterable[str]], preferred: Iterable[str] = PREFERENCE) -> Optional[str]:
+    """挑選雙方都支援的編碼器；對方未宣告時不壓縮"""
+    if not remote:
+        return None
+    local, remote = set(available_codecs()), set(remote)
+    for codec in preferred:
+        if codec in local and codec in remote:
+            return codec
+    return None
+
+
+def advertisement(threshold: int = DEFAULT_THRESHOLD) -> Dict[str, Any]:
+    """放入 config/setting 或 status 的壓縮能力宣告"""
+    return {
+        "codecs": available_codecs(),
+        "threshold": threshold,
+        "dictionaries": sorted(_DICTIONARIES)
+    }
+
+
+def _zstd_dict(dict_id: int):
+    if dict_id not in _zstd_dicts:
+        _zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(
+            _DICTIONARIES[dict_id], dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    return _zstd_dicts[dict_id]
+
+
+def _compress(codec: str, raw: bytes, dict_id: int, level: Optional[int]) -> bytes:
+    if codec == "zlib":
+        zdict = _DICTIONARIES.get(dict_id)
+        args = (zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15, 9,
+                zlib.Z_DEFAULT_STRATEGY)
+        comp = zlib.compressobj(*args, zdict=zdict) if zdict else zlib.compressobj(*args)
+        return comp.compress(raw) + comp.flush()
+    if codec == "zstd":
+        kwargs = {"level": 3 if level is None else level}
+        if dict_id:
+            kwargs["dict_data"] = _zstd_dict(dict_id)
+        return zstandard.ZstdCompressor(**kwargs).compress(raw)
+    if codec == "lz4":
+        return lz4_frame.compress(raw, compression_level=0 if level is None else level)
+    raise ValueError(f"未知的編碼器: {codec}")
+
+
+def decode(payload: bytes) -> bytes:
+    """還原 payload；未壓縮的 payload 原樣回傳"""
+    if not is_compressed(payload):
+        return payload
+    codec = CODEC_NAMES.get(payload[2])
+    dict_id = payload[3]
+    body = payload[4:]
+    if dict_id and dict_id not in _DICTIONARIES:
+        raise ValueError(f"未知的壓縮字典: {dict_id}")
+    if codec == "zlib":
+        zdict = _DICTIONARIES.get(dict_id)
+        decomp = zlib.decompressobj(-15, zdict=zdict) if zdict else zlib.decompressobj(-15)
+        return decomp.decompress(body) + decomp.flush()
+    if codec == "zstd" and zstandard is not None:
+        kwargs = {"dict_data": _zstd_dict(dict_id)} if dict_id else {}
+        return zstandard.ZstdDecompressor(**kwargs).decompress(body)
+    if codec == "lz4" and lz4_frame is not None:
+        return lz4_frame.decompress(body)
+    raise ValueError(f"無法解碼的編碼器: {codec or payload[2]}（未安裝？）")
+
+
+def loads(payload: bytes) -> Any:
+    """解碼並解析 JSON 訊息"""
+    return json.loads(decode(payload).decode("utf-8"))
+
+
+class PayloadCodec:
+    """
+    發送端編碼器
+    codec 為 None 時不壓縮；壓縮後未變小時仍送出原始 JSON
+    """
+
+    def __init__(self, codec: Optional[str] = None, threshold: int = DEFAULT_THRESHOLD,
+                 use_dict: bool = True, level: Optional[int] = None):
+        if codec is not None and codec not in available_codecs():
+            raise ValueError(f"編碼器 {codec} 無法使用，可用: {available_codecs()}")
+        self.codec = codec
+        self.threshold = threshold
+        self.dict_id = RESULT_DICT_ID if codec and use_dict and supports_dict(codec) else 0
+        self.level = level
+
+    def encode(self, data: Union[Dict, str, bytes]) -> bytes:
+        if isinstance(data, bytes):
+            raw = data
+        elif isinstance(data, str):
+            raw = data.encode("utf-8")
+        else:
+            raw = json.dumps(data).encode("utf-8")
+        # 有字典時小訊息也值得壓縮；沒有字典時低於門檻直接送出
+        if self.codec is None or (len(raw) < self.threshold and not self.dict_id):
+            return raw
+        framed = MAGIC + bytes((CODEC_IDS[self.codec], self.dict_id)) + \
+            _compress(self.codec, raw, self.dict_id, self.level)
+        return framed if len(framed) < len(raw) else raw
@@ -0,0 +1,225 @@
+"""
+請求/結果關聯與延遲統計
+監控端依 req_id 配對 cmd/point 與 telemetry/result，不需要在各客戶端加入量測程式碼：
+- 未配對的請求放在有上限、會逾期的表中，逾期視為遺失
+- 每個設備以固定記憶體的對數分桶直方圖估計延遲百分位數
+- 以 Prometheus 文字格式輸出
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional
+
+import dedup
+
+
+class LatencySketch:
+    """
+    對數分桶直方圖：相對誤差約 (gamma - 1) / 2，記憶體只與數值範圍有關
+    gamma=1.02 時 1 微秒到 1 小時約需 1100 個桶
+    """
+
+    def __init__(self, gamma: float = 1.02, min_value: float = 1e-6):
+        self.gamma = gamma
+        self.min_value = min_value
+        self._log_gamma = math.log(gamma)
+        self._buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        key = int(math.ceil(math.log(max(value, self.min_value)) / self._log_gamma))
+        self._buckets[key] = self._buckets.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencySketch"):
+        """併入另一個相同 gamma 的直方圖（例如其他程序的統計）"""
+        if other.gamma != self.gamma:
+            raise ValueError("無法合併不同 gamma 的直方圖")
+        for key, count in other._buckets.items():
+            self._buckets[key] = self._buckets.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """q 分位數（桶的幾何中點）；沒有資料時為 0"""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return self.max
+
+
+class DeviceStats:
+    """單一設備的延遲與計數"""
+
+    def __init__(self):
+        self.latency = LatencySketch()
+        self.matched = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.retransmits = 0
+
+    @property
+    def loss_rate(self) -> float:
+        total = self.matched + self.lost
+        return self.lost / total if total else 0.0
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.duplicates / self.matched if self.matched else 0.0
+
+
+class RequestCorrelator:
+    """
+    依 req_id 配對請求與結果
+    延遲由第一次看到請求起算（含重試），等於 A 端感受到的延遲
+    """
+
+    def __init__(self, max_age: float = 60.0, capacity: int = 10000,
+                 quantiles: Iterable[float] = (0.5, 0.9, 0.99)):
+        self.max_age = max_age
+        self.capacity = capacity
+        self.quantiles = tuple(quantiles)
+        self._lock = threading.Lock()
+        self._open: "OrderedDict[str, tuple]" = OrderedDict()  # req_id → (時間, 設備)
+        self._matched = dedup.RecentlyCompleted(window=max_age, capacity=capacity)
+        self._devices: Dict[str, DeviceStats] = {}
+        self.unmatched_results = 0
+
+    def _device(self, name: str) -> DeviceStats:
+        stats = self._devices.get(name)
+        if stats is None:
+            stats = self._devices[name] = DeviceStats()
+        return stats
+
+    def request(self, req_id: str, device: str, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if req_id in self._open:
+                self._device(device).retransmits += 1
+                return
+            self._open[req_id] = (now, device)
+
+    def result(self, req_id: str, device: Optional[str] = None,
+               now: Optional[float] = None) -> Optional[float]:
+        """記錄結果，回傳延遲秒數；重複或無對應請求時回傳 None"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            item = self._open.pop(req_id, None)
+            if item is None:
+                if self._matched.get(req_id):
+                    self._device(device or "-").duplicates += 1
+                else:
+                    self.unmatched_results += 1
+                return None
+            sent, requested_device = item
+            stats = self._device(device or requested_device)
+            latency = now - sent
+            stats.latency.add(latency)
+            stats.matched += 1
+            self._matched.add(req_id)
+            return latency
+
+    def _expire(self, now: float):
+        while self._open:
+            req_id, (sent, device) = next(iter(self._open.items()))
+            if len(self._open) <= self.capacity and now - sent <= self.max_age:
+                break
+            self._open.popitem(last=False)
+            self._device(device).lost += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                name: {
+                    "matched": s.matched,
+                    "lost": s.lost,
+                    "duplicates": s.duplicates,
+                    "retransmits": s.retransmits,
+                    "loss_rate": s.loss_rate,
+                    "duplicate_rate": s.duplicate_rate,
+                    "latency_sum": s.latency.total,
+                    "latency_max": s.latency.max,
+                    "quantiles": {q: s.latency.quantile(q) for q in self.quantiles}
+                }
+                for name, s in self._devices.items()
+            }
+
+    def open_requests(self) -> int:
+        with self._lock:
+            return len(self._open)
+
+    def prometheus(self, prefix: str = "mqtt_gear") -> str:
+        """Prometheus 文字格式"""
+        snap = self.snapshot()
+        lines: List[str] = [
+            f"# HELP {prefix}_request_latency_seconds cmd/point 到 telemetry/result 的延遲",
+            f"# TYPE {prefix}_request_latency_seconds summary",
+        ]
+        for device, s in snap.items():
+            for q, value in s["quantiles"].items():
+                lines.append(f'{prefix}_request_latency_seconds{{device="{device}",quantile="{q}"}} {value:.6f}')
+            lines.append(f'{prefix}_request_latency_seconds_sum{{device="{device}"}} {s["latency_sum"]:.6f}')
+            lines.append(f'{prefix}_request_latency_seconds_count{{device="{device}"}} {s["matched"]}')
+        for name, key, help_text in (
+            ("requests_lost_total", "lost", "逾期仍未收到結果的請求數"),
+            ("results_duplicate_total", "duplicates", "重複的結果數"),
+            ("requests_retransmit_total", "retransmits", "重送的請求數"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for device, s in snap.items():
+                lines.append(f'{prefix}_{name}{{device="{device}"}} {s[key]}')
+        for name, key, help_text in (
+            ("loss_ratio", "loss_rate", "遺失率"),
+            ("duplicate_ratio", "duplicate_rate", "重複率"),
+        ):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for device, s in snap.items():
+                lines.append(f'{prefix}_{name}{{device="{device}"}} {s[key]:.6f}')
+        lines.append(f"# HELP {prefix}_requests_open 等待結果中的請求數")
+        lines.append(f"# TYPE {prefix}_requests_open gauge")
+        lines.append(f"{prefix}_requests_open {self.open_requests()}")
+        lines.append(f"# HELP {prefix}_results_unmatched_total 找不到請求的結果數")
+        lines.append(f"# TYPE {prefix}_results_unmatched_total counter")
+        lines.append(f"{prefix}_results_unmatched_total {self.unmatched_results}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(port: int, render: Callable[[], str], host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在背景線程提供 /metrics（Prometheus 文字格式）"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,66 @@
+"""
+最近完成的 req_id 集合
+QoS 1 可能重複投遞結果，已逾時或已重試的 req_id 也可能晚到；
+A 端以有時間窗、固定容量的集合辨識這些結果，不再當作未知 req_id
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DONE = "done"            # 已取得結果，再收到的是重複投遞
+ABANDONED = "abandoned"  # 已放棄（逾時），再收到的是晚到的結果
+
+
+class RecentlyCompleted:
+    """依加入順序保存 req_id → (狀態, 時間)，超過 window 秒或 capacity 筆的最舊項目被移除"""
+
+    def __init__(self, window: float = 300.0, capacity: int = 4096):
+        self.window = window
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()  # req_id → (狀態, 時間)
+
+    def add(self, req_id: str, state: str = DONE):
+        now = time.monotonic()
+        with self._lock:
+            self._items.pop(req_id, None)
+            self._items[req_id] = (state, now)
+            self._expire(now)
+
+    def get(self, req_id: str) -> Optional[str]:
+        """回傳狀態；不在時間窗內時為 None"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            item = self._items.get(req_id)
+            return item[0] if item else None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+    def _expire(self, now: float):
+        items = self._items
+        while items:
+            _, (_, added) = next(iter(items.items()))
+            if len(items) <= self.capacity and now - added <= self.window:
+                break
+            items.popitem(last=False)
+
+
+class ResultCounters:
+    """結果去重統計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {"duplicate": 0, "late": 0, "unknown": 0}
+
+    def incr(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
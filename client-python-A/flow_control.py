@@ -0,0 +1,133 @@
+"""
+A→B 流量控制
+B 在 retained 狀態中宣告 credit（可同時處理的點位數、剩餘容量、排隊數），
+A 只在持有 credit 時發送 cmd/point；B 未宣告時改用 AIMD 動態調整在途視窗
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class FlowController:
+    """
+    在途請求視窗
+    credit 模式：上限 = 更新時的在途數 + 各 B 實例剩餘容量總和（不超過各實例視窗總和）
+    AIMD 模式：成功時每個視窗加 1，逾時時乘以 decrease；同一視窗內的多個逾時只縮小一次
+    enabled=False 時不限制（舊行為：逾時即重送）
+    share < 1 時只使用 B 宣告容量（與 AIMD 上限）的這個比例，多個程序共用同一組 B 時
+    各自取一份；每份至少 1，程序數超過 B 的視窗時超出的部分在 B 端排隊
+    """
+
+    def __init__(self, initial: float = 4.0, minimum: float = 1.0, maximum: float = 256.0,
+                 decrease: float = 0.5, enabled: bool = True, share: float = 1.0):
+        self.enabled = enabled
+        self.share = min(1.0, max(share, 1e-6))
+        maximum = max(minimum, maximum * self.share)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.cwnd = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self.timeouts = 0
+        self._sent = 0             # 已發出的名額序號
+        self._decrease_mark = 0    # 上次縮小時的序號；此前發出的請求逾時不再縮小
+        self._cond = threading.Condition()
+        # 狀態主題 → B 宣告的 flow 欄位
+        self._sources: Dict[str, Dict[str, int]] = {}
+        self._granted = 0
+
+    @property
+    def credit_mode(self) -> bool:
+        with self._cond:
+            return bool(self._sources)
+
+    def limit(self) -> int:
+        with self._cond:
+            return self._limit()
+
+    def _limit(self) -> int:
+        if self._sources:
+            return self._granted
+        return int(self.cwnd)
+
+    def acquire(self, timeout: Optional[float] = None,
+                cancel: Optional[threading.Event] = None) -> int:
+        """
+        取得一個發送名額，回傳名額序號（> 0，逾時時交給 on_timeout）；
+        timeout 內沒有名額，或 cancel 被設定（需配合 wake()）時回傳 0
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self.enabled and self.in_flight >= self._limit():
+                if cancel is not None and cancel.is_set():
+                    return 0
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return 0
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            self._sent += 1
+            return self._sent
+
+    def release(self, success: bool = True):
+        """請求結束；AIMD 模式下成功時放大視窗（逾時的縮小已在 on_timeout 處理）"""
+        with self._cond:
+            self.in_flight = max(0, self.in_flight - 1)
+            if success and not self._sources:
+                self.cwnd = min(self.maximum, self.cwnd + 1.0 / self.cwnd)
+            self._cond.notify_all()
+
+    def wake(self):
+        """喚醒等待名額的線程，讓它們重新檢查 cancel"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def on_timeout(self, ticket: Optional[int] = None):
+        """
+        單次等待逾時（尚未放棄請求）；ticket 為 acquire() 回傳的序號
+        上次縮小前已發出的請求屬於同一個視窗，其逾時不再縮小（每個視窗只乘一次 decrease）
+        """
+        with self._cond:
+            self.timeouts += 1
+            if self._sources or (ticket is not None and ticket <= self._decrease_mark):
+                return
+            self.cwnd = max(self.minimum, self.cwnd * self.decrease)
+            self._decrease_mark = self._sent
+
+    def backlogged(self) -> bool:
+        """B 宣告仍有排隊或已無剩餘容量：逾時多半是排隊造成，重送只會加重負載"""
+        with self._cond:
+            return self.enabled and any(s["queue_depth"] > 0 or s["available"] <= 0
+                                        for s in self._sources.values())
+
+    def update(self, source: str, status: Dict[str, Any]):
+        """處理 B 的狀態訊息；離線或未宣告 flow 的實例不計入 credit"""
+        flow = status.get("flow") if self.enabled and status.get("online", True) else None
+        with self._cond:
+            if flow:
+                self._sources[source] = {
+                    "window": int(flow.get("window", 0)),
+                    "available": int(flow.get("available", 0)),
+                    "queue_depth": int(flow.get("queue_depth", 0))
+                }
+            elif self._sources.pop(source, None) is None:
+                return
+            window = sum(s["window"] for s in self._sources.values()) * self.share
+            available = sum(s["available"] for s in self._sources.values()) * self.share
+            self._granted = int(min(window, self.in_flight + available))
+            if self.share < 1 and window > 0:
+                # 份額不足 1 時仍保留一個名額，避免程序數多於視窗時永遠無法發送
+                self._granted = max(1, self._granted)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "mode": ("credit" if self._sources else "aimd") if self.enabled else "off",
+                "limit": self._limit(),
+                "in_flight": self.in_flight,
+                "cwnd": round(self.cwnd, 2),
+                "timeouts": self.timeouts,
+                "sources": {k: dict(v) for k, v in self._sources.items()}
+            }
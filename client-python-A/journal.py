@@ -0,0 +1,220 @@
+"""
+批次量測的崩潰安全紀錄
+以 append-only JSON Lines 記錄每個點位的派送（含 req_id）與完成，
+寫入線程將同一時間窗內的紀錄合併成一次 write + fsync（group commit）。
+程序中斷後以相同點位列表重新執行時，已成功的點位直接沿用紀錄的結果，
+未完成的點位沿用原本的 req_id 重新派送，B 已送出的結果仍能對應
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+VERSION = 1
+
+
+def points_digest(points: Sequence[Tuple[float, float]]) -> str:
+    """點位列表的摘要，續跑時確認是同一批點位"""
+    return hashlib.sha1(json.dumps([[float(x), float(y)] for x, y in points]).encode()).hexdigest()
+
+
+def _json_default(obj):
+    # NumPy 陣列（例如重組後的頻譜）與純量
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"無法序列化的型別: {type(obj).__name__}")
+
+
+class JournalState:
+    """重播紀錄得到的狀態"""
+
+    def __init__(self):
+        self.digest: Optional[str] = None
+        self.dispatched: Dict[int, str] = {}        # 索引 → 最後派送的 req_id
+        self.completed: Dict[int, Dict[str, Any]] = {}  # 索引 → 成功的完成紀錄
+        self.records = 0
+
+
+def replay(path: str) -> JournalState:
+    """讀取紀錄；最後一行若因崩潰而不完整則忽略"""
+    state = JournalState()
+    if not os.path.exists(path):
+        return state
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            state.records += 1
+            ev = rec.get("ev")
+            if ev == "run":
+                state.digest = rec.get("digest")
+            elif ev == "end":
+                # 上一次執行已完整結束，下一次從頭開始
+                state = JournalState()
+                continue
+            elif ev == "dispatch":
+                state.dispatched[rec["i"]] = rec["req_id"]
+            elif ev == "done" and rec.get("status") == "success":
+                state.completed[rec["i"]] = rec
+    return state
+
+
+def _truncate_torn(path: str):
+    """移除崩潰時寫到一半的最後一行，避免新紀錄接在後面"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class Journal:
+    """
+    append-only 紀錄
+    append() 只把紀錄交給寫入線程；durable=True 時等到該筆 fsync 完成才返回。
+    上一次 fsync 期間到達的紀錄共用下一次 fsync；commit_interval > 0 時再多等一段時間累積
+    寫入失敗（磁碟已滿、I/O 錯誤）時寫入線程停止，之後的 append / flush / close 拋出 OSError
+    """
+
+    def __init__(self, path: str, points: Sequence[Tuple[float, float]],
+                 commit_interval: float = 0.0, fsync: bool = True):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.fsync = fsync
+        digest = points_digest(points)
+        _truncate_torn(path)
+        self.state = replay(path)
+        if self.state.digest not in (None, digest):
+            raise ValueError(f"紀錄 {path} 屬於另一批點位，請改用新的紀錄檔")
+        self.resumed = self.state.digest is not None
+
+        self._cond = threading.Condition()
+        self._queue: List[str] = []
+        self._seq = 0          # 已加入的紀錄數
+        self._durable = 0      # 已 fsync 的紀錄數
+        self._closed = False
+        self._error: Optional[OSError] = None
+        self.commits = 0
+        self.fsync_time = 0.0
+        self._file = open(path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        if not self.resumed:
+            self.append({"ev": "run", "v": VERSION, "digest": digest, "points": len(points)},
+                        durable=True)
+
+    # ---- 查詢 ----
+    def result(self, index: int) -> Optional[Dict[str, Any]]:
+        """已成功點位的紀錄結果"""
+        rec = self.state.completed.get(index)
+        return rec.get("result") if rec else None
+
+    def req_id(self, index: int) -> Optional[str]:
+        """先前派送過的 req_id（續跑時沿用）"""
+        return self.state.dispatched.get(index)
+
+    # ---- 寫入 ----
+    def dispatch(self, index: int, req_id: str, x: float, y: float):
+        """派送前寫入並等待落盤：崩潰後才能沿用同一個 req_id"""
+        self.state.dispatched[index] = req_id
+        self.append({"ev": "dispatch", "i": index, "req_id": req_id, "x": x, "y": y,
+                     "ts": time.time()}, durable=True)
+
+    def complete(self, index: int, req_id: str, status: str,
+                 result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        rec = {"ev": "done", "i": index, "req_id": req_id, "status": status, "ts": time.time()}
+        if result is not None:
+            rec["result"] = result
+        if error:
+            rec["error"] = error
+        if status == "success":
+            self.state.completed[index] = rec
+        self.append(rec)
+
+    def finish(self):
+        """整批完成；之後以同一紀錄檔執行會重新開始"""
+        self.append({"ev": "end", "ts": time.time()}, durable=True)
+
+    def append(self, record: Dict[str, Any], durable: bool = False):
+        line = json.dumps(record, ensure_ascii=False, default=_json_default) + "\n"
+        with self._cond:
+            self._check_error()
+            if self._closed:
+                raise ValueError("紀錄已關閉")
+            self._queue.append(line)
+            self._seq += 1
+            seq = self._seq
+            self._cond.notify_all()
+            if durable:
+                self._wait_durable(seq)
+
+    def flush(self):
+        """等待目前所有紀錄落盤"""
+        with self._cond:
+            self._wait_durable(self._seq)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            self._writer.join()
+            self._file.close()
+
+    def _wait_durable(self, seq: int):
+        # 呼叫端持有 self._cond
+        while self._durable < seq:
+            self._check_error()
+            self._cond.wait()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise OSError(self._error.errno, f"紀錄 {self.path} 寫入失敗: {self._error.strerror or self._error}") from self._error
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "records": self._durable,
+                "commits": self.commits,
+                "records_per_commit": round(self._durable / self.commits, 2) if self.commits else 0.0,
+                "fsync_ms": round(self.fsync_time * 1000, 2)
+            }
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+            # 等一個 commit 時間窗，讓同時到達的紀錄共用這次 fsync
+            if self.commit_interval > 0:
+                time.sleep(self.commit_interval)
+            with self._cond:
+                batch, self._queue = self._queue, []
+                target = self._seq
+            try:
+                self._file.write("".join(batch))
+                self._file.flush()
+                if self.fsync:
+                    start = time.perf_counter()
+                    os.fsync(self._file.fileno())
+                    self.fsync_time += time.perf_counter() - start
+            except OSError as e:
+                # 喚醒所有等待落盤的呼叫端，由它們拋出錯誤
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self.commits += 1
+                self._durable = target
+                self._cond.notify_all()
@@ -0,0 +1,254 @@
+"""
+程序內 MQTT 替身
+不需要 broker 叢集即可測試 B 端水平擴展：支援 +/# 萬用字元、retained 訊息
+與 $share/<group>/ 共享訂閱輪詢分派。LocalClient 提供 A、B 客戶端用到的
+paho Client 介面子集，可直接傳入 setup_client(client=...)
+"""
+
+import itertools
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+from paho.mqtt.reasoncodes import ReasonCode
+
+SHARE_PREFIX = "$share/"
+
+
+def parse_shared(topic_filter: str) -> Tuple[Optional[str], str]:
+    """拆解 $share/<group>/<filter>，非共享訂閱回傳 (None, filter)"""
+    if not topic_filter.startswith(SHARE_PREFIX):
+        return None, topic_filter
+    group, _, real_filter = topic_filter[len(SHARE_PREFIX):].partition("/")
+    if not group or not real_filter:
+        raise ValueError(f"無效的共享訂閱: {topic_filter}")
+    return group, real_filter
+
+
+def _encode_payload(payload: Any) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    if isinstance(payload, (int, float)):
+        return str(payload).encode("ascii")
+    raise TypeError("payload 必須是 str、bytes、int、float 或 None")
+
+
+class SharedGroup:
+    """共享訂閱群組：每則訊息只交給群組內一個成員，依序輪流"""
+
+    def __init__(self, name: str, topic_filter: str):
+        self.name = name
+        self.topic_filter = topic_filter
+        self.members: List["LocalClient"] = []
+        self._next = 0
+
+    def add(self, client: "LocalClient"):
+        if client not in self.members:
+            self.members.append(client)
+
+    def remove(self, client: "LocalClient"):
+        if client in self.members:
+            self.members.remove(client)
+
+    def pick(self) -> Optional["LocalClient"]:
+        """輪詢挑選下一個在線成員"""
+        for _ in range(len(self.members)):
+            client = self.members[self._next % len(self.members)]
+            self._next += 1
+            if client.is_connected():
+                return client
+        return None
+
+
+class LocalBroker:
+    """程序內的訊息路由：一般訂閱、retained 與共享訂閱"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._subs: Dict[str, Dict["LocalClient", int]] = {}
+        self._groups: Dict[Tuple[str, str], SharedGroup] = {}
+        self._retained: Dict[str, Tuple[bytes, int, Optional[Properties]]] = {}
+        self._mids = itertools.count(1)
+        self.published = 0
+        self.delivered = 0
+
+    def client(self, client_id: str, protocol: int = mqtt.MQTTv311) -> "LocalClient":
+        """建立連到本 broker 的替身客戶端"""
+        return LocalClient(self, client_id, protocol)
+
+    def subscribe(self, client: "LocalClient", topic_filter: str, qos: int):
+        group, real_filter = parse_shared(topic_filter)
+        with self._lock:
+            if group:
+                key = (group, real_filter)
+                if key not in self._groups:
+                    self._groups[key] = SharedGroup(group, real_filter)
+                self._groups[key].add(client)
+                return
+            self._subs.setdefault(real_filter, {})[client] = qos
+            retained = [(t, r) for t, r in self._retained.items()
+                        if mqtt.topic_matches_sub(real_filter, t)]
+        # 一般訂閱建立時補送 retained 訊息（共享訂閱依規範不補送）
+        for topic, (payload, r_qos, props) in retained:
+            client._deliver(topic, payload, min(qos, r_qos), True, props)
+
+    def unsubscribe_all(self, client: "LocalClient"):
+        with self._lock:
+            for subscribers in self._subs.values():
+                subscribers.pop(client, None)
+            for group in self._groups.values():
+                group.remove(client)
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False,
+                properties: Optional[Properties] = None):
+        """路由一則訊息：每個一般訂閱者一份，每個共享群組一份"""
+        with self._lock:
+            self.published += 1
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos, properties)
+                else:
+                    self._retained.pop(topic, None)
+            targets: Dict["LocalClient", int] = {}
+            for topic_filter, subscribers in self._subs.items():
+                if mqtt.topic_matches_sub(topic_filter, topic):
+                    for client, sub_qos in subscribers.items():
+                        targets[client] = max(targets.get(client, 0), min(qos, sub_qos))
+            shared = [g.pick() for g in self._groups.values()
+                      if mqtt.topic_matches_sub(g.topic_filter, topic)]
+            self.delivered += len(targets) + sum(1 for c in shared if c)
+        for client, sub_qos in targets.items():
+            client._deliver(topic, payload, sub_qos, False, properties)
+        for client in shared:
+            if client:
+                client._deliver(topic, payload, qos, False, properties)
+
+    def next_mid(self) -> int:
+        return next(self._mids) % 65535 + 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "published": self.published,
+                "delivered": self.delivered,
+                "retained": len(self._retained),
+                "shared_groups": len(self._groups)
+            }
+
+
+class LocalClient:
+    """
+    paho Client 的替身：回調在自己的迴圈線程中依序執行，與 paho 網路迴圈相同
+    支援 will_set / connect / subscribe / publish / loop_start / loop_forever / disconnect
+    """
+
+    def __init__(self, broker: LocalBroker, client_id: str, protocol: int = mqtt.MQTTv311):
+        self.broker = broker
+        self.client_id = client_id
+        self.protocol = protocol
+        self.on_connect: Optional[Callable] = None
+        self.on_message: Optional[Callable] = None
+        self.on_disconnect: Optional[Callable] = None
+        self._userdata = None
+        self._events: "queue.Queue[Optional[Callable[[], None]]]" = queue.Queue()
+        self._connected = False
+        self._thread: Optional[threading.Thread] = None
+        self._will: Optional[Tuple[str, bytes, int, bool, Optional[Properties]]] = None
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def will_set(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False,
+                 properties: Optional[Properties] = None):
+        self._will = (topic, _encode_payload(payload), qos, retain, properties)
+
+    def connect(self, host: str = "local", port: int = 0, keepalive: int = 60, **kwargs) -> int:
+        self._connected = True
+        self._events.put(self._handle_connect)
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def subscribe(self, topic, qos: int = 0, **kwargs):
+        subs = topic if isinstance(topic, list) else [(topic, qos)]
+        for topic_filter, sub_qos in subs:
+            self.broker.subscribe(self, topic_filter, sub_qos)
+        return mqtt.MQTT_ERR_SUCCESS, self.broker.next_mid()
+
+    def publish(self, topic: str, payload: Any = None, qos: int = 0, retain: bool = False,
+                properties: Optional[Properties] = None) -> mqtt.MQTTMessageInfo:
+        info = mqtt.MQTTMessageInfo(self.broker.next_mid())
+        if not self._connected:
+            info.rc = mqtt.MQTT_ERR_NO_CONN
+            return info
+        self.broker.publish(topic, _encode_payload(payload), qos, retain, properties)
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        info._set_as_published()
+        return info
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.loop_forever, daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        self._events.put(None)
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        self._thread = None
+
+    def loop_forever(self, *args, **kwargs):
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            event()
+
+    def disconnect(self, *args, **kwargs):
+        """正常斷線：不發送遺囑"""
+        self._close()
+        return mqtt.MQTT_ERR_SUCCESS
+
+    def crash(self):
+        """模擬異常斷線：broker 代為發送遺囑"""
+        self._close()
+        if self._will:
+            topic, payload, qos, retain, props = self._will
+            self.broker.publish(topic, payload, qos, retain, props)
+
+    def _close(self):
+        if not self._connected:
+            return
+        self._connected = False
+        self.broker.unsubscribe_all(self)
+        self._events.put(self._handle_disconnect)
+        self._events.put(None)
+
+    def _deliver(self, topic: str, payload: bytes, qos: int, retain: bool,
+                 properties: Optional[Properties]):
+        msg = mqtt.MQTTMessage(self.broker.next_mid(), topic.encode("utf-8"))
+        msg.payload = payload
+        msg.qos = qos
+        msg.retain = retain
+        msg.properties = properties
+        msg.timestamp = time.monotonic()
+        self._events.put(lambda: self.on_message and self.on_message(self, self._userdata, msg))
+
+    def _handle_connect(self):
+        if self.on_connect:
+            # CONNACK 不帶 TopicAliasMaximum，客戶端因此不使用 topic alias
+            self.on_connect(self, self._userdata, mqtt.ConnectFlags(session_present=False),
+                            ReasonCode(PacketTypes.CONNACK, "Success"),
+                            Properties(PacketTypes.CONNACK))
+
+    def _handle_disconnect(self):
+        if self.on_disconnect:
+            self.on_disconnect(self, self._userdata,
+                               mqtt.DisconnectFlags(is_disconnect_packet_from_server=False),
+                               ReasonCode(PacketTypes.DISCONNECT, "Normal disconnection"),
+                               Properties(PacketTypes.DISCONNECT))
@@ -0,0 +1,975 @@
+#!/usr/bin/env python3
+"""
+輕量 MQTT broker（asyncio，純 Python）
+不需要 Docker Mosquitto 或遠端 broker，即可在任何機器上以實際 socket 測試 A/B 客戶端與量測效能：
+- MQTT 3.1.1 與 v5；v5 屬性原樣轉送，Topic Alias 於收到時還原，Message Expiry 依剩餘時間改寫
+- QoS 0/1；收到 QoS 2 時完成 PUBREC/PUBREL/PUBCOMP 交握並以 QoS 1 轉送
+- retained 訊息、遺囑（含 v5 Will Delay）、持久 session（clean_session=False 或 v5 Session Expiry）
+- +/# 萬用字元以 topic trie 比對；$share/<group>/ 共享訂閱沿用 local_bus 的輪詢分派
+- 吞吐量計數器：stats() 與命令列 --stats-interval
+不支援：帳號驗證（接受所有連線）、QoS 2 投遞、v5 enhanced auth、磁碟持久化
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import ssl
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from local_bus import SharedGroup, parse_shared
+
+logger = logging.getLogger(__name__)
+
+# 封包類型
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+# v5 屬性 ID
+PROP_MESSAGE_EXPIRY = 0x02
+PROP_SUBSCRIPTION_ID = 0x0B
+PROP_SESSION_EXPIRY = 0x11
+PROP_ASSIGNED_CLIENT_ID = 0x12
+PROP_AUTH_METHOD = 0x15
+PROP_WILL_DELAY = 0x18
+PROP_RECEIVE_MAXIMUM = 0x21
+PROP_TOPIC_ALIAS_MAXIMUM = 0x22
+PROP_TOPIC_ALIAS = 0x23
+
+_BYTE_PROPS = {0x01, 0x17, 0x19, 0x24, 0x25, 0x28, 0x29, 0x2A}
+_U16_PROPS = {0x13, 0x21, 0x22, 0x23}
+_U32_PROPS = {0x02, 0x11, 0x18, 0x27}
+_STRING_PROPS = {0x03, 0x08, 0x09, 0x12, 0x15, 0x16, 0x1A, 0x1C, 0x1F}   # UTF-8 與二進位皆為 2 位元組長度前綴
+_PAIR_PROPS = {0x26}
+
+# v5 訂閱選項
+NO_LOCAL = 0x04
+RETAIN_AS_PUBLISHED = 0x08
+
+# v5 reason code
+DISCONNECT_WITH_WILL = 0x04
+UNSPECIFIED_ERROR = 0x80
+MALFORMED_PACKET = 0x81
+PROTOCOL_ERROR = 0x82
+UNSUPPORTED_VERSION = 0x84
+CLIENT_ID_NOT_VALID = 0x85
+BAD_AUTH_METHOD = 0x8C
+KEEPALIVE_TIMEOUT = 0x8D
+SESSION_TAKEN_OVER = 0x8E
+TOPIC_FILTER_INVALID = 0x8F
+NO_SUBSCRIPTION_EXISTED = 0x11
+
+SESSION_NEVER_EXPIRES = 0xFFFFFFFF
+CONNECT_TIMEOUT = 10.0
+WRITE_HIGH_WATER = 8 * 1024 * 1024   # 訂閱者寫出緩衝超過此大小時丟棄 QoS 0 訊息
+
+
+class ProtocolError(Exception):
+    """封包格式或流程錯誤；v5 連線以 reason_code 斷線"""
+
+    def __init__(self, message: str, reason_code: int = MALFORMED_PACKET):
+        super().__init__(message)
+        self.reason_code = reason_code
+
+
+# ---- 編解碼 ----
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    for shift in (0, 7, 14, 21):
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+    raise ProtocolError("可變長度整數超過 4 位元組")
+
+
+def _read_bytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    end = pos + 2 + int.from_bytes(data[pos:pos + 2], "big")
+    if end > len(data):
+        raise ProtocolError("字串長度超出封包")
+    return data[pos + 2:end], end
+
+
+def _string(value: bytes) -> bytes:
+    return len(value).to_bytes(2, "big") + value
+
+
+def _packet(header: int, body: bytes) -> bytes:
+    return bytes((header,)) + _varint(len(body)) + body
+
+
+def _parse_properties(data: bytes, pos: int) -> Tuple[List[Tuple[int, Any, bytes]], int]:
+    """v5 屬性：回傳 [(屬性 ID, 值, 原始位元組)] 與屬性結束的位置"""
+    length, pos = _read_varint(data, pos)
+    end = pos + length
+    props = []
+    while pos < end:
+        start = pos
+        pid = data[pos]
+        pos += 1
+        if pid in _BYTE_PROPS:
+            value = data[pos]
+            pos += 1
+        elif pid in _U16_PROPS:
+            value = int.from_bytes(data[pos:pos + 2], "big")
+            pos += 2
+        elif pid in _U32_PROPS:
+            value = int.from_bytes(data[pos:pos + 4], "big")
+            pos += 4
+        elif pid == PROP_SUBSCRIPTION_ID:
+            value, pos = _read_varint(data, pos)
+        elif pid in _STRING_PROPS:
+            value, pos = _read_bytes(data, pos)
+        elif pid in _PAIR_PROPS:
+            key, pos = _read_bytes(data, pos)
+            val, pos = _read_bytes(data, pos)
+            value = (key, val)
+        else:
+            raise ProtocolError(f"未知的屬性 {pid:#x}")
+        props.append((pid, value, data[start:pos]))
+    if pos != end:
+        raise ProtocolError("屬性長度不符")
+    return props, end
+
+
+def valid_filter(topic_filter: str) -> bool:
+    try:
+        _, real = parse_shared(topic_filter)
+    except ValueError:
+        return False
+    levels = real.split("/")
+    for i, level in enumerate(levels):
+        if "#" in level and (level != "#" or i != len(levels) - 1):
+            return False
+        if "+" in level and level != "+":
+            return False
+    return bool(real)
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """單一主題比對（retained 補送用）；$ 開頭的主題不被頂層萬用字元比對"""
+    levels = topic.split("/")
+    parts = topic_filter.split("/")
+    if topic.startswith("$") and parts[0] in ("+", "#"):
+        return False
+    for i, part in enumerate(parts):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(parts) == len(levels)
+
+
+class Message:
+    """路由中的訊息；properties 為要轉送的 v5 屬性原始位元組（不含 alias、expiry 與訂閱 ID）"""
+
+    __slots__ = ("topic", "topic_bytes", "payload", "qos", "retain", "properties", "expires_at")
+
+    def __init__(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False,
+                 properties: bytes = b"", expires_at: Optional[float] = None):
+        self.topic = topic
+        self.topic_bytes = topic.encode("utf-8")
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+        self.expires_at = expires_at
+
+    def expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+    def encode(self, qos: int, pid: int, retain: bool, dup: bool, v5: bool,
+               sub_ids: Tuple[int, ...], now: float) -> bytes:
+        parts = [_string(self.topic_bytes)]
+        if qos:
+            parts.append(pid.to_bytes(2, "big"))
+        if v5:
+            props = self.properties
+            if self.expires_at is not None:
+                remaining = max(1, math.ceil(self.expires_at - now))
+                props += bytes((PROP_MESSAGE_EXPIRY,)) + remaining.to_bytes(4, "big")
+            for sub_id in sub_ids:
+                props += bytes((PROP_SUBSCRIPTION_ID,)) + _varint(sub_id)
+            parts.append(_varint(len(props)) + props)
+        parts.append(self.payload)
+        body = b"".join(parts)
+        header = 0x30 | (0x08 if dup else 0) | (qos << 1) | (1 if retain else 0)
+        return _packet(header, body)
+
+
+# ---- 訂閱 trie ----
+class _Node:
+    __slots__ = ("children", "subscribers", "groups")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: Dict["Session", Tuple[int, int, Optional[int]]] = {}   # session → (qos, 選項, 訂閱 ID)
+        self.groups: Dict[str, Tuple[SharedGroup, Dict["Session", int]]] = {}    # 群組 → (群組, session → qos)
+
+
+class TopicTrie:
+    """依主題層級分支的訂閱樹；比對成本與訂閱數無關，只與主題層數和萬用字元分支有關"""
+
+    def __init__(self):
+        self.root = _Node()
+        self.count = 0
+
+    def add(self, topic_filter: str, session: "Session", qos: int, options: int = 0,
+            sub_id: Optional[int] = None):
+        group, real = parse_shared(topic_filter)
+        node = self.root
+        for level in real.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+        if group:
+            entry = node.groups.get(group)
+            if entry is None:
+                entry = node.groups[group] = (SharedGroup(group, real), {})
+            if session not in entry[1]:
+                self.count += 1
+            entry[0].add(session)
+            entry[1][session] = qos
+        else:
+            if session not in node.subscribers:
+                self.count += 1
+            node.subscribers[session] = (qos, options, sub_id)
+
+    def remove(self, topic_filter: str, session: "Session") -> bool:
+        group, real = parse_shared(topic_filter)
+        path = [(None, self.root)]
+        node = self.root
+        for level in real.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return False
+            path.append((level, node))
+        if group:
+            entry = node.groups.get(group)
+            if entry is None or session not in entry[1]:
+                return False
+            entry[0].remove(session)
+            del entry[1][session]
+            if not entry[1]:
+                del node.groups[group]
+        elif node.subscribers.pop(session, None) is None:
+            return False
+        self.count -= 1
+        # 移除已沒有訂閱與子節點的分支
+        for i in range(len(path) - 1, 0, -1):
+            level, node = path[i]
+            if node.children or node.subscribers or node.groups:
+                break
+            del path[i - 1][1].children[level]
+        return True
+
+    def match(self, topic: str) -> Iterator[_Node]:
+        """產生所有與主題相符的節點"""
+        levels = topic.split("/")
+        n = len(levels)
+        dollar = topic.startswith("$")
+        stack = [(self.root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i == n:
+                yield node
+                # "a/#" 也比對 "a"
+                hash_node = node.children.get("#")
+                if hash_node is not None:
+                    yield hash_node
+                continue
+            if not (dollar and i == 0):
+                hash_node = node.children.get("#")
+                if hash_node is not None:
+                    yield hash_node
+                plus = node.children.get("+")
+                if plus is not None:
+                    stack.append((plus, i + 1))
+            child = node.children.get(levels[i])
+            if child is not None:
+                stack.append((child, i + 1))
+
+
+# ---- session ----
+class Session:
+    """
+    client ID 的 session 狀態：訂閱、等待 PUBACK 的 QoS 1 訊息與離線/超出視窗時排隊的訊息
+    連線中斷後依 expiry 保留（None 表示不過期，即 v3.1.1 的 clean_session=False）
+    """
+
+    def __init__(self, broker: "MiniBroker", client_id: str):
+        self.broker = broker
+        self.client_id = client_id
+        self.conn: Optional["_Connection"] = None
+        self.expiry: Optional[int] = 0
+        self.receive_max = broker.max_inflight
+        self.subscriptions: Dict[str, Tuple[int, int, Optional[int]]] = {}
+        self.inflight: "OrderedDict[int, Tuple[Message, bool, Tuple[int, ...]]]" = OrderedDict()
+        self.queue: Deque[Tuple[Message, bool, Tuple[int, ...]]] = deque()
+        self.incoming_qos2: Set[int] = set()
+        self.expire_handle: Optional[asyncio.TimerHandle] = None
+        self.will_handle: Optional[asyncio.TimerHandle] = None
+        self._next_pid = 0
+
+    def is_connected(self) -> bool:
+        return self.conn is not None
+
+    def _pid(self) -> int:
+        while True:
+            self._next_pid = self._next_pid % 65535 + 1
+            if self._next_pid not in self.inflight:
+                return self._next_pid
+
+    def deliver(self, msg: Message, qos: int, retain: bool, sub_ids: Tuple[int, ...] = ()):
+        broker = self.broker
+        if qos == 0:
+            if self.conn is not None and self.conn.writable():
+                self.conn.send_publish(msg, 0, 0, retain, False, sub_ids)
+            else:
+                broker.dropped += 1
+            return
+        if self.conn is not None and not self.queue and len(self.inflight) < self.receive_max:
+            self._send(msg, retain, sub_ids)
+        elif len(self.queue) < broker.max_queued:
+            self.queue.append((msg, retain, sub_ids))
+        else:
+            broker.dropped += 1
+
+    def _send(self, msg: Message, retain: bool, sub_ids: Tuple[int, ...]):
+        pid = self._pid()
+        self.inflight[pid] = (msg, retain, sub_ids)
+        self.conn.send_publish(msg, 1, pid, retain, False, sub_ids)
+
+    def acked(self, pid: int):
+        if self.inflight.pop(pid, None) is not None:
+            self.pump()
+
+    def pump(self):
+        """在視窗允許時送出排隊的訊息；已逾期的 v5 訊息直接丟棄"""
+        now = time.monotonic()
+        while self.conn is not None and self.queue and len(self.inflight) < self.receive_max:
+            msg, retain, sub_ids = self.queue.popleft()
+            if msg.expired(now):
+                self.broker.expired += 1
+                continue
+            self._send(msg, retain, sub_ids)
+
+    def resume(self):
+        """重新連線：以 DUP 重送未確認的訊息，再送排隊的訊息"""
+        for pid, (msg, retain, sub_ids) in self.inflight.items():
+            self.conn.send_publish(msg, 1, pid, retain, True, sub_ids)
+        self.pump()
+
+
+# ---- 連線 ----
+class _Connection(asyncio.Protocol):
+    def __init__(self, broker: "MiniBroker"):
+        self.broker = broker
+        self.transport: Optional[asyncio.Transport] = None
+        self.session: Optional[Session] = None
+        self.v5 = False
+        self.keepalive = 0
+        self.will: Optional[Message] = None
+        self.will_delay = 0
+        self.aliases: Dict[int, bytes] = {}
+        self.closed = False
+        self.last_rx = 0.0
+        self._buffer = bytearray()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    # ---- asyncio.Protocol ----
+    def connection_made(self, transport):
+        self.transport = transport
+        self.broker._connections.add(self)
+        self.broker.connections_total += 1
+        self.last_rx = self.broker._loop.time()
+        self._timer = self.broker._loop.call_later(CONNECT_TIMEOUT, self._check_idle)
+
+    def connection_lost(self, exc):
+        self.close(publish_will=True)
+
+    def data_received(self, data: bytes):
+        self.broker.bytes_received += len(data)
+        self.last_rx = self.broker._loop.time()
+        buf = self._buffer
+        buf += data
+        pos = 0
+        size = len(buf)
+        try:
+            while not self.closed and size - pos >= 2:
+                # 固定標頭：類型/旗標 + 剩餘長度
+                length, shift, i = 0, 0, pos + 1
+                complete = False
+                while i < size:
+                    byte = buf[i]
+                    i += 1
+                    length |= (byte & 0x7F) << shift
+                    if not byte & 0x80:
+                        complete = True
+                        break
+                    shift += 7
+                    if shift > 21:
+                        raise ProtocolError("剩餘長度超過 4 位元組")
+                if not complete or i + length > size:
+                    break
+                self._handle(buf[pos], bytes(buf[i:i + length]))
+                pos = i + length
+        except ProtocolError as e:
+            logger.debug(f"[{self._name()}] 協議錯誤: {e}")
+            self.close(publish_will=True, reason=e.reason_code)
+        except (IndexError, ValueError, UnicodeDecodeError) as e:
+            logger.debug(f"[{self._name()}] 封包格式錯誤: {e}")
+            self.close(publish_will=True, reason=MALFORMED_PACKET)
+        if not self.closed:
+            del buf[:pos]
+
+    # ---- 輔助 ----
+    def _name(self) -> str:
+        return self.session.client_id if self.session else "?"
+
+    def send(self, data: bytes):
+        self.transport.write(data)
+        self.broker.bytes_sent += len(data)
+
+    def writable(self) -> bool:
+        return self.transport.get_write_buffer_size() < WRITE_HIGH_WATER
+
+    def send_publish(self, msg: Message, qos: int, pid: int, retain: bool, dup: bool,
+                     sub_ids: Tuple[int, ...]):
+        self.send(msg.encode(qos, pid, retain, dup, self.v5, sub_ids, time.monotonic()))
+        self.broker.delivered += 1
+
+    def _ack(self, kind: int, pid: int, codes: bytes = b""):
+        body = pid.to_bytes(2, "big")
+        if kind in (SUBACK, UNSUBACK):
+            body += (b"\x00" if self.v5 else b"") + codes
+        self.send(_packet(kind << 4, body))
+
+    def close(self, publish_will: bool = False, reason: Optional[int] = None):
+        """關閉連線；遺囑與 session 處理同步完成，接手的新連線不會受舊連線影響"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+        if reason is not None and self.v5 and self.session is not None and self.transport is not None:
+            self.send(_packet(DISCONNECT << 4, bytes((reason,)) + b"\x00"))
+        self.broker._detach(self, publish_will)
+        self.broker._connections.discard(self)
+        if self.transport is not None:
+            self.transport.close()
+
+    def _check_idle(self):
+        self._timer = None
+        if self.closed:
+            return
+        if self.session is None:
+            self.close()
+            return
+        limit = self.keepalive * 1.5
+        idle = self.broker._loop.time() - self.last_rx
+        if idle >= limit:
+            logger.debug(f"[{self._name()}] keepalive 逾時")
+            self.close(publish_will=True, reason=KEEPALIVE_TIMEOUT)
+        else:
+            self._timer = self.broker._loop.call_later(limit - idle, self._check_idle)
+
+    # ---- 封包處理 ----
+    def _handle(self, header: int, body: bytes):
+        kind = header >> 4
+        if self.session is None:
+            if kind != CONNECT:
+                raise ProtocolError("第一個封包必須是 CONNECT", PROTOCOL_ERROR)
+            self._on_connect(body)
+        elif kind == PUBLISH:
+            self._on_publish(header, body)
+        elif kind == PUBACK:
+            self.session.acked(int.from_bytes(body[:2], "big"))
+        elif kind == PUBREL:
+            pid = int.from_bytes(body[:2], "big")
+            self.session.incoming_qos2.discard(pid)
+            self._ack(PUBCOMP, pid)
+        elif kind == SUBSCRIBE:
+            self._on_subscribe(body)
+        elif kind == UNSUBSCRIBE:
+            self._on_unsubscribe(body)
+        elif kind == PINGREQ:
+            self.send(b"\xd0\x00")
+        elif kind == DISCONNECT:
+            self._on_disconnect(body)
+        elif kind in (PUBREC, PUBCOMP):
+            pass   # broker 不以 QoS 2 投遞
+        else:
+            raise ProtocolError(f"不支援的封包類型 {kind}", PROTOCOL_ERROR)
+
+    def _connack(self, session_present: bool, code: int, props: bytes = b""):
+        body = bytes((1 if session_present else 0, code))
+        if self.v5:
+            body += _varint(len(props)) + props
+        self.send(_packet(CONNACK << 4, body))
+
+    def _on_connect(self, body: bytes):
+        name, pos = _read_bytes(body, 0)
+        level, flags = body[pos], body[pos + 1]
+        keepalive = int.from_bytes(body[pos + 2:pos + 4], "big")
+        pos += 4
+        self.v5 = level == 5
+        if name not in (b"MQTT", b"MQIsdp") or level not in (3, 4, 5):
+            self._connack(False, UNSUPPORTED_VERSION if self.v5 else 1)
+            self.close()
+            return
+        props: Dict[int, Any] = {}
+        if self.v5:
+            plist, pos = _parse_properties(body, pos)
+            props = {pid: value for pid, value, _ in plist}
+        client_id, pos = _read_bytes(body, pos)
+        client_id = client_id.decode("utf-8")
+        clean = bool(flags & 0x02)
+        if flags & 0x04:
+            will_props: List[Tuple[int, Any, bytes]] = []
+            if self.v5:
+                will_props, pos = _parse_properties(body, pos)
+            topic, pos = _read_bytes(body, pos)
+            payload, pos = _read_bytes(body, pos)
+            raw, expires_at = b"", None
+            for pid, value, data in will_props:
+                if pid == PROP_WILL_DELAY:
+                    self.will_delay = value
+                elif pid == PROP_MESSAGE_EXPIRY:
+                    expires_at = time.monotonic() + value
+                else:
+                    raw += data
+            self.will = Message(topic.decode("utf-8"), payload, min(1, (flags >> 3) & 0x03),
+                                bool(flags & 0x20), raw, expires_at)
+        # 帳號密碼不檢查（與 mosquitto-simple.conf 的匿名設定相同）
+        if PROP_AUTH_METHOD in props:
+            self._connack(False, BAD_AUTH_METHOD)
+            self.close()
+            return
+        ack_props = b""
+        if not client_id:
+            if not (self.v5 or clean):
+                self._connack(False, 2)
+                self.close()
+                return
+            client_id = f"auto-{uuid.uuid4().hex}"
+            if self.v5:
+                ack_props += bytes((PROP_ASSIGNED_CLIENT_ID,)) + _string(client_id.encode("utf-8"))
+        if self.v5:
+            expiry = props.get(PROP_SESSION_EXPIRY, 0)
+            receive_max = props.get(PROP_RECEIVE_MAXIMUM, 65535)
+            if self.broker.topic_alias_maximum:
+                ack_props += bytes((PROP_TOPIC_ALIAS_MAXIMUM,)) + \
+                    self.broker.topic_alias_maximum.to_bytes(2, "big")
+        else:
+            expiry = 0 if clean else None
+            receive_max = self.broker.max_inflight
+        self.keepalive = keepalive
+        session, present = self.broker._attach(self, client_id, clean, expiry)
+        session.receive_max = max(1, min(receive_max, self.broker.max_inflight))
+        self._connack(present, 0, ack_props)
+        self._timer.cancel()
+        self._timer = self.broker._loop.call_later(keepalive * 1.5, self._check_idle) if keepalive else None
+        session.resume()
+
+    def _on_publish(self, header: int, body: bytes):
+        qos = (header >> 1) & 0x03
+        if qos == 3:
+            raise ProtocolError("QoS 3")
+        topic, pos = _read_bytes(body, 0)
+        pid = 0
+        if qos:
+            pid = int.from_bytes(body[pos:pos + 2], "big")
+            pos += 2
+        raw, expires_at = b"", None
+        if self.v5:
+            plist, pos = _parse_properties(body, pos)
+            alias = None
+            for prop, value, data in plist:
+                if prop == PROP_TOPIC_ALIAS:
+                    alias = value
+                elif prop == PROP_MESSAGE_EXPIRY:
+                    expires_at = time.monotonic() + value
+                elif prop != PROP_SUBSCRIPTION_ID:
+                    raw += data
+            if alias is not None:
+                if not 0 < alias <= self.broker.topic_alias_maximum:
+                    raise ProtocolError(f"無效的 topic alias {alias}", 0x94)
+                if topic:
+                    self.aliases[alias] = topic
+                else:
+                    topic = self.aliases.get(alias)
+                    if topic is None:
+                        raise ProtocolError(f"未建立的 topic alias {alias}", PROTOCOL_ERROR)
+        if not topic or b"+" in topic or b"#" in topic:
+            raise ProtocolError("無效的發布主題", 0x90)
+        msg = Message(topic.decode("utf-8"), body[pos:], min(qos, 1), bool(header & 0x01), raw, expires_at)
+        if qos == 2:
+            # 重送的 QoS 2 只回 PUBREC，不重複轉送
+            if pid not in self.session.incoming_qos2:
+                self.session.incoming_qos2.add(pid)
+                self.broker.publish(msg, self.session)
+            self._ack(PUBREC, pid)
+            return
+        self.broker.publish(msg, self.session)
+        if qos == 1:
+            self._ack(PUBACK, pid)
+
+    def _on_subscribe(self, body: bytes):
+        pid = int.from_bytes(body[:2], "big")
+        pos = 2
+        sub_id = None
+        if self.v5:
+            plist, pos = _parse_properties(body, pos)
+            for prop, value, _ in plist:
+                if prop == PROP_SUBSCRIPTION_ID:
+                    sub_id = value
+        codes = bytearray()
+        added = []
+        session = self.session
+        while pos < len(body):
+            raw_filter, pos = _read_bytes(body, pos)
+            options = body[pos]
+            pos += 1
+            topic_filter = raw_filter.decode("utf-8")
+            qos = options & 0x03
+            if qos == 3 or not valid_filter(topic_filter):
+                codes.append(TOPIC_FILTER_INVALID if self.v5 else UNSPECIFIED_ERROR)
+                continue
+            granted = min(qos, 1)
+            if not self.v5:
+                options = 0
+            is_new = topic_filter not in session.subscriptions
+            session.subscriptions[topic_filter] = (granted, options, sub_id)
+            self.broker.trie.add(topic_filter, session, granted, options, sub_id)
+            codes.append(granted)
+            added.append((topic_filter, granted, options, is_new, sub_id))
+        self._ack(SUBACK, pid, bytes(codes))
+        for topic_filter, granted, options, is_new, sub_id in added:
+            handling = (options >> 4) & 0x03
+            if handling == 0 or (handling == 1 and is_new):
+                self.broker._send_retained(session, topic_filter, granted, sub_id)
+
+    def _on_unsubscribe(self, body: bytes):
+        pid = int.from_bytes(body[:2], "big")
+        pos = 2
+        if self.v5:
+            _, pos = _parse_properties(body, pos)
+        codes = bytearray()
+        while pos < len(body):
+            raw_filter, pos = _read_bytes(body, pos)
+            topic_filter = raw_filter.decode("utf-8")
+            existed = self.session.subscriptions.pop(topic_filter, None) is not None
+            if existed:
+                self.broker.trie.remove(topic_filter, self.session)
+            codes.append(0 if existed else NO_SUBSCRIPTION_EXISTED)
+        self._ack(UNSUBACK, pid, bytes(codes) if self.v5 else b"")
+
+    def _on_disconnect(self, body: bytes):
+        reason = body[0] if body else 0
+        if self.v5 and len(body) > 1:
+            plist, _ = _parse_properties(body, 1)
+            for prop, value, _ in plist:
+                if prop == PROP_SESSION_EXPIRY and self.session.expiry != 0:
+                    self.session.expiry = value
+        # 正常斷線不發送遺囑；v5 可用 0x04 要求發送
+        self.close(publish_will=self.v5 and reason == DISCONNECT_WITH_WILL)
+
+
+# ---- broker ----
+class MiniBroker:
+    """
+    host/port 為純 TCP 監聽位址（port 0 表示自動選擇），ssl_context 與 tls_port 同時指定時另開 TLS 端口
+    topic_alias_maximum 於 v5 CONNACK 宣告，A 端據此對 cmd/point 使用 topic alias
+    在 asyncio 中以 await start() / stop() 使用，同步程式以 start_background() / stop_background()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 1883,
+                 ssl_context: Optional[ssl.SSLContext] = None, tls_port: Optional[int] = None,
+                 max_inflight: int = 100, max_queued: int = 1000, topic_alias_maximum: int = 10):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.tls_port = tls_port
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.topic_alias_maximum = topic_alias_maximum
+        self.ports: Dict[str, int] = {}
+        self.trie = TopicTrie()
+        self.sessions: Dict[str, Session] = {}
+        self.retained: Dict[str, Message] = {}
+        self._connections: Set[_Connection] = set()
+        self._servers: List[asyncio.AbstractServer] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # 計數器
+        self.started = time.monotonic()
+        self.connections_total = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.expired = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._last_stats = (self.started, 0, 0)
+
+    # ---- 啟動/停止 ----
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        server = await self._loop.create_server(lambda: _Connection(self), self.host, self.port)
+        self._servers.append(server)
+        self.ports["plain"] = server.sockets[0].getsockname()[1]
+        if self.ssl_context is not None and self.tls_port is not None:
+            server = await self._loop.create_server(lambda: _Connection(self), self.host, self.tls_port,
+                                                    ssl=self.ssl_context)
+            self._servers.append(server)
+            self.ports["tls"] = server.sockets[0].getsockname()[1]
+        logger.info(f"MQTT broker 已啟動: {self.host} {self.ports}")
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for conn in list(self._connections):
+            conn.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    def start_background(self) -> "MiniBroker":
+        """在背景線程的事件迴圈中執行，監聽開始後返回"""
+        ready = threading.Event()
+        errors: List[BaseException] = []
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start())
+            except BaseException as e:
+                errors.append(e)
+                ready.set()
+                loop.close()
+                return
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="mini-broker", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop_background(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    # ---- session ----
+    def _attach(self, conn: _Connection, client_id: str, clean: bool,
+                expiry: Optional[int]) -> Tuple[Session, bool]:
+        old = self.sessions.get(client_id)
+        if old is not None and old.conn is not None:
+            # 相同 client ID 的新連線接手，舊連線視為異常斷線
+            old.conn.close(publish_will=True, reason=SESSION_TAKEN_OVER)
+            old = self.sessions.get(client_id)
+        if old is not None:
+            for handle in (old.expire_handle, old.will_handle):
+                if handle is not None:
+                    handle.cancel()
+            old.expire_handle = old.will_handle = None
+        if old is None or clean:
+            if old is not None:
+                self._discard(old)
+            session, present = Session(self, client_id), False
+            self.sessions[client_id] = session
+        else:
+            session, present = old, True
+        session.conn = conn
+        session.expiry = expiry
+        conn.session = session
+        return session, present
+
+    def _detach(self, conn: _Connection, publish_will: bool):
+        session = conn.session
+        if session is None:
+            return
+        conn.session = None
+        if session.conn is conn:
+            session.conn = None
+        will = conn.will if publish_will else None
+        if will is not None:
+            delay = conn.will_delay
+            if session.expiry is not None:
+                delay = min(delay, session.expiry)
+            if delay > 0:
+                session.will_handle = self._loop.call_later(delay, self._publish_will, session, will)
+            else:
+                self.publish(will)
+        if session.conn is not None or self.sessions.get(session.client_id) is not session:
+            return
+        if session.expiry == 0:
+            self._discard(session)
+        elif session.expiry is not None and session.expiry != SESSION_NEVER_EXPIRES:
+            session.expire_handle = self._loop.call_later(session.expiry, self._expire, session)
+
+    def _publish_will(self, session: Session, will: Message):
+        session.will_handle = None
+        self.publish(will)
+
+    def _expire(self, session: Session):
+        session.expire_handle = None
+        if session.conn is None and self.sessions.get(session.client_id) is session:
+            self._discard(session)
+
+    def _discard(self, session: Session):
+        for topic_filter in session.subscriptions:
+            self.trie.remove(topic_filter, session)
+        session.subscriptions.clear()
+        session.queue.clear()
+        session.inflight.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+
+    # ---- 路由 ----
+    def publish(self, msg: Message, sender: Optional[Session] = None):
+        """路由一則訊息：每個一般訂閱者一份（取最高 QoS 並合併訂閱 ID），每個共享群組一份"""
+        self.published += 1
+        if msg.retain:
+            if msg.payload:
+                self.retained[msg.topic] = msg
+            else:
+                self.retained.pop(msg.topic, None)
+        targets: Dict[Session, list] = {}
+        for node in self.trie.match(msg.topic):
+            for session, (qos, options, sub_id) in node.subscribers.items():
+                if options & NO_LOCAL and session is sender:
+                    continue
+                qos = min(msg.qos, qos)
+                retain = msg.retain and bool(options & RETAIN_AS_PUBLISHED)
+                target = targets.get(session)
+                if target is None:
+                    targets[session] = [qos, retain, (sub_id,) if sub_id else ()]
+                else:
+                    target[0] = max(target[0], qos)
+                    target[1] = target[1] or retain
+                    if sub_id and sub_id not in target[2]:
+                        target[2] += (sub_id,)
+            for group, members in node.groups.values():
+                member = group.pick()
+                if member is None and msg.qos and group.members:
+                    # 成員都離線時交給持久 session 排隊
+                    member = group.members[0]
+                if member is not None:
+                    member.deliver(msg, min(msg.qos, members[member]), False)
+        for session, (qos, retain, sub_ids) in targets.items():
+            session.deliver(msg, qos, retain, sub_ids)
+
+    def _send_retained(self, session: Session, topic_filter: str, qos: int, sub_id: Optional[int]):
+        group, real = parse_shared(topic_filter)
+        if group:
+            return   # 共享訂閱依規範不補送 retained
+        now = time.monotonic()
+        for topic, msg in list(self.retained.items()):
+            if not topic_matches(real, topic):
+                continue
+            if msg.expired(now):
+                del self.retained[topic]
+                continue
+            session.deliver(msg, min(msg.qos, qos), True, (sub_id,) if sub_id else ())
+
+    # ---- 統計 ----
+    def stats(self) -> Dict[str, Any]:
+        """累計計數與距上次呼叫的每秒訊息數"""
+        now = time.monotonic()
+        last, published, delivered = self._last_stats
+        elapsed = max(now - last, 1e-9)
+        self._last_stats = (now, self.published, self.delivered)
+        return {
+            "uptime": round(now - self.started, 1),
+            "connections": len(self._connections),
+            "connections_total": self.connections_total,
+            "sessions": len(self.sessions),
+            "subscriptions": self.trie.count,
+            "retained": len(self.retained),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "bytes_received": self.bytes_received,
+            "bytes_sent": self.bytes_sent,
+            "published_per_s": round((self.published - published) / elapsed, 1),
+            "delivered_per_s": round((self.delivered - delivered) / elapsed, 1)
+        }
+
+
+async def _serve(broker: MiniBroker, stats_interval: float):
+    await broker.start()
+    try:
+        while True:
+            await asyncio.sleep(stats_interval or 3600)
+            if stats_interval:
+                s = broker.stats()
+                print(f"連線 {s['connections']}, session {s['sessions']}, 訂閱 {s['subscriptions']}, "
+                      f"收 {s['published_per_s']:.0f}/s, 送 {s['delivered_per_s']:.0f}/s, "
+                      f"丟棄 {s['dropped']}, 逾期 {s['expired']}")
+    finally:
+        await broker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="輕量 MQTT broker（測試與效能量測用）")
+    parser.add_argument('--host', default="0.0.0.0", help='監聽位址 (默認: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=4883, help='純 TCP 端口 (默認: 4883)')
+    parser.add_argument('--tls-port', type=int, help='TLS 端口，需一併指定 --certfile/--keyfile')
+    parser.add_argument('--certfile', help='伺服器憑證，例如 ../broker/certs/server.crt')
+    parser.add_argument('--keyfile', help='伺服器私鑰')
+    parser.add_argument('--max-inflight', type=int, default=100,
+                        help='每個 session 等待 PUBACK 的 QoS 1 訊息上限 (默認: 100)')
+    parser.add_argument('--max-queued', type=int, default=1000,
+                        help='每個 session 離線或視窗已滿時排隊的訊息上限 (默認: 1000)')
+    parser.add_argument('--stats-interval', type=float, default=0,
+                        help='每 N 秒輸出吞吐量，0 表示不輸出')
+    parser.add_argument('--verbose', '-v', action='store_true', help='顯示連線與協議錯誤日誌')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    ssl_context = None
+    if args.tls_port is not None:
+        if not args.certfile:
+            parser.error("--tls-port 需要 --certfile")
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+    broker = MiniBroker(args.host, args.port, ssl_context, args.tls_port,
+                        args.max_inflight, args.max_queued)
+    try:
+        asyncio.run(_serve(broker, args.stats_interval))
+    except KeyboardInterrupt:
+        print(f"\n{broker.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,12 @@ import time
 import argparse
 from datetime import datetime
 import paho.mqtt.client as mqtt
+import chunked
+import codec
+import mqtt_v5
+import profiling
+import tls
+from correlator import RequestCorrelator, serve_metrics
 
 # MQTT 配置 - 可通過環境變數覆蓋
 import os
@@ -25,24 +31,34 @@ TOPICS = [
     f"v1/{ID}/cmd/#", 
     f"v1/{ID}/telemetry/#",
     f"v1/{ID}/config/#",
-    f"v1/{ID}/status"
+    f"v1/{ID}/status",
+    f"v1/{ID}/status/+"     # 共享訂閱模式下各 B 實例的狀態與負載
 ]
 
 class MQTTMonitor:
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, correlate=False, protocol=mqtt_v5.PROTOCOL_V311, max_age=60.0):
         self.verbose = verbose
         self.message_count = 0
         self.start_time = time.time()
         self.last_messages = {}
+        self.protocol = mqtt_v5.parse_protocol(protocol)
+        # 關聯模式：依 req_id 配對 cmd/point 與 telemetry/result，統計延遲、遺失與重複
+        self.correlator = RequestCorrelator(max_age=max_age) if correlate else None
         
     def setup_client(self):
         """設置 MQTT 客戶端"""
-        self.client = mqtt.Client(client_id=CLIENT_ID, clean_session=True)
+        if self.protocol == mqtt_v5.PROTOCOL_V5:
+            # v5 的 req_id 在 Correlation Data 內，監控端也需要 v5 才收得到
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID, protocol=mqtt.MQTTv5)
+        else:
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=CLIENT_ID, clean_session=True)
         self.client.username_pw_set(USER, PASS)
+        tls.apply(self.client)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
+        profiling.instrument(self.client, "monitor.")
         
-    def on_connect(self, client, userdata, flags, rc):
+    def on_connect(self, client, userdata, flags, rc, properties=None):
         """連接回調"""
         if rc == 0:
             print(f"✓ 監控器已連接到 {BROKER_HOST}:{PORT}")
@@ -63,9 +79,13 @@ class MQTTMonitor:
         self.message_count += 1
         
         try:
-            # 解析消息
-            payload = msg.payload.decode('utf-8')
-            data = json.loads(payload) if payload else {}
+            # 頻譜分塊為二進位格式，只顯示標頭
+            if chunked.is_chunk(msg.payload):
+                self._show_chunk(msg)
+                return
+
+            # 解析消息（壓縮的訊息先解碼）
+            data = codec.loads(msg.payload) if msg.payload else {}
             
             # 提取信息
             timestamp = datetime.now().strftime("%H:%M:%S")
@@ -75,6 +95,10 @@ class MQTTMonitor:
             
             # 格式化內容
             content = self._format_content(data, msg.topic)
+            if self.correlator:
+                latency = self._correlate(msg, data)
+                if latency is not None:
+                    content += f" 延遲 {latency * 1000:.0f}ms"
             
             # 顯示消息
             print(f"{timestamp:<12} {topic:<25} {sender:<8} {msg_type:<15} {content}")
@@ -82,6 +106,8 @@ class MQTTMonitor:
             # 詳細模式顯示完整數據
             if self.verbose:
                 print(f"  完整數據: {json.dumps(data, ensure_ascii=False)}")
+                if codec.is_compressed(msg.payload):
+                    print(f"  壓縮: {len(msg.payload)} bytes")
                 print(f"  QoS: {msg.qos}, Retained: {msg.retain}")
                 print()
                 
@@ -100,6 +126,36 @@ class MQTTMonitor:
         except Exception as e:
             print(f"解析消息錯誤: {e}")
             
+    def _correlate(self, msg, data):
+        """配對請求與結果，回傳結果的延遲秒數"""
+        req_id = mqtt_v5.correlation_id(msg) or data.get('req_id')
+        if not req_id:
+            return None
+        device = msg.topic.split('/')[1]
+        # 以回調開始時間計算；paho 的 msg.timestamp 在呼叫回調前才設定，同樣包含回調排隊的時間，
+        # 監控端的回調只做輕量處理，排隊通常可忽略（--profile 的 monitor.loop_lag 可確認）
+        now = time.monotonic()
+        if data.get('type') == 'move_point':
+            self.correlator.request(req_id, device, now)
+        elif data.get('type') == 'result_feature_set':
+            return self.correlator.result(req_id, device, now)
+        return None
+
+    def _show_chunk(self, msg):
+        """顯示頻譜分塊的標頭資訊"""
+        header = chunked.parse_header(msg.payload)
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        topic = msg.topic.split('/')[-1]
+        content = (f"分塊 {header.seq + 1}/{header.total} req_id={header.req_id[:8]}... "
+                   f"({len(msg.payload)} bytes)")
+        print(f"{timestamp:<12} {topic:<25} {'B':<8} {'chunk':<15} {content}")
+        self.last_messages[msg.topic] = {
+            'timestamp': time.time(),
+            'data': {'req_id': header.req_id, 'seq': header.seq, 'total': header.total},
+            'qos': msg.qos,
+            'retained': msg.retain
+        }
+
     def _format_content(self, data, topic):
         """格式化消息內容顯示"""
         if 'point' in data:
@@ -107,10 +163,18 @@ class MQTTMonitor:
             return f"({point.get('x', '?')}, {point.get('y', '?')})"
         elif 'values' in data:
             values = data['values']
+            spectrum = data.get('spectrum')
+            if isinstance(spectrum, dict):
+                return f"{len(values)}個特徵值 + 頻譜 {spectrum.get('length')} 點 ({spectrum.get('chunks')} 分塊)"
             return f"{len(values)}個特徵值"
         elif 'online' in data:
             status = "上線" if data['online'] else "離線"
             state = data.get('state', '')
+            load = data.get('load')
+            if load:
+                return (f"{status} [{state}] 實例 {load.get('instance') or '-'}: "
+                        f"處理中 {load.get('in_flight', 0)}, 排隊 {load.get('queued', 0)}, "
+                        f"已完成 {load.get('processed', 0)}")
             return f"{status} [{state}]"
         elif 'job_id' in data:
             return f"作業ID: {data['job_id'][:8]}..."
@@ -133,6 +197,17 @@ class MQTTMonitor:
         print(f"  收到消息: {self.message_count} 條")
         print(f"  平均速率: {self.message_count/runtime:.2f} 條/秒" if runtime > 0 else "  平均速率: 0 條/秒")
         
+        # 延遲統計
+        if self.correlator:
+            print(f"\n請求/結果關聯 (等待中 {self.correlator.open_requests()}, "
+                  f"無對應請求的結果 {self.correlator.unmatched_results}):")
+            for device, s in self.correlator.snapshot().items():
+                q = s['quantiles']
+                print(f"  {device}: 配對 {s['matched']}, p50 {q[0.5] * 1000:.0f}ms, "
+                      f"p90 {q[0.9] * 1000:.0f}ms, p99 {q[0.99] * 1000:.0f}ms, "
+                      f"遺失率 {s['loss_rate']:.2%}, 重複率 {s['duplicate_rate']:.2%}, "
+                      f"重送 {s['retransmits']}")
+
         # 顯示最新狀態
         if self.last_messages:
             print(f"\n最新狀態:")
@@ -154,8 +229,10 @@ class MQTTMonitor:
             print(f"監控錯誤: {e}")
         finally:
             self.client.disconnect()
+            profiling.stop()
 
 def main():
+    global BROKER_HOST, PORT
     parser = argparse.ArgumentParser(description="MQTT Gear Server 監控工具")
     
     parser.add_argument(
@@ -173,23 +250,55 @@ def main():
     parser.add_argument(
         '--port',
         type=int, 
-        default=PORT,
-        help=f'MQTT Broker 端口 (默認: {PORT})'
+        help=f'MQTT Broker 端口 (默認: {PORT}，--tls 時為 MQTT_TLS_PORT)'
+    )
+    
+    parser.add_argument(
+        '--protocol',
+        choices=['311', '5'],
+        default=mqtt_v5.PROTOCOL_V311,
+        help='MQTT 協議版本；監控 v5 的 A/B 時需使用 5 才能取得 Correlation Data'
+    )
+    
+    parser.add_argument(
+        '--correlate', '-c',
+        action='store_true',
+        help='依 req_id 配對請求與結果，統計各設備延遲百分位數、遺失率與重複率'
+    )
+    
+    parser.add_argument(
+        '--max-age',
+        type=float,
+        default=60.0,
+        help='請求等待結果的最長秒數，逾期視為遺失 (默認: 60)'
     )
     
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='在此端口提供 Prometheus 格式的 /metrics（隱含 --correlate）'
+    )
+    
+    profiling.add_arguments(parser)
+    tls.add_arguments(parser)
     args = parser.parse_args()
+    profiling.configure_from_args(args)
+    tls.configure_from_args(args)
     
     # 更新全局配置
-    global BROKER_HOST, PORT
     BROKER_HOST = args.host
-    PORT = args.port
+    PORT = args.port or tls.port(PORT)
     
     print("=== MQTT Gear Server 監控器 ===")
-    print(f"Broker: {BROKER_HOST}:{PORT}")
+    print(f"Broker: {BROKER_HOST}:{PORT}{'（TLS）' if tls.enabled() else ''}")
     print(f"監控 ID: {ID}")
     print("按 Ctrl+C 停止監控\n")
     
-    monitor = MQTTMonitor(verbose=args.verbose)
+    monitor = MQTTMonitor(verbose=args.verbose, correlate=args.correlate or bool(args.metrics_port),
+                          protocol=args.protocol, max_age=args.max_age)
+    if args.metrics_port:
+        serve_metrics(args.metrics_port, monitor.correlator.prometheus)
+        print(f"Prometheus 指標: http://0.0.0.0:{args.metrics_port}/metrics\n")
     monitor.setup_client()
     monitor.start_monitoring()
 
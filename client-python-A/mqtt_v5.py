@@ -0,0 +1,151 @@
+"""
+MQTT v5 輔助工具
+提供 request/response 屬性 (Response Topic / Correlation Data)、
+訊息逾期與 topic alias 管理，供 A、B 兩端共用
+"""
+
+import math
+import threading
+import uuid
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+PROTOCOL_V311 = "311"
+PROTOCOL_V5 = "5"
+
+_PROTOCOL_ALIASES = {
+    "311": PROTOCOL_V311, "3.1.1": PROTOCOL_V311, "v311": PROTOCOL_V311, "mqttv311": PROTOCOL_V311,
+    "5": PROTOCOL_V5, "5.0": PROTOCOL_V5, "v5": PROTOCOL_V5, "mqttv5": PROTOCOL_V5,
+}
+
+
+def parse_protocol(value: str) -> str:
+    """將環境變數或命令列的協議字串正規化為 "311" 或 "5" """
+    key = str(value).strip().lower()
+    if key not in _PROTOCOL_ALIASES:
+        raise ValueError(f"不支援的 MQTT 協議版本: {value}")
+    return _PROTOCOL_ALIASES[key]
+
+
+def paho_protocol(protocol: str) -> int:
+    """轉換為 paho 的協議常數"""
+    return mqtt.MQTTv5 if parse_protocol(protocol) == PROTOCOL_V5 else mqtt.MQTTv311
+
+
+def connect_properties(session_expiry: int) -> Properties:
+    """CONNECT 屬性：以 Session Expiry 取代 v3.1.1 的 clean_session=False"""
+    props = Properties(PacketTypes.CONNECT)
+    props.SessionExpiryInterval = session_expiry
+    return props
+
+
+def encode_correlation(req_id: str) -> bytes:
+    """req_id 為 UUID 時以 16 位元組二進位傳送，否則使用 UTF-8"""
+    try:
+        return uuid.UUID(req_id).bytes
+    except ValueError:
+        return req_id.encode("utf-8")
+
+
+def decode_correlation(data: bytes) -> str:
+    """還原 encode_correlation 的結果（16 位元組視為 UUID）"""
+    data = bytes(data)
+    if len(data) == 16:
+        return str(uuid.UUID(bytes=data))
+    return data.decode("utf-8", errors="replace")
+
+
+def request_properties(req_id: str, response_topic: str, expiry: float,
+                       alias: Optional[int] = None) -> Properties:
+    """cmd/point 的 PUBLISH 屬性：回覆主題、關聯資料與訊息逾期"""
+    props = Properties(PacketTypes.PUBLISH)
+    props.ResponseTopic = response_topic
+    props.CorrelationData = encode_correlation(req_id)
+    # broker 在逾期後直接丟棄，避免 B 端延遲執行過期的指令
+    props.MessageExpiryInterval = max(1, int(math.ceil(expiry)))
+    if alias:
+        props.TopicAlias = alias
+    return props
+
+
+def response_properties(correlation_data: Optional[bytes],
+                        alias: Optional[int] = None) -> Optional[Properties]:
+    """回覆訊息的 PUBLISH 屬性：原樣帶回 Correlation Data"""
+    if not correlation_data and not alias:
+        return None
+    props = Properties(PacketTypes.PUBLISH)
+    if correlation_data:
+        props.CorrelationData = correlation_data
+    if alias:
+        props.TopicAlias = alias
+    return props
+
+
+def correlation_id(msg: mqtt.MQTTMessage) -> Optional[str]:
+    """取出訊息的 Correlation Data（即 req_id），v3.1.1 訊息回傳 None"""
+    data = getattr(getattr(msg, "properties", None), "CorrelationData", None)
+    if not data:
+        return None
+    return decode_correlation(data)
+
+
+def response_topic(msg: mqtt.MQTTMessage) -> Optional[str]:
+    """取出訊息的 Response Topic，v3.1.1 訊息回傳 None"""
+    return getattr(getattr(msg, "properties", None), "ResponseTopic", None) or None
+
+
+class TopicAliasTable:
+    """
+    發送端 topic alias 表
+    每條連線第一次使用某主題時送出完整主題 + alias，之後只送 alias（空主題）
+    只用於 QoS 0：paho 重連後原樣重送未確認的 QoS 1/2 訊息，而 alias 只在原連線有效，
+    重送的空主題訊息會被 broker 視為協議錯誤
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._maximum = 0
+        self._aliases: Dict[str, int] = {}
+        self._established: Set[int] = set()
+
+    def reset(self, maximum: int):
+        """新連線建立時呼叫：alias 只在單一連線內有效"""
+        with self._lock:
+            self._maximum = maximum or 0
+            self._established.clear()
+            self._aliases = {t: a for t, a in self._aliases.items() if a <= self._maximum}
+
+    def resolve(self, topic: str, qos: int = 0) -> Tuple[str, Optional[int]]:
+        """
+        回傳 (實際送出的主題, alias)；QoS > 0 或無可用 alias 時原樣送出
+        回傳後 alias 即視為已建立，多線程發送時需改用 publish()，
+        否則其他線程可能在完整主題送出前先送出只帶 alias 的訊息
+        """
+        with self._lock:
+            return self._resolve(topic, qos)
+
+    def _resolve(self, topic: str, qos: int) -> Tuple[str, Optional[int]]:
+        if qos > 0:
+            return topic, None
+        alias = self._aliases.get(topic)
+        if alias is None:
+            if len(self._aliases) >= self._maximum:
+                return topic, None
+            alias = len(self._aliases) + 1
+            self._aliases[topic] = alias
+        if alias in self._established:
+            return "", alias
+        self._established.add(alias)
+        return topic, alias
+
+    def publish(self, client: mqtt.Client, topic: str, payload: Any, qos: int,
+                properties: Callable[[Optional[int]], Properties]) -> mqtt.MQTTMessageInfo:
+        """
+        以 alias 發送；properties(alias) 產生 PUBLISH 屬性
+        持有鎖直到 paho 排入封包，建立 alias 的完整主題訊息一定先於只帶 alias 的訊息送出
+        """
+        with self._lock:
+            sent_topic, alias = self._resolve(topic, qos)
+            return client.publish(sent_topic, payload, qos=qos, properties=properties(alias))
@@ -0,0 +1,356 @@
+"""
+paho 回調與處理線程的效能剖析（選用）
+以 MQTT_PROFILE=<檔案> 或各工具的 --profile <檔案> 啟用：
+- 量測每個回調（on_message 等）與處理函式的耗時
+- 記錄 loop-lag：每個 client 定期發送自我 ping（QoS 0，主題 profiling/ping/<client_id>），
+  往返時間扣除觀察到的最小往返即為 ping 在網路線程排隊等待的時間，反映網路線程是否被慢回調卡住
+  （paho 在呼叫回調前才設定 msg.timestamp，無法用來量測排隊）
+- 啟用後的前 window 秒擷取剖析資料並寫入檔案：
+    sample   定期取樣所有線程的呼叫堆疊，輸出 folded stacks（可用 flamegraph.pl / speedscope 開啟）
+    cprofile 剖析回調，每個線程各用一個 cProfile，結束時合併輸出 pstats 檔（python -m pstats <檔案>）
+未啟用時所有函式都是直接回傳原物件，沒有額外開銷
+"""
+
+import atexit
+import cProfile
+import logging
+import multiprocessing
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Set
+
+from correlator import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+PROFILE_PATH = os.getenv("MQTT_PROFILE", "")
+PROFILE_WINDOW = float(os.getenv("MQTT_PROFILE_WINDOW", "30"))
+PROFILE_MODE = os.getenv("MQTT_PROFILE_MODE", "sample")       # sample 或 cprofile
+SAMPLE_INTERVAL = float(os.getenv("MQTT_PROFILE_INTERVAL", "0.005"))
+PING_INTERVAL = float(os.getenv("MQTT_PROFILE_PING", "0.5"))          # 0 表示不量測 loop-lag
+PING_TOPIC = "profiling/ping"
+
+CALLBACKS = ("on_connect", "on_disconnect", "on_message", "on_publish", "on_subscribe")
+
+
+class _Timing:
+    __slots__ = ("sketch", "errors")
+
+    def __init__(self):
+        self.sketch = LatencySketch()
+        self.errors = 0
+
+
+def _client_id(client) -> str:
+    client_id = getattr(client, "client_id", None) or getattr(client, "_client_id", b"")
+    return client_id.decode() if isinstance(client_id, bytes) else str(client_id)
+
+
+class _Pinger:
+    """
+    定期向自己發送 ping，由被包裝的 on_message 攔截：
+    往返時間 − 最小往返 = ping 在網路線程前排隊的時間（loop-lag）
+    """
+
+    def __init__(self, profiler: "Profiler", client, prefix: str, interval: float):
+        self.profiler = profiler
+        self.client = client
+        self.topic = f"{PING_TOPIC}/{_client_id(client) or id(client)}"
+        self.lag_name = f"{prefix}loop_lag"
+        self.rtt_name = f"{prefix}ping_rtt"
+        self.interval = interval
+        self.min_rtt: Optional[float] = None
+        self.subscribed = False
+        threading.Thread(target=self._run, name=f"profiler-ping-{prefix or 'client'}", daemon=True).start()
+
+    def _run(self):
+        while not self.profiler.stopped.wait(self.interval):
+            try:
+                if not self.client.is_connected():
+                    self.subscribed = False
+                    continue
+                if not self.subscribed:
+                    self.client.subscribe(self.topic, qos=0)
+                    self.subscribed = True
+                    continue
+                self.client.publish(self.topic, repr(time.monotonic()).encode(), qos=0)
+            except Exception as e:
+                logger.debug(f"loop-lag ping 失敗: {e}")
+
+    def handle(self, msg) -> bool:
+        """ping 訊息時記錄並回傳 True（不交給原本的回調）"""
+        if getattr(msg, "topic", None) != self.topic:
+            return False
+        try:
+            rtt = time.monotonic() - float(msg.payload)
+        except (TypeError, ValueError):
+            return True
+        if self.min_rtt is None or rtt < self.min_rtt:
+            self.min_rtt = rtt
+        self.profiler._record(self.rtt_name, rtt)
+        self.profiler._record(self.lag_name, rtt - self.min_rtt)
+        return True
+
+
+class Profiler:
+    def __init__(self, path: str, window: float = 30.0, mode: str = "sample",
+                 interval: float = SAMPLE_INTERVAL, ping_interval: float = PING_INTERVAL):
+        if mode not in ("sample", "cprofile"):
+            raise ValueError(f"未知的剖析模式: {mode}")
+        self.path = path
+        self.window = window
+        self.mode = mode
+        self.interval = interval
+        self.ping_interval = ping_interval
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._timings: Dict[str, _Timing] = {}
+        self._deadline = time.monotonic() + window
+        self._capturing = True
+        self._written = False
+        self._samples: Counter = Counter()
+        # cprofile 模式：每個線程各自的 cProfile（只在該線程 enable/disable），結束時合併
+        self._profiles: Dict[int, cProfile.Profile] = {}
+        self._active: Set[int] = set()
+        self._dumped = False
+        if mode == "sample":
+            threading.Thread(target=self._sample_loop, name="profiler", daemon=True).start()
+        atexit.register(self.stop)
+        logger.info(f"剖析已啟用：{mode} 模式，擷取 {window:.0f} 秒 → {path}")
+
+    # ---- 計時 ----
+    def _record(self, name: str, elapsed: float, failed: bool = False):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = _Timing()
+            timing.sketch.add(elapsed)
+            if failed:
+                timing.errors += 1
+
+    def wrap_callback(self, name: str, fn: Callable, pinger: Optional[_Pinger] = None) -> Callable:
+        """包裝 paho 回調：計時，cprofile 模式下在擷取時間窗內剖析；on_message 攔截 loop-lag ping"""
+
+        def wrapper(*args, **kwargs):
+            if pinger is not None and args and pinger.handle(args[-1]):
+                return None
+            start = time.monotonic()
+            profile = self._profile_begin(start)
+            failed = False
+            if profile:
+                profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                if profile:
+                    profile.disable()
+                    self._profile_end()
+                self._record(name, time.monotonic() - start, failed)
+                if self._capturing and time.monotonic() >= self._deadline:
+                    self._finish_capture()
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    def _profile_begin(self, now: float) -> Optional[cProfile.Profile]:
+        """取得目前線程的 cProfile；不在擷取時間窗內時回傳 None"""
+        if self.mode != "cprofile" or not self._capturing or now >= self._deadline:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            if not self._capturing:
+                return None
+            profile = self._profiles.get(ident)
+            if profile is None:
+                profile = self._profiles[ident] = cProfile.Profile()
+            self._active.add(ident)
+        return profile
+
+    def _profile_end(self):
+        with self._lock:
+            self._active.discard(threading.get_ident())
+            # 擷取已結束但當時仍有回調在剖析中：由最後一個結束的回調寫出
+            ready = not self._capturing and not self._active and not self._dumped
+            if ready:
+                self._dumped = True
+        if ready:
+            self._write_capture()
+
+    def wrap(self, name: str, fn: Callable) -> Callable:
+        """包裝一般處理函式（例如在其他線程執行的點位處理）"""
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._record(name, time.monotonic() - start, failed)
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    def instrument(self, client, prefix: str = ""):
+        """包裝 client 上已設定的回調"""
+        pinger = None
+        if self.ping_interval > 0 and getattr(client, "on_message", None) is not None \
+                and not hasattr(client.on_message, "__wrapped__"):
+            pinger = _Pinger(self, client, prefix, self.ping_interval)
+        for attr in CALLBACKS:
+            fn = getattr(client, attr, None)
+            if fn is not None and not hasattr(fn, "__wrapped__"):
+                setattr(client, attr, self.wrap_callback(f"{prefix}{attr}", fn,
+                                                         pinger if attr == "on_message" else None))
+
+    # ---- 取樣 ----
+    def _sample_loop(self):
+        me = threading.get_ident()
+        names = {}
+        while self._capturing and time.monotonic() < self._deadline:
+            time.sleep(self.interval)
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[";".join(reversed(stack))] += 1
+        self._finish_capture()
+
+    # ---- 輸出 ----
+    def _finish_capture(self):
+        with self._lock:
+            if not self._capturing:
+                return
+            self._capturing = False
+            ready = not self._active and not self._dumped
+            if ready:
+                self._dumped = True
+        if ready:
+            self._write_capture()
+
+    def _write_capture(self):
+        try:
+            if self.mode == "cprofile":
+                with self._lock:
+                    profiles = list(self._profiles.values())
+                if not profiles:
+                    logger.info("擷取時間窗內沒有回調，未寫入剖析資料")
+                    return
+                pstats.Stats(*profiles).dump_stats(self.path)
+            else:
+                with open(self.path, "w", encoding="utf-8") as f:
+                    for stack, count in self._samples.most_common():
+                        f.write(f"{stack} {count}\n")
+            logger.info(f"剖析資料已寫入 {self.path}")
+        except OSError as e:
+            logger.error(f"無法寫入剖析資料: {e}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {
+                    "count": t.sketch.count,
+                    "errors": t.errors,
+                    "mean_ms": t.sketch.total / t.sketch.count * 1000 if t.sketch.count else 0.0,
+                    "p50_ms": t.sketch.quantile(0.5) * 1000,
+                    "p99_ms": t.sketch.quantile(0.99) * 1000,
+                    "max_ms": t.sketch.max * 1000,
+                    "total_s": t.sketch.total
+                }
+                for name, t in self._timings.items()
+            }
+
+    def report(self) -> str:
+        lines = [f"{'名稱':<34} {'次數':>8} {'平均(ms)':>10} {'p50(ms)':>10} {'p99(ms)':>10} "
+                 f"{'最大(ms)':>10} {'總計(s)':>9}"]
+        for name, r in sorted(self.snapshot().items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(f"{name:<34} {r['count']:>8} {r['mean_ms']:>10.3f} {r['p50_ms']:>10.3f} "
+                         f"{r['p99_ms']:>10.3f} {r['max_ms']:>10.3f} {r['total_s']:>9.3f}")
+        return "\n".join(lines)
+
+    def stop(self):
+        """結束擷取並寫出計時摘要（<檔案>.txt）"""
+        self.stopped.set()
+        self._finish_capture()
+        if self._written:
+            return
+        self._written = True
+        report = self.report()
+        try:
+            with open(f"{self.path}.txt", "w", encoding="utf-8") as f:
+                f.write(report + "\n")
+        except OSError as e:
+            logger.error(f"無法寫入剖析摘要: {e}")
+        logger.info(f"回調與處理耗時（*.loop_lag 為自我 ping 在網路線程排隊的時間）:\n{report}")
+
+
+_profiler: Optional[Profiler] = None
+
+
+def configure(path: str = PROFILE_PATH, window: float = PROFILE_WINDOW,
+              mode: str = PROFILE_MODE) -> Optional[Profiler]:
+    """啟用剖析；path 為空時不啟用"""
+    global _profiler
+    if path and _profiler is None:
+        _profiler = Profiler(path, window, mode)
+    return _profiler
+
+
+def get() -> Optional[Profiler]:
+    return _profiler
+
+
+def instrument(client, prefix: str = ""):
+    """剖析啟用時包裝 client 的回調"""
+    if _profiler is not None:
+        _profiler.instrument(client, prefix)
+
+
+def wrap(name: str, fn: Callable) -> Callable:
+    """剖析啟用時包裝處理函式，否則原樣回傳"""
+    return _profiler.wrap(name, fn) if _profiler is not None else fn
+
+
+def stop():
+    if _profiler is not None:
+        _profiler.stop()
+
+
+def add_arguments(parser):
+    """各工具共用的命令列參數"""
+    parser.add_argument('--profile', metavar='FILE', default=PROFILE_PATH or None,
+                        help='啟用剖析：回調耗時與 loop-lag 寫入 FILE.txt，剖析資料寫入 FILE')
+    parser.add_argument('--profile-window', type=float, default=PROFILE_WINDOW,
+                        help=f'擷取剖析資料的秒數 (默認: {PROFILE_WINDOW:.0f})')
+    parser.add_argument('--profile-mode', choices=['sample', 'cprofile'], default=PROFILE_MODE,
+                        help='sample 取樣所有線程，cprofile 剖析回調 (默認: sample)')
+
+
+def configure_from_args(args) -> Optional[Profiler]:
+    """依命令列參數啟用，並寫回環境變數讓子程序沿用"""
+    if not args.profile:
+        return _profiler
+    os.environ["MQTT_PROFILE"] = args.profile
+    os.environ["MQTT_PROFILE_WINDOW"] = str(args.profile_window)
+    os.environ["MQTT_PROFILE_MODE"] = args.profile_mode
+    return configure(args.profile, args.profile_window, args.profile_mode)
+
+
+# 以環境變數啟用時，匯入即開始；子程序（例如批次 worker）以 PID 區分輸出檔
+if PROFILE_PATH and multiprocessing.parent_process() is not None:
+    configure(f"{PROFILE_PATH}.{os.getpid()}")
+else:
+    configure()
@@ -0,0 +1,181 @@
+"""
+量測 session 管理與控制通道
+- START 依 session_id 去重：QoS 1 重複投遞或已結束的 session 不再啟動第二個演算法
+- 不同 job_id 的 START 取代執行中的 session（舊 session 被中止）；相同 job_id 視為重複觸發
+- abort 走 v1/<id>/ctrl/abort，可使用獨立連線（ControlLane），不會排在大量 cmd/point 之後
+"""
+
+import json
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+import codec
+import dedup
+
+ABORTED = "aborted"
+
+
+class SessionAborted(Exception):
+    """所屬 session 已中止或被取代"""
+
+
+class Session:
+    """單次演算法執行；cancel() 後所有等待中的請求立即返回"""
+
+    def __init__(self, session_id: str, job_id: Optional[str] = None):
+        self.session_id = session_id
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.reason: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, threading.Event] = {}   # req_id → 等待結果的 Event
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        return self._cancelled
+
+    def cancel(self, reason: str = "aborted") -> bool:
+        """中止並喚醒所有等待中的請求；已中止時回傳 False"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return False
+            self.reason = reason
+            self._cancelled.set()
+            waiters = list(self._waiters.values())
+        for ev in waiters:
+            ev.set()
+        return True
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise SessionAborted(f"session {self.session_id} 已中止: {self.reason}")
+
+    def track(self, req_id: str, ev: threading.Event):
+        with self._lock:
+            self._waiters[req_id] = ev
+            cancelled = self._cancelled.is_set()
+        if cancelled:
+            ev.set()
+
+    def untrack(self, req_id: str):
+        with self._lock:
+            self._waiters.pop(req_id, None)
+
+    def pending(self) -> List[str]:
+        with self._lock:
+            return list(self._waiters)
+
+
+class SessionManager:
+    """
+    同一時間只有一個執行中的 session
+    on_cancel(session) 在 session 被中止或取代時呼叫（例如喚醒等待發送名額的線程）
+    """
+
+    def __init__(self, window: float = 300.0, capacity: int = 1024,
+                 on_cancel: Optional[Callable[[Session], None]] = None):
+        self._lock = threading.Lock()
+        self.current: Optional[Session] = None
+        self._recent = dedup.RecentlyCompleted(window, capacity)   # 已結束或中止的 session_id
+        self.on_cancel = on_cancel
+
+    def start(self, session_id: Optional[str] = None, job_id: Optional[str] = None,
+              supersede: bool = False) -> Tuple[Optional[Session], Optional[Session]]:
+        """
+        回傳 (新 session, 被取代的 session)；重複的 START 回傳 (None, None)
+        沒有 session_id 的 START（舊版 B）一律視為新的 session
+        """
+        superseded = None
+        with self._lock:
+            current = self.current
+            if session_id and (self._recent.get(session_id)
+                               or (current and current.session_id == session_id)):
+                return None, None
+            if current and not current.cancelled and job_id and current.job_id == job_id \
+                    and not supersede:
+                return None, None
+            session = Session(session_id or str(uuid.uuid4()), job_id)
+            if current and not current.cancelled:
+                superseded = current
+            self.current = session
+        if superseded:
+            self._cancel(superseded, f"superseded by {session.session_id}")
+        return session, superseded
+
+    def abort(self, session_id: Optional[str] = None, reason: str = "aborted") -> Optional[Session]:
+        """中止指定（或目前）的 session；回傳被中止的 session"""
+        with self._lock:
+            current = self.current
+            if session_id:
+                # 尚未開始的 session 先記下，之後到達的 START 直接忽略
+                self._recent.add(session_id, ABORTED)
+            if not current or (session_id and current.session_id != session_id):
+                return None
+        return current if self._cancel(current, reason) else None
+
+    def finish(self, session: Session):
+        with self._lock:
+            self._recent.add(session.session_id, ABORTED if session.cancelled else dedup.DONE)
+            if self.current is session:
+                self.current = None
+
+    def _cancel(self, session: Session, reason: str) -> bool:
+        if not session.cancel(reason):
+            return False
+        if self.on_cancel:
+            self.on_cancel(session)
+        return True
+
+
+def abort_payload(session_id: Optional[str], sender: str, reason: str = "operator") -> str:
+    return json.dumps({
+        "type": "abort",
+        "session_id": session_id,
+        "reason": reason,
+        "sender": sender,
+        "ts": int(time.time())
+    })
+
+
+class ControlLane:
+    """
+    控制訊息的獨立連線
+    主連線的 broker 佇列與 paho 線程被大量 cmd/point 佔用時，abort 仍能立即送達
+    """
+
+    def __init__(self, client, topic: str, handler: Callable[[Dict], None]):
+        self.client = client
+        self.topic = topic
+        self.handler = handler
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        if rc == 0:
+            client.subscribe(self.topic, qos=1)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            data = codec.loads(msg.payload)
+        except Exception:
+            return
+        if isinstance(data, dict):
+            self.handler(data)
+
+    def connect(self, host: str, port: int, keepalive: int):
+        self.client.connect(host, port, keepalive=keepalive)
+        self.client.loop_start()
+
+    def publish(self, payload: str):
+        self.client.publish(self.topic, payload, qos=1)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
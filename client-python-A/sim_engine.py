@@ -0,0 +1,290 @@
+"""
+B 模擬器工作負載引擎
+以 NumPy 批次產生量測結果（含頻譜大小的陣列），使用固定種子的 RNG 讓基準測試可重現，
+處理時間由可替換的延遲模型決定
+"""
+
+import abc
+import math
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# 特徵集合：basic 與原本的模擬器相同，vibration 與 C# B 端的振動分析特徵相同
+FEATURE_SETS: Dict[str, List[str]] = {
+    "basic": ["temperature", "pressure", "vibration", "speed"],
+    "vibration": [
+        "Time_skewness_y", "Time_kurtosis_y", "Time_rms_y", "Time_crestfactor_y",
+        "Powerspectrum_skewness_y", "Powerspectrum_kurtosis_y",
+        "Powerspectrum_rms_y", "Powerspectrum_crestfactor_y"
+    ],
+}
+
+
+class LatencyModel(abc.ABC):
+    """延遲模型基底：sample() 回傳處理一個點位所需的秒數"""
+
+    @abc.abstractmethod
+    def sample(self, rng: np.random.Generator, x: float, y: float,
+               prev: Tuple[float, float]) -> float:
+        """rng 為引擎的 RNG，prev 為上一個點位（設備移動前的位置）"""
+
+
+class FixedLatency(LatencyModel):
+    """固定延遲（原本的 processing_delay）"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def sample(self, rng, x, y, prev):
+        return self.seconds
+
+
+class LognormalLatency(LatencyModel):
+    """對數常態延遲：median 為中位數秒數，sigma 為對數標準差"""
+
+    def __init__(self, median: float, sigma: float = 0.25):
+        self.mu = math.log(median)
+        self.sigma = sigma
+
+    def sample(self, rng, x, y, prev):
+        return float(rng.lognormal(self.mu, self.sigma))
+
+
+class TravelLatency(LatencyModel):
+    """
+    依移動距離計算延遲，與 C# B 端相同：移動時間 max(min_move, 距離/speed) + 分析時間
+    speed 單位為座標單位/秒
+    """
+
+    def __init__(self, speed: float = 100.0, analysis: float = 0.2, min_move: float = 0.1):
+        self.speed = speed
+        self.analysis = analysis
+        self.min_move = min_move
+
+    def sample(self, rng, x, y, prev):
+        distance = math.hypot(x - prev[0], y - prev[1])
+        return max(self.min_move, distance / self.speed) + self.analysis
+
+
+class TailSpikeLatency(LatencyModel):
+    """在其他模型上加入長尾尖峰：以 probability 的機率將延遲放大 factor 倍"""
+
+    def __init__(self, inner: LatencyModel, probability: float = 0.01, factor: float = 10.0):
+        self.inner = inner
+        self.probability = probability
+        self.factor = factor
+
+    def sample(self, rng, x, y, prev):
+        value = self.inner.sample(rng, x, y, prev)
+        if rng.random() < self.probability:
+            value *= self.factor
+        return value
+
+
+_LATENCY_MODELS = {"fixed": FixedLatency, "lognormal": LognormalLatency, "travel": TravelLatency}
+
+
+def parse_latency_model(spec: str) -> LatencyModel:
+    """
+    解析延遲模型描述
+      fixed:2.0               固定 2 秒
+      lognormal:0.5,0.3       中位數 0.5 秒、sigma 0.3
+      travel:100,0.2          速度 100 單位/秒、分析 0.2 秒
+      spike:0.01,10+<模型>    在 <模型> 上加 1% 機率的 10 倍尖峰
+    """
+    name, _, args = spec.strip().partition(":")
+    name = name.lower()
+    if name == "spike":
+        params, _, inner = args.partition("+")
+        if not inner:
+            raise ValueError(f"spike 模型需要內層模型: {spec}")
+        model, args = TailSpikeLatency, params
+        values: List = [parse_latency_model(inner)]
+    else:
+        model = _LATENCY_MODELS.get(name)
+        if model is None:
+            raise ValueError(f"未知的延遲模型: {spec}")
+        values = []
+    try:
+        values += [float(v) for v in args.split(",") if v]
+        return model(*values)
+    except (TypeError, ValueError):
+        # 參數數量不符或不是數字
+        raise ValueError(f"延遲模型參數錯誤: {spec}") from None
+
+
+class SimulatorEngine:
+    """
+    向量化結果產生器
+    同一 seed、同一命令順序會產生相同的數值與延遲序列
+    """
+
+    def __init__(self, seed: Optional[int] = None, feature_set: str = "basic",
+                 spectrum_size: int = 0, sampling_rate: int = 1000,
+                 latency: Optional[LatencyModel] = None):
+        if feature_set not in FEATURE_SETS:
+            raise ValueError(f"未知的特徵集合: {feature_set}")
+        self.seed = seed
+        self.feature_set = feature_set
+        self.features = FEATURE_SETS[feature_set]
+        self.spectrum_size = spectrum_size
+        self.sampling_rate = sampling_rate
+        self.latency = latency
+        self.rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._position = (0.0, 0.0)
+
+    @property
+    def analysis_mode(self) -> str:
+        return "full_spectrum" if self.spectrum_size else "features"
+
+    def sample_latency(self, x: float, y: float, default: float = 0.0) -> float:
+        """抽樣處理時間，並記錄設備移動後的位置"""
+        with self._lock:
+            prev, self._position = self._position, (x, y)
+            if self.latency is None:
+                return default
+            return self.latency.sample(self.rng, x, y, prev)
+
+    def generate_batch(self, points: Sequence[Sequence[float]]) -> Dict[str, np.ndarray]:
+        """
+        一次產生多個點位的結果
+        回傳 values: (n, 特徵數) float64；spectrum_size > 0 時另含 spectrum: (n, spectrum_size) float32
+        """
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        with self._lock:
+            if self.feature_set == "basic":
+                values = self._basic_values(pts)
+            else:
+                values = self._vibration_values(pts)
+            batch = {"values": values}
+            if self.spectrum_size:
+                batch["spectrum"] = self._spectrum(pts)
+        return batch
+
+    def generate(self, x: float, y: float) -> Tuple[List[float], Optional[np.ndarray]]:
+        """產生單一點位的特徵值與頻譜"""
+        batch = self.generate_batch([(x, y)])
+        spectrum = batch["spectrum"][0] if "spectrum" in batch else None
+        return batch["values"][0].tolist(), spectrum
+
+    def _basic_values(self, pts: np.ndarray) -> np.ndarray:
+        n = len(pts)
+        u = self.rng.random((n, 4))
+        values = np.empty((n, 4))
+        values[:, 0] = np.round(20 + (u[:, 0] * 20 - 5), 2) + np.abs(pts[:, 0]) * 0.1   # temperature
+        values[:, 1] = np.round(1013 + (u[:, 1] * 100 - 50), 1) + np.abs(pts[:, 1]) * 0.5  # pressure
+        values[:, 2] = np.round(u[:, 2] * 10, 3)                                        # vibration
+        values[:, 3] = np.round(10 + u[:, 3] * 90, 1)                                   # speed
+        return values
+
+    def _vibration_values(self, pts: np.ndarray) -> np.ndarray:
+        n = len(pts)
+        u = self.rng.random((n, 8))
+        noise = (self.rng.random(n) - 0.5) * 0.2
+        amp = 1.0 + np.abs(pts[:, 0]) * 0.1 + np.abs(pts[:, 1]) * 0.05
+        return np.column_stack([
+            (u[:, 0] - 0.5) * 2 + noise,        # skewness_y
+            u[:, 1] * 3 + 2 + noise,            # kurtosis_y
+            amp * (0.5 + u[:, 2] * 0.5),        # rms_y
+            2.0 + u[:, 3] * 2 + noise,          # crestfactor_y
+            (u[:, 4] - 0.5) * 1.5 + noise,      # PS skewness_y
+            u[:, 5] * 2 + 1.5 + noise,          # PS kurtosis_y
+            amp * (0.3 + u[:, 6] * 0.4),        # PS rms_y
+            1.5 + u[:, 7] * 1.5 + noise         # PS crestfactor_y
+        ])
+
+    def _spectrum(self, pts: np.ndarray) -> np.ndarray:
+        """功率頻譜：齒輪嚙合頻率諧波峰值 + 對數常態雜訊底"""
+        n, size = len(pts), self.spectrum_size
+        freqs = np.linspace(0.0, self.sampling_rate / 2, size, dtype=np.float32)
+        amp = (1.0 + np.abs(pts[:, 0]) * 0.1 + np.abs(pts[:, 1]) * 0.05).astype(np.float32)
+        mesh = (50.0 + self.rng.random(n) * 10.0).astype(np.float32)
+        width = self.sampling_rate / size * 2.0
+        spectrum = self.rng.lognormal(-3.0, 0.5, (n, size)).astype(np.float32)
+        for harmonic in (1, 2, 3):
+            centre = (mesh * harmonic)[:, None]
+            peak = np.exp(-0.5 * ((freqs[None, :] - centre) / width) ** 2)
+            spectrum += (amp / harmonic)[:, None] * peak.astype(np.float32)
+        return spectrum
+
+
+class _Request:
+    __slots__ = ("point", "values", "spectrum", "error", "leader", "done")
+
+    def __init__(self, x: float, y: float):
+        self.point = (x, y)
+        self.values: Optional[List[float]] = None
+        self.spectrum: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.leader = False
+        self.done = threading.Event()
+
+
+class BatchGenerator:
+    """
+    把各處理線程同時送來的 generate 請求合併成一次 generate_batch
+    第一個到達的線程負責產生，產生期間到達的請求排入下一批（與 journal 的 group commit 相同），
+    單一請求時等同直接呼叫 engine.generate
+    """
+
+    def __init__(self, engine: SimulatorEngine, max_batch: int = 256):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._queue: List[_Request] = []
+        self._busy = False
+        self.batches = 0
+        self.generated = 0
+
+    def generate(self, x: float, y: float) -> Tuple[List[float], Optional[np.ndarray]]:
+        """產生單一點位的特徵值與頻譜（可能與其他線程的點位同批產生）"""
+        request = _Request(x, y)
+        with self._lock:
+            self._queue.append(request)
+            request.leader = not self._busy
+            self._busy = True
+        if not request.leader:
+            request.done.wait()
+            if request.leader:
+                # 被指派為下一批的產生者
+                request.done.clear()
+        if request.leader:
+            self._run()
+        if request.error is not None:
+            raise request.error
+        return request.values, request.spectrum
+
+    def _run(self):
+        # 產生者一定是佇列的第一個請求，因此包含在這一批中
+        with self._lock:
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+        try:
+            result = self.engine.generate_batch([r.point for r in batch])
+            spectra = result.get("spectrum")
+            for i, r in enumerate(batch):
+                r.values = result["values"][i].tolist()
+                r.spectrum = spectra[i] if spectra is not None else None
+        except Exception as e:
+            for r in batch:
+                r.error = e
+        with self._lock:
+            self.batches += 1
+            self.generated += len(batch)
+            if self._queue:
+                # 產生期間到達的請求：由下一批的第一個請求接手
+                self._queue[0].leader = True
+                self._queue[0].done.set()
+            else:
+                self._busy = False
+        for r in batch:
+            r.done.set()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "generated": self.generated,
+                "mean_batch": round(self.generated / self.batches, 2) if self.batches else 0.0
+            }
@@ -0,0 +1,208 @@
+"""
+量測點的空間索引
+以均勻格點分桶（hash grid）保存已量測的點，新增 O(1)；
+k 近鄰由查詢點所在格向外逐圈搜尋，半徑查詢只檢查涵蓋的格，
+並以反距離加權（IDW）估計未量測位置的特徵值，演算法可據此略過能估計的量測
+"""
+
+import heapq
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from aggregators import Aggregator, parse_bounds
+
+# 範圍已知且未指定格寬時，每軸約分成這麼多格
+AUTO_CELLS = 64
+
+
+class Neighbor:
+    __slots__ = ("distance", "x", "y", "values")
+
+    def __init__(self, distance: float, x: float, y: float, values: Dict[str, float]):
+        self.distance = distance
+        self.x = x
+        self.y = y
+        self.values = values
+
+    def __repr__(self):
+        return f"Neighbor(d={self.distance:.4g}, x={self.x}, y={self.y})"
+
+
+class SpatialIndex(Aggregator):
+    """
+    cell_size 未指定時：範圍已知（config/setting 的 scan_area）取範圍 / AUTO_CELLS，
+    否則先用 1.0，收到範圍後重新分桶一次
+    """
+
+    name = "spatial_index"
+    # 跨執行保留已量測的點，後續執行才能以近鄰/IDW 略過量測
+    per_run = False
+
+    def __init__(self, cell_size: Optional[float] = None):
+        self._lock = threading.Lock()
+        self._auto = cell_size is None
+        self.cell_size = cell_size or 1.0
+        self._points: List[Tuple[float, float, Dict[str, float]]] = []
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._extent: Optional[List[int]] = None   # 已使用格的 [i_min, i_max, j_min, j_max]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._points)
+
+    # ---- Aggregator ----
+    def configure(self, settings):
+        bounds = parse_bounds(settings)
+        if not (bounds and self._auto):
+            return
+        x_min, x_max, y_min, y_max = bounds
+        cell = max(x_max - x_min, y_max - y_min) / AUTO_CELLS
+        with self._lock:
+            if cell != self.cell_size:
+                self.cell_size = cell
+                self._rebuild()
+
+    def update(self, x, y, features, values):
+        self.insert(x, y, dict(zip(features, values)))
+
+    def reset(self):
+        with self._lock:
+            self._points = []
+            self._cells = {}
+            self._extent = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "points": len(self._points),
+                "cells": len(self._cells),
+                "cell_size": self.cell_size
+            }
+
+    # ---- 新增 ----
+    def insert(self, x: float, y: float, values: Dict[str, Any]):
+        values = {k: float(v) for k, v in values.items()
+                  if isinstance(v, (int, float)) and math.isfinite(v)}
+        with self._lock:
+            self._points.append((float(x), float(y), values))
+            self._add(len(self._points) - 1)
+
+    def _key(self, x: float, y: float) -> Tuple[int, int]:
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _add(self, index: int):
+        x, y, _ = self._points[index]
+        key = self._key(x, y)
+        self._cells.setdefault(key, []).append(index)
+        if self._extent is None:
+            self._extent = [key[0], key[0], key[1], key[1]]
+        else:
+            e = self._extent
+            e[0], e[1] = min(e[0], key[0]), max(e[1], key[0])
+            e[2], e[3] = min(e[2], key[1]), max(e[3], key[1])
+
+    def _rebuild(self):
+        self._cells = {}
+        self._extent = None
+        for i in range(len(self._points)):
+            self._add(i)
+
+    # ---- 查詢 ----
+    def _ring(self, ci: int, cj: int, r: int):
+        if r == 0:
+            yield ci, cj
+            return
+        for i in range(ci - r, ci + r + 1):
+            yield i, cj - r
+            yield i, cj + r
+        for j in range(cj - r + 1, cj + r):
+            yield ci - r, j
+            yield ci + r, j
+
+    def nearest(self, x: float, y: float, k: int = 1) -> List[Neighbor]:
+        """k 近鄰（依距離排序）"""
+        with self._lock:
+            if not self._points or k <= 0:
+                return []
+            ci, cj = self._key(x, y)
+            e = self._extent
+            # 查詢點到最遠的已使用格所需的圈數，超過即不可能再找到點
+            max_r = max(abs(ci - e[0]), abs(ci - e[1]), abs(cj - e[2]), abs(cj - e[3]))
+            heap: List[Tuple[float, int]] = []   # (-距離, 索引) 的最大堆，保留最近 k 個
+            r = 0
+            while r <= max_r:
+                for key in self._ring(ci, cj, r):
+                    for idx in self._cells.get(key, ()):
+                        px, py, _ = self._points[idx]
+                        d = math.hypot(px - x, py - y)
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-d, idx))
+                        elif d < -heap[0][0]:
+                            heapq.heapreplace(heap, (-d, idx))
+                # 第 r 圈之外的點距離至少 r × 格寬
+                if len(heap) == k and -heap[0][0] <= r * self.cell_size:
+                    break
+                r += 1
+            return [self._neighbor(-nd, idx) for nd, idx in sorted(heap, reverse=True)]
+
+    def within(self, x: float, y: float, radius: float) -> List[Neighbor]:
+        """距離 radius 內的點（依距離排序）"""
+        with self._lock:
+            if not self._points:
+                return []
+            i0, j0 = self._key(x - radius, y - radius)
+            i1, j1 = self._key(x + radius, y + radius)
+            e = self._extent
+            i0, i1 = max(i0, e[0]), min(i1, e[1])
+            j0, j1 = max(j0, e[2]), min(j1, e[3])
+            found = []
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+                # 半徑涵蓋的格比已使用的格多時，直接走訪已使用的格
+                keys = [key for key in self._cells if i0 <= key[0] <= i1 and j0 <= key[1] <= j1]
+            else:
+                keys = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+            for key in keys:
+                for idx in self._cells.get(key, ()):
+                    px, py, _ = self._points[idx]
+                    d = math.hypot(px - x, py - y)
+                    if d <= radius:
+                        found.append((d, idx))
+            found.sort()
+            return [self._neighbor(d, idx) for d, idx in found]
+
+    def _neighbor(self, distance: float, index: int) -> Neighbor:
+        x, y, values = self._points[index]
+        return Neighbor(distance, x, y, values)
+
+    def interpolate(self, x: float, y: float, k: int = 8, power: float = 2.0,
+                    radius: Optional[float] = None,
+                    features: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        反距離加權估計：w = 1 / d^power；與量測點重合時直接使用該點的值
+        radius 指定時只使用半徑內的點（最多 k 個）；沒有可用的點時回傳 None
+        回傳 values（估計值）、spread（加權標準差，可作為估計可信度）、neighbors 與 nearest 距離
+        """
+        neighbors = self.within(x, y, radius)[:k] if radius is not None else self.nearest(x, y, k)
+        if not neighbors:
+            return None
+        names = features or sorted({name for n in neighbors for name in n.values})
+        values: Dict[str, float] = {}
+        spread: Dict[str, float] = {}
+        exact = [n for n in neighbors if n.distance == 0.0]
+        for name in names:
+            pool = [n for n in (exact or neighbors) if name in n.values]
+            if not pool:
+                continue
+            weights = [1.0 if exact else n.distance ** -power for n in pool]
+            total = sum(weights)
+            mean = sum(w * n.values[name] for w, n in zip(weights, pool)) / total
+            var = sum(w * (n.values[name] - mean) ** 2 for w, n in zip(weights, pool)) / total
+            values[name] = mean
+            spread[name] = math.sqrt(var)
+        return {
+            "values": values,
+            "spread": spread,
+            "neighbors": len(neighbors),
+            "nearest": neighbors[0].distance
+        }
@@ -0,0 +1,73 @@
+import errno
+import json
+
+import pytest
+
+import a_client
+from a_client import MQTTClient, TOP_CTRL_ABORT, TOP_CTRL_END, TOP_STATUS
+from journal import Journal
+
+
+class RecordingClient:
+    """paho Client 的替身：只記錄 publish"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload))
+
+    def messages(self, topic):
+        return [json.loads(p) for t, p in self.published if t == topic]
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(a_client, "JOURNAL_PATH", str(tmp_path / "run.jsonl"))
+    c = MQTTClient("311")
+    c.client = RecordingClient()
+    c.is_connected = True
+    return c
+
+
+def _disk_full(*args, **kwargs):
+    raise OSError(errno.ENOSPC, "No space left on device")
+
+
+def test_journal_write_failure_aborts_run(client, monkeypatch):
+    monkeypatch.setattr(Journal, "dispatch", _disk_full)
+    client.run_algorithm()
+    end, = client.client.messages(TOP_CTRL_END)
+    assert end["summary"]["successful_points"] == 0
+    assert end["summary"]["aborted"].startswith("journal:")
+    assert client.client.messages(TOP_CTRL_ABORT)[0]["reason"].startswith("journal:")
+    assert client.client.messages(TOP_STATUS)[-1]["state"] == "aborted"
+    # session 已結束，之後的 START 不會被拒絕
+    assert client.sessions.current is None
+    session, _ = client.sessions.start("next")
+    assert session is not None
+
+
+def test_journal_close_failure_still_sends_end(client, monkeypatch):
+    monkeypatch.setattr(Journal, "finish", _disk_full)
+    monkeypatch.setattr(client, "send_point_and_wait", lambda *a, **kw: {"features": [], "values": []})
+    client.run_algorithm()
+    end, = client.client.messages(TOP_CTRL_END)
+    assert end["summary"]["successful_points"] == 4
+    assert end["summary"]["aborted"].startswith("journal:")
+    assert client.sessions.current is None
+
+
+def test_journal_for_other_points_aborts_run(client):
+    Journal(a_client.JOURNAL_PATH, [(0.0, 0.0)], fsync=False).close()
+    client.run_algorithm()
+    end, = client.client.messages(TOP_CTRL_END)
+    assert "另一批點位" in end["summary"]["aborted"]
+    assert client.sessions.current is None
+
+
+@pytest.mark.parametrize("shared_results,unknown", [(False, 1), (True, 0)])
+def test_foreign_results_on_shared_topic(shared_results, unknown):
+    client = MQTTClient("311", shared_results=shared_results)
+    client._on_stale_result("other-worker-req", {"type": "result_feature_set"})
+    assert client.result_metrics().get("unknown", 0) == unknown
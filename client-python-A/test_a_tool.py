@@ -0,0 +1,180 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from a_tool import InteractiveDispatcher, handle_command, merge_worker_stats, parse_point_list, partition_points
+from clock_sync import LatencyBreakdown
+from flow_control import FlowController
+
+
+class FakeClient:
+    """send_point_and_wait 的替身：記錄點位，(-1, -1) 視為沒有結果"""
+
+    def __init__(self, delay: float = 0.0, bounds=None):
+        self.delay = delay
+        self.sent = []
+        self.heatmap = SimpleNamespace(bounds=bounds)
+        self.flow = FlowController()
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def send_point_and_wait(self, x, y, timeout=5.0, retries=2):
+        with self._lock:
+            self.sent.append((x, y))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.release.wait(timeout=5)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if (x, y) == (-1.0, -1.0):
+            return None
+        return {"features": ["t"], "values": [x + y]}
+
+
+def test_parse_point_list_separators():
+    assert parse_point_list("0,0 10,-2.5; 3e1,4") == [(0.0, 0.0), (10.0, -2.5), (30.0, 4.0)]
+    assert parse_point_list("  ") == []
+
+
+@pytest.mark.parametrize("text", ["1", "1,2,3", "a,b", "1,", "nan,1", "1,inf", "1,2 x"])
+def test_parse_point_list_malformed(text):
+    with pytest.raises(ValueError):
+        parse_point_list(text)
+
+
+def test_parse_point_list_bounds():
+    bounds = (0.0, 10.0, -5.0, 5.0)
+    assert parse_point_list("0,-5 10,5", bounds) == [(0.0, -5.0), (10.0, 5.0)]
+    with pytest.raises(ValueError, match="超出掃描範圍"):
+        parse_point_list("1,1 11,0", bounds)
+
+
+def test_dispatcher_runs_points_concurrently():
+    client = FakeClient(delay=0.05)
+    dispatcher = InteractiveDispatcher(client, inflight=3)
+    dispatcher.submit([(float(i), 0.0) for i in range(6)] + [(-1.0, -1.0)])
+    dispatcher.close(wait=True)
+    assert sorted(client.sent) == sorted([(float(i), 0.0) for i in range(6)] + [(-1.0, -1.0)])
+    assert (dispatcher.succeeded, dispatcher.failed) == (6, 1)
+    assert client.max_active <= 3
+    assert len(dispatcher.latencies) == 6
+
+
+def test_dispatcher_clear_cancels_queued():
+    client = FakeClient()
+    client.release.clear()
+    dispatcher = InteractiveDispatcher(client, inflight=1)
+    dispatcher.submit([(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)])
+    deadline = time.time() + 2
+    while not client.sent and time.time() < deadline:
+        time.sleep(0.01)
+    assert dispatcher.clear() == 2
+    client.release.set()
+    dispatcher.close(wait=True)
+    assert client.sent == [(1.0, 1.0)]
+    assert dispatcher.succeeded == 1
+
+
+def test_handle_command_routing(capsys, tmp_path):
+    client = FakeClient()
+    dispatcher = InteractiveDispatcher(client, inflight=2)
+    assert handle_command(dispatcher, "")
+    assert handle_command(dispatcher, "help")
+    assert "paste" in capsys.readouterr().out
+    assert handle_command(dispatcher, "1,2 3,4")
+    points = tmp_path / "points.txt"
+    points.write_text("# 註解\n5,6\nbad\n")
+    assert handle_command(dispatcher, f"load {points}")
+    lines = iter(["7,8; 9,10", "# skip", "oops", ""])
+    assert handle_command(dispatcher, "paste", read_line=lambda: next(lines))
+    assert handle_command(dispatcher, "STATUS")
+    assert "成功" in capsys.readouterr().out
+    assert not handle_command(dispatcher, "q")
+    assert not handle_command(dispatcher, "exit")
+    dispatcher.close(wait=True)
+    assert sorted(client.sent) == [(1.0, 2.0), (3.0, 4.0), (5.0, 6.0), (7.0, 8.0), (9.0, 10.0)]
+
+
+def test_handle_command_bad_input(capsys):
+    client = FakeClient(bounds=(0.0, 10.0, 0.0, 10.0))
+    dispatcher = InteractiveDispatcher(client)
+    assert handle_command(dispatcher, "hello")
+    assert "錯誤: 格式錯誤" in capsys.readouterr().out
+    assert handle_command(dispatcher, "5,5 20,5")          # 整行有超出範圍的點位時不排入
+    assert "超出掃描範圍" in capsys.readouterr().out
+    lines = iter(["1,1 99,1", "2,2", ""])
+    handle_command(dispatcher, "paste", read_line=lambda: next(lines))
+    assert "跳過: 1,1 99,1" in capsys.readouterr().out
+    dispatcher.close(wait=True)
+    assert client.sent == [(2.0, 2.0)]
+
+
+POINTS = [(3.0, 1.0), (0.0, 2.0), (1.0, 0.0), (0.0, 0.0), (2.0, 5.0), (1.0, 1.0), (3.0, 0.0)]
+
+
+@pytest.mark.parametrize("strategy", ["roundrobin", "spatial"])
+@pytest.mark.parametrize("workers", [1, 3, 10])
+def test_partition_points_covers_every_point_once(strategy, workers):
+    parts = partition_points(POINTS, workers, strategy)
+    assert len(parts) == workers
+    merged = sorted(item for part in parts for item in part)
+    # 保留原始索引，合併時可還原順序
+    assert merged == [(i, x, y) for i, (x, y) in enumerate(POINTS)]
+    sizes = [len(part) for part in parts]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_partition_points_strategies():
+    assert partition_points(POINTS, 3) == [
+        [(0, 3.0, 1.0), (3, 0.0, 0.0), (6, 3.0, 0.0)],
+        [(1, 0.0, 2.0), (4, 2.0, 5.0)],
+        [(2, 1.0, 0.0), (5, 1.0, 1.0)],
+    ]
+    # spatial 依 (x, y) 排序後切成連續區塊
+    assert partition_points(POINTS, 3, "spatial") == [
+        [(3, 0.0, 0.0), (1, 0.0, 2.0), (2, 1.0, 0.0)],
+        [(5, 1.0, 1.0), (4, 2.0, 5.0)],
+        [(6, 3.0, 0.0), (0, 3.0, 1.0)],
+    ]
+    assert partition_points([], 2) == [[], []]
+
+
+def _timing(samples):
+    breakdown = LatencyBreakdown()
+    for i in range(samples):
+        t1 = 1_000_000_000 + i * 10_000_000
+        breakdown.add({"t_send_ns": t1, "t_recv_ns": t1 + 1_000_000, "t_start_ns": t1 + 2_000_000,
+                       "t_reply_ns": t1 + 5_000_000}, t1 + 6_000_000)
+    return breakdown
+
+
+def test_merge_worker_stats():
+    stats = [
+        {"worker": 1, "result_metrics": {"duplicate": 1, "late": 2}, "timing": _timing(3),
+         "tls": {"handshakes": 1, "resumed": 0}, "journal": {"records": 6, "commits": 2, "fsync_ms": 1.5}},
+        {"worker": 0, "result_metrics": {"duplicate": 2}, "timing": _timing(2),
+         "tls": {"handshakes": 1, "resumed": 1}, "journal": {"records": 4, "commits": 3, "fsync_ms": 0.5}},
+    ]
+    metrics, latency, handshakes, journals = merge_worker_stats(stats)
+    assert metrics == {"duplicate": 3, "late": 2, "unknown": 0}
+    assert latency["components_ms"]["total"]["count"] == 5
+    assert latency["components_ms"]["total"]["p50"] == pytest.approx(6.0, rel=0.02)
+    # 各 worker 的時鐘估計分開保留
+    assert set(latency["clocks"]) == {"B (w0)", "B (w1)"}
+    assert handshakes == {"handshakes": 2, "resumed": 1}
+    assert journals == {"records": 10, "commits": 5, "fsync_ms": 2.0, "records_per_commit": 2.0}
+
+
+def test_merge_worker_stats_without_optional_parts():
+    # 無法連線的 worker 只回傳編號
+    metrics, latency, handshakes, journals = merge_worker_stats(
+        [{"worker": 0}, {"worker": 1, "result_metrics": {}, "timing": None, "tls": None, "journal": None}])
+    assert metrics == {"duplicate": 0, "late": 0, "unknown": 0}
+    assert latency["components_ms"]["total"]["count"] == 0
+    assert handshakes is None and journals is None
@@ -0,0 +1,98 @@
+import math
+
+import numpy as np
+import pytest
+
+from aggregators import Aggregator, FeatureStats, GridHeatmap, parse_bounds
+
+
+def test_parse_bounds_forms():
+    expected = (0.0, 10.0, -5.0, 5.0)
+    assert parse_bounds("0,10,-5,5") == expected
+    assert parse_bounds({"scan_area": {"x_min": 0, "x_max": 10, "y_min": -5, "y_max": 5}}) == expected
+    assert parse_bounds({"x_min": 0, "x_max": 10, "y_min": -5, "y_max": 5}) == expected
+    assert parse_bounds([0, 10, -5, 5]) == expected
+    assert parse_bounds(None) is None
+    assert parse_bounds({"other": 1}) is None
+    with pytest.raises(ValueError):
+        parse_bounds("0,10,5")
+    with pytest.raises(ValueError):
+        parse_bounds("10,0,0,1")
+
+
+def test_feature_stats_welford():
+    stats = FeatureStats()
+    for v in (2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0):
+        stats.update(0, 0, ["t", "s"], [v, "n/a"])
+    snap = stats.snapshot()
+    assert set(snap) == {"t"}                   # 非數值被略過
+    assert snap["t"]["count"] == 8
+    assert snap["t"]["mean"] == 5.0
+    assert snap["t"]["variance"] == pytest.approx(32 / 7, abs=1e-6)
+    assert (snap["t"]["min"], snap["t"]["max"]) == (2.0, 9.0)
+    stats.reset()
+    assert stats.snapshot() == {} and stats.results == 0
+
+
+def test_heatmap_cells_and_edges():
+    heat = GridHeatmap(bins_x=4, bins_y=2, bounds=(0, 4, 0, 2))
+    assert heat.cell(0, 0) == (0, 0)
+    assert heat.cell(4, 2) == (1, 3)            # 上界落在最後一格
+    assert heat.cell(5, 1) is None
+    heat.update(5, 1, ["t"], [1.0])
+    assert heat.outside == 1
+
+
+def test_heatmap_per_feature_means():
+    heat = GridHeatmap(bins_x=2, bins_y=1, bounds=(0, 2, 0, 1))
+    heat.update(0.5, 0.5, ["t", "p"], [10.0, 1.0])
+    heat.update(0.5, 0.5, ["t"], [20.0])        # 缺少 p 的結果不影響 p 的平均
+    heat.update(1.5, 0.5, ["t", "p"], [5.0, float("nan")])
+    assert heat.grid("t").tolist() == [[15.0, 5.0]]
+    p = heat.grid("p")
+    assert p[0, 0] == 1.0 and math.isnan(p[0, 1])
+    assert heat.counts().tolist() == [[2, 1]]
+    assert heat.counts("p").tolist() == [[1, 0]]
+    snap = heat.snapshot()
+    assert snap["cells_covered"] == 2 and snap["coverage"] == 1.0
+    assert snap["features"] == ["p", "t"]
+
+
+def test_heatmap_without_bounds_then_configure():
+    heat = GridHeatmap(bins_x=2, bins_y=2)
+    heat.update(1, 1, ["t"], [1.0])
+    assert heat.unbinned == 1 and heat.counts() is None
+    heat.configure({"scan_area": {"x_min": 0, "x_max": 2, "y_min": 0, "y_max": 2}})
+    heat.update(1.5, 0.5, ["t"], [3.0])
+    assert heat.counts().sum() == 1
+    heat.reset()
+    assert heat.counts().sum() == 0 and heat.grid("t") is None
+    assert np.array_equal(heat.counts(), np.zeros((2, 2)))
+
+
+def test_aggregator_interface_is_abstract():
+    with pytest.raises(TypeError):
+        Aggregator()
+
+    class UpdateOnly(Aggregator):
+        def update(self, x, y, features, values):
+            pass
+
+    with pytest.raises(TypeError):
+        UpdateOnly()
+
+    class Counter(UpdateOnly):
+        count = 0
+
+        def update(self, x, y, features, values):
+            self.count += 1
+
+        def snapshot(self):
+            return {"count": self.count}
+
+    counter = Counter()
+    # configure/reset 有預設實作
+    counter.configure({"features": ["a"]})
+    counter.update(0.0, 0.0, ["a"], [1.0])
+    counter.reset()
+    assert counter.snapshot() == {"count": 1}
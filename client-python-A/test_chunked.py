@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import chunked
+from chunked import ChunkCache, ChunkReassembler
+
+
+def test_encode_and_parse_header():
+    array = np.arange(10, dtype=np.float32)
+    chunks = chunked.encode_chunks("req-1", array, 4)
+    assert len(chunks) == chunked.chunk_count(10, 4) == 3
+    assert all(chunked.is_chunk(c) for c in chunks)
+    header = chunked.parse_header(chunks[2])
+    assert (header.req_id, header.seq, header.total, header.length, header.offset) == \
+        ("req-1", 2, 3, 10, 8)
+    assert header.dtype == np.dtype("<f4")
+    assert chunked.describe(array, 4) == {"encoding": "chunked", "dtype": "float32",
+                                          "length": 10, "chunks": 3}
+
+
+def test_reassemble_out_of_order_with_duplicates():
+    array = np.linspace(0, 1, 1000)
+    chunks = chunked.encode_chunks("r", array, 128)
+    reasm = ChunkReassembler()
+    for payload in reversed(chunks[1:]):
+        assert reasm.feed(payload) == ("r", False)
+    reasm.feed(chunks[3])                       # 重複分塊被忽略
+    assert reasm.missing("r", len(chunks)) == [0]
+    assert reasm.take("r") is None
+    assert reasm.feed(chunks[0]) == ("r", True)
+    assert reasm.is_complete("r")
+    np.testing.assert_array_equal(reasm.take("r"), array)
+    assert reasm.take("r") is None
+
+
+def test_resend_subset_and_accept_filter():
+    array = np.arange(20, dtype=np.int16)
+    assert len(chunked.encode_chunks("r", array, 5, seqs=[1, 3, 9])) == 2
+    reasm = ChunkReassembler()
+    assert reasm.feed(chunked.encode_chunks("other", array, 5)[0], accept=lambda rid: rid == "r") is None
+    assert reasm.missing("r", 4) == [0, 1, 2, 3]
+
+
+def test_invalid_payloads():
+    with pytest.raises(ValueError):
+        chunked.encode_chunks("r", np.array(["a"]), 4)
+    bad = bytearray(chunked.encode_chunks("r", np.zeros(4, dtype=np.float32), 4)[0])
+    bad[3] = 99                                 # dtype 代碼
+    with pytest.raises(ValueError):
+        chunked.parse_header(bytes(bad))
+
+
+def test_expired_assemblers_discarded():
+    reasm = ChunkReassembler(max_age=0.0)
+    chunks = chunked.encode_chunks("a", np.zeros(8, dtype=np.float32), 4)
+    reasm.feed(chunks[0])
+    reasm.feed(chunked.encode_chunks("b", np.zeros(8, dtype=np.float32), 4)[0])
+    assert reasm.missing("a", 2) == [0, 1]
+
+
+def test_chunk_cache_capacity():
+    cache = ChunkCache(capacity=2)
+    for rid in ("a", "b", "c"):
+        cache.put(rid, np.zeros(1), f"topic/{rid}")
+    assert cache.get("a") is None
+    assert cache.get("c")[1] == "topic/c"
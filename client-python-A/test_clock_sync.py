@@ -0,0 +1,80 @@
+import pickle
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from clock_sync import COMPONENTS, ClockSync, LatencyBreakdown, breakdown, received_ns
+
+MS = 1_000_000
+
+
+def exchange(t1, offset, out, processing, back):
+    """A 時鐘 t1 發送；B 時鐘比 A 快 offset"""
+    t2 = t1 + out + offset
+    t3 = t2 + processing
+    t4 = t3 - offset + back
+    return t1, t2, t3, t4
+
+
+def test_symmetric_exchange_recovers_offset():
+    sync = ClockSync()
+    offset, delay = sync.add(*exchange(0, 50 * MS, 2 * MS, 5 * MS, 2 * MS))
+    assert offset == 50 * MS
+    assert delay == 4 * MS
+
+
+def test_filter_picks_lowest_delay_sample():
+    sync = ClockSync()
+    sync.add(*exchange(0, 10 * MS, 30 * MS, MS, 2 * MS))   # 不對稱，偏移估計有誤差
+    sync.add(*exchange(MS, 10 * MS, MS, MS, MS))
+    assert sync.offset() == 10 * MS
+    assert sync.snapshot()["min_delay_ms"] == 2.0
+
+
+def test_inconsistent_exchange_rejected():
+    sync = ClockSync()
+    assert sync.add(0, 100, 50, 10) is None
+    assert sync.rejected == 1
+    assert sync.offset() is None
+
+
+def test_drift_estimate():
+    sync = ClockSync(min_span=1.0)
+    drift = 20e-6
+    for i in range(20):
+        t1 = i * 200 * MS
+        sync.add(*exchange(t1, int(5 * MS + drift * t1), MS, MS, MS))
+    assert sync.drift() == pytest.approx(drift, rel=0.01)
+    assert sync.offset(4000 * MS) == pytest.approx(5 * MS + drift * 4000 * MS, rel=1e-3)
+
+
+def test_breakdown_components_sum_to_total():
+    t1, t2, t3, t4 = exchange(0, 7 * MS, 2 * MS, 10 * MS, 3 * MS)
+    timing = {"t_send_ns": t1, "t_recv_ns": t2, "t_start_ns": t2 + 4 * MS, "t_reply_ns": t3}
+    parts = breakdown(timing, t4, 7 * MS)
+    assert parts == {"network_out": 2.0, "queue": 4.0, "processing": 6.0,
+                     "network_back": 3.0, "total": 15.0}
+
+
+def test_received_ns_uses_timestamp():
+    before = time.time_ns()
+    msg = SimpleNamespace(timestamp=time.monotonic() - 0.5)
+    assert received_ns(msg) <= before - 400 * MS
+    assert received_ns(SimpleNamespace()) >= before
+
+
+def test_latency_breakdown_add_and_merge():
+    a, b = LatencyBreakdown(), LatencyBreakdown()
+    assert a.add({"t_send_ns": 0}, 0) is None          # 舊版 B 沒有完整 timing
+    for i in range(3):
+        t1, t2, t3, t4 = exchange(i * MS, 3 * MS, MS, 2 * MS, MS)
+        timing = {"t_send_ns": t1, "t_recv_ns": t2, "t_reply_ns": t3}
+        assert a.add(timing, t4)["total"] == 4.0
+        b.add(timing, t4, source="B2")
+    # worker 的統計經 pickle 傳回主程序後合併
+    a.merge(pickle.loads(pickle.dumps(b)), label="@w1")
+    snap = a.snapshot()
+    assert set(snap["components_ms"]) == set(COMPONENTS)
+    assert snap["components_ms"]["total"]["count"] == 6
+    assert set(snap["clocks"]) == {"B", "B2@w1"}
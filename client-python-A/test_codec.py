@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+import codec
+from codec import PayloadCodec
+
+
+RESULT = {"type": "result_feature_set", "point": {"x": 1.0, "y": 2.0},
+          "features": ["temperature", "pressure", "vibration", "speed"],
+          "values": [25.1, 101.3, 0.02, 1500.0], "ts": 1700000000, "sender": "B", "req_id": "abc"}
+
+
+def test_negotiate():
+    assert codec.negotiate(None) is None
+    assert codec.negotiate(["zlib", "unknown"]) == "zlib"
+    assert codec.negotiate(["unknown"]) is None
+    # 依本機偏好順序挑選
+    assert codec.negotiate(["zlib", "lz4", "zstd"], preferred=("zlib", "zstd")) == "zlib"
+
+
+def test_uncompressed_passthrough():
+    plain = PayloadCodec()
+    payload = plain.encode(RESULT)
+    assert not codec.is_compressed(payload)
+    assert codec.loads(payload) == RESULT
+    assert codec.decode(b'{"a": 1}') == b'{"a": 1}'
+
+
+@pytest.mark.parametrize("name", codec.available_codecs())
+def test_round_trip(name):
+    enc = PayloadCodec(name, threshold=0)
+    large = dict(RESULT, values=list(range(500)))
+    payload = enc.encode(large)
+    assert codec.is_compressed(payload)
+    assert codec.loads(payload) == large
+
+
+def test_dictionary_compresses_small_result():
+    with_dict = PayloadCodec("zlib").encode(RESULT)
+    without = PayloadCodec("zlib", use_dict=False).encode(RESULT)
+    raw = json.dumps(RESULT).encode("utf-8")
+    assert codec.is_compressed(with_dict)
+    assert len(with_dict) < len(raw)
+    # 沒有字典時小於門檻不壓縮
+    assert without == raw
+
+
+def test_incompressible_payload_sent_raw():
+    data = os.urandom(1024)
+    assert PayloadCodec("zlib", threshold=0, use_dict=False).encode(data) == data
+
+
+def test_unknown_codec_and_dictionary():
+    with pytest.raises(ValueError):
+        PayloadCodec("brotli")
+    with pytest.raises(ValueError):
+        codec.decode(codec.MAGIC + bytes((codec.CODEC_IDS["zlib"], 99)) + b"x")
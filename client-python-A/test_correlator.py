@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from correlator import LatencySketch, RequestCorrelator
+
+
+def test_sketch_quantile_relative_error():
+    sketch = LatencySketch()
+    for i in range(1, 1001):
+        sketch.add(i / 1000)
+    assert sketch.count == 1000
+    assert sketch.max == pytest.approx(1.0)
+    # 對數分桶的相對誤差約 (gamma - 1) / 2
+    assert sketch.quantile(0.5) == pytest.approx(0.5, rel=0.02)
+    assert sketch.quantile(0.99) == pytest.approx(0.99, rel=0.02)
+
+
+def test_sketch_empty_and_merge():
+    a, b = LatencySketch(), LatencySketch()
+    assert a.quantile(0.5) == 0.0
+    for v in (0.01, 0.02):
+        a.add(v)
+    b.add(0.5)
+    a.merge(b)
+    assert a.count == 3
+    assert a.total == pytest.approx(0.53)
+    assert a.max == 0.5
+    with pytest.raises(ValueError):
+        a.merge(LatencySketch(gamma=1.05))
+
+
+def test_request_result_latency():
+    corr = RequestCorrelator()
+    corr.request("r1", "dev", now=10.0)
+    assert corr.open_requests() == 1
+    assert corr.result("r1", now=10.25) == pytest.approx(0.25)
+    assert corr.open_requests() == 0
+    stats = corr.snapshot()["dev"]
+    assert stats["matched"] == 1
+    assert stats["latency_max"] == pytest.approx(0.25)
+
+
+def test_retransmit_duplicate_and_unmatched():
+    corr = RequestCorrelator()
+    corr.request("r1", "dev", now=1.0)
+    corr.request("r1", "dev", now=2.0)       # 重試不重設起點
+    assert corr.result("r1", now=3.0) == pytest.approx(2.0)
+    assert corr.result("r1", "dev", now=3.1) is None
+    assert corr.result("r2", now=3.2) is None
+    stats = corr.snapshot()["dev"]
+    assert stats["retransmits"] == 1
+    assert stats["duplicates"] == 1
+    assert stats["duplicate_rate"] == 1.0
+    assert corr.unmatched_results == 1
+
+
+def test_expired_requests_count_as_lost():
+    # snapshot() 以 time.monotonic() 清除逾期請求，時間點需接近現在
+    t0 = time.monotonic()
+    corr = RequestCorrelator(max_age=5.0, capacity=2)
+    corr.request("old", "dev", now=t0 - 10.0)
+    corr.request("a", "dev", now=t0)         # old 已逾期
+    corr.request("b", "dev", now=t0)
+    corr.request("c", "dev", now=t0)
+    # 下一次操作時超過容量的最舊請求 a 被擠出
+    assert corr.result("old", now=t0) is None
+    assert corr.open_requests() == 2
+    stats = corr.snapshot()["dev"]
+    assert stats["lost"] == 2
+    assert stats["loss_rate"] == 1.0
+
+
+def test_prometheus_format():
+    corr = RequestCorrelator(quantiles=(0.5,))
+    corr.request("r1", "dev", now=0.0)
+    corr.result("r1", now=0.1)
+    text = corr.prometheus(prefix="t")
+    assert 't_request_latency_seconds_count{device="dev"} 1' in text
+    assert 't_request_latency_seconds{device="dev",quantile="0.5"}' in text
+    assert "t_requests_open 0" in text
+    assert text.endswith("\n")
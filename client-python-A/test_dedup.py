@@ -0,0 +1,51 @@
+import time
+
+from dedup import ABANDONED, DONE, RecentlyCompleted, ResultCounters
+
+
+def test_add_and_get_state():
+    recent = RecentlyCompleted()
+    recent.add("r1")
+    recent.add("r2", ABANDONED)
+    assert recent.get("r1") == DONE
+    assert recent.get("r2") == ABANDONED
+    assert recent.get("r3") is None
+    assert len(recent) == 2
+
+
+def test_capacity_evicts_oldest():
+    recent = RecentlyCompleted(capacity=2)
+    for req_id in ("a", "b", "c"):
+        recent.add(req_id)
+    assert recent.get("a") is None
+    assert recent.get("c") == DONE
+    assert len(recent) == 2
+
+
+def test_readd_moves_to_newest_and_updates_state():
+    recent = RecentlyCompleted(capacity=2)
+    recent.add("a", ABANDONED)
+    recent.add("b")
+    recent.add("a", DONE)        # 晚到的結果：移到最新並更新狀態
+    recent.add("c")
+    assert recent.get("a") == DONE
+    assert recent.get("b") is None
+
+
+def test_window_expires():
+    recent = RecentlyCompleted(window=0.05)
+    recent.add("a")
+    time.sleep(0.1)
+    assert recent.get("a") is None
+    assert len(recent) == 0
+
+
+def test_result_counters():
+    counters = ResultCounters()
+    counters.incr("duplicate")
+    counters.incr("duplicate")
+    counters.incr("late")
+    snap = counters.snapshot()
+    assert snap == {"duplicate": 2, "late": 1, "unknown": 0}
+    snap["late"] = 99                # 回傳複本
+    assert counters.snapshot()["late"] == 1
@@ -0,0 +1,93 @@
+import threading
+
+from flow_control import FlowController
+
+
+def test_acquire_blocks_at_window():
+    flow = FlowController(initial=2)
+    assert flow.acquire(timeout=0) == 1
+    assert flow.acquire(timeout=0) == 2
+    assert flow.acquire(timeout=0.01) == 0
+    flow.release()
+    assert flow.acquire(timeout=0) == 3
+
+
+def test_acquire_cancel():
+    flow = FlowController(initial=1)
+    flow.acquire()
+    cancel = threading.Event()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(flow.acquire(cancel=cancel)))
+    waiter.start()
+    cancel.set()
+    flow.wake()
+    waiter.join(timeout=2)
+    assert result == [0]
+
+
+def test_disabled_never_blocks():
+    flow = FlowController(initial=1, enabled=False)
+    assert all(flow.acquire(timeout=0) for _ in range(10))
+    assert flow.snapshot()["mode"] == "off"
+
+
+def test_aimd_increase_and_maximum():
+    flow = FlowController(initial=4, maximum=5)
+    for _ in range(100):
+        flow.acquire(timeout=0)
+        flow.release(success=True)
+    assert flow.cwnd == 5
+
+
+def test_aimd_one_decrease_per_window():
+    flow = FlowController(initial=8)
+    tickets = [flow.acquire(timeout=0) for _ in range(8)]
+    for ticket in tickets:
+        flow.on_timeout(ticket)
+    assert flow.cwnd == 4
+    assert flow.timeouts == 8
+    for _ in tickets:
+        flow.release(success=False)
+    # 縮小後才發出的請求逾時，會再縮小一次
+    ticket = flow.acquire(timeout=0)
+    flow.on_timeout(ticket)
+    assert flow.cwnd == 2
+
+
+def test_aimd_minimum():
+    flow = FlowController(initial=2, minimum=1)
+    for _ in range(5):
+        flow.on_timeout()
+    assert flow.cwnd == 1
+
+
+def test_credit_mode_grant():
+    flow = FlowController(initial=1)
+    flow.update("b1", {"online": True, "flow": {"window": 4, "available": 3, "queue_depth": 0}})
+    flow.update("b2", {"online": True, "flow": {"window": 2, "available": 2, "queue_depth": 0}})
+    assert flow.credit_mode
+    assert flow.limit() == 5
+    assert not flow.backlogged()
+    # credit 模式下逾時不縮小視窗
+    flow.on_timeout(flow.acquire(timeout=0))
+    assert flow.cwnd == 1
+
+
+def test_credit_offline_source_removed():
+    flow = FlowController()
+    flow.update("b1", {"flow": {"window": 4, "available": 0, "queue_depth": 2}})
+    assert flow.backlogged()
+    flow.update("b1", {"online": False})
+    assert not flow.credit_mode
+    assert flow.snapshot()["mode"] == "aimd"
+
+
+def test_share_splits_credit():
+    flow = FlowController(maximum=256, share=0.5)
+    assert flow.maximum == 128
+    flow.update("b1", {"flow": {"window": 8, "available": 8, "queue_depth": 0}})
+    assert flow.limit() == 4
+    # 份額不足 1 時保留一個名額
+    tiny = FlowController(share=0.1)
+    tiny.update("b1", {"flow": {"window": 2, "available": 2, "queue_depth": 0}})
+    assert tiny.limit() == 1
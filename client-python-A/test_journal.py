@@ -0,0 +1,87 @@
+import errno
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from journal import Journal, points_digest, replay
+
+POINTS = [(0.0, 0.0), (1.0, 1.0), (2.0, 2.0)]
+
+
+def test_resume_reuses_results_and_req_ids(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    journal = Journal(path, POINTS, fsync=False)
+    assert not journal.resumed
+    journal.dispatch(0, "r0", 0.0, 0.0)
+    journal.complete(0, "r0", "success", result={"spectrum": np.arange(3)})
+    journal.dispatch(1, "r1", 1.0, 1.0)
+    journal.complete(1, "r1", "timeout", error="逾時")
+    journal.close()
+
+    # 模擬崩潰：最後一行只寫了一半
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"ev": "dispatch", "i": 2')
+    resumed = Journal(path, POINTS, fsync=False)
+    assert resumed.resumed
+    assert resumed.result(0) == {"spectrum": [0, 1, 2]}
+    assert resumed.result(1) is None
+    assert resumed.req_id(1) == "r1"
+    assert resumed.req_id(2) is None
+    resumed.finish()
+    resumed.close()
+    with open(path, encoding="utf-8") as f:
+        assert all(json.loads(line) for line in f)      # 不完整的行已被截掉
+
+    # 整批完成後重新開始
+    state = replay(path)
+    assert state.digest is None and not state.completed
+
+
+def test_other_points_rejected(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    Journal(path, POINTS, fsync=False).close()
+    assert replay(path).digest == points_digest(POINTS)
+    with pytest.raises(ValueError):
+        Journal(path, POINTS[:2], fsync=False)
+
+
+def test_group_commit_shares_fsync(tmp_path):
+    journal = Journal(str(tmp_path / "run.jsonl"), POINTS, commit_interval=0.05)
+    threads = [threading.Thread(target=journal.append, args=({"ev": "x", "i": i},),
+                                kwargs={"durable": True}) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    journal.close()
+    stats = journal.stats()
+    assert stats["records"] == 21
+    assert stats["commits"] < 21
+
+
+class _FullDisk:
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+def test_write_error_raised_to_callers(tmp_path):
+    journal = Journal(str(tmp_path / "run.jsonl"), POINTS, fsync=False)
+    journal._file = _FullDisk(journal._file)
+    with pytest.raises(OSError) as info:
+        journal.append({"ev": "x"}, durable=True)
+    assert info.value.errno == errno.ENOSPC
+    with pytest.raises(OSError):
+        journal.append({"ev": "y"})
+    with pytest.raises(OSError):
+        journal.flush()
+    with pytest.raises(OSError):
+        journal.close()
+    assert not journal._writer.is_alive()
@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+
+import pytest
+
+from a_client import MQTTClient, TOP_STATUS
+from b_client_simulator import BMQTTClient
+from local_bus import LocalBroker, parse_shared
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+class Recorder:
+    """連到 LocalBroker 的客戶端，記錄收到的 (主題, 內容, retain)"""
+
+    def __init__(self, broker: LocalBroker, client_id: str, *topic_filters: str):
+        self.messages = []
+        self._lock = threading.Lock()
+        self.client = broker.client(client_id)
+        self.client.on_message = self._on_message
+        self.client.connect()
+        self.client.loop_start()
+        for topic_filter in topic_filters:
+            self.client.subscribe(topic_filter, qos=1)
+
+    def _on_message(self, client, userdata, msg):
+        with self._lock:
+            self.messages.append((msg.topic, msg.payload, msg.retain))
+
+    def payloads(self):
+        with self._lock:
+            return [payload for _, payload, _ in self.messages]
+
+
+def test_parse_shared():
+    assert parse_shared("v1/x/cmd/point") == (None, "v1/x/cmd/point")
+    assert parse_shared("$share/b/v1/+/cmd/point") == ("b", "v1/+/cmd/point")
+    for invalid in ("$share/b", "$share//a", "$share/"):
+        with pytest.raises(ValueError):
+            parse_shared(invalid)
+
+
+def test_shared_group_delivers_each_message_once_and_spreads_load():
+    broker = LocalBroker()
+    members = [Recorder(broker, f"m{i}", "$share/workers/cmd/+") for i in range(3)]
+    other_group = Recorder(broker, "other", "$share/audit/cmd/#")
+    observer = Recorder(broker, "observer", "cmd/#")
+
+    publisher = broker.client("pub")
+    publisher.connect()
+    total = 30
+    for i in range(total):
+        publisher.publish(f"cmd/{i % 2}", str(i), qos=1)
+    _wait_for(lambda: sum(len(m.payloads()) for m in members) == total and len(observer.payloads()) == total)
+
+    expected = [str(i).encode() for i in range(total)]
+    received = [p for m in members for p in m.payloads()]
+    # 群組內每則訊息只交給一個成員，且輪流分攤
+    assert sorted(received) == sorted(expected)
+    assert [len(m.payloads()) for m in members] == [10, 10, 10]
+    # 每個群組與一般訂閱者各收到一份
+    assert other_group.payloads() == expected
+    assert observer.payloads() == expected
+    assert broker.stats()["delivered"] == total * 3
+
+    # 離線的成員不再分到訊息
+    members[0].client.crash()
+    for i in range(4):
+        publisher.publish("cmd/0", f"after-{i}", qos=1)
+    _wait_for(lambda: sum(len(m.payloads()) for m in members[1:]) == 24)
+    assert len(members[0].payloads()) == 10
+    assert [len(m.payloads()) for m in members[1:]] == [12, 12]
+
+
+def test_retained_and_will():
+    broker = LocalBroker()
+    publisher = broker.client("pub")
+    publisher.will_set("status/pub", "offline", qos=1, retain=True)
+    publisher.connect()
+    publisher.publish("config/setting", "v1", qos=1, retain=True)
+
+    late = Recorder(broker, "late", "config/#", "status/+")
+    _wait_for(lambda: late.messages)
+    assert late.messages == [("config/setting", b"v1", True)]
+    # 共享訂閱不補送 retained
+    shared = Recorder(broker, "shared", "$share/g/config/#")
+    publisher.crash()
+    _wait_for(lambda: len(late.messages) == 2)
+    assert late.messages[1] == ("status/pub", b"offline", False)
+    assert shared.payloads() == []
+
+
+def _start_b(broker: LocalBroker, instance_id: str = "") -> BMQTTClient:
+    b = BMQTTClient("311", share_group="bgroup", instance_id=instance_id, max_concurrency=2)
+    b.processing_delay = 0.0
+    b.spectrum_format = "json"
+    b.setup_client(client=broker.client(f"b-{instance_id or 'auto'}"))
+    b.connect()
+    b.client.loop_start()
+    return b
+
+
+def test_b_instances_use_separate_status_topics():
+    broker = LocalBroker()
+    auto = [BMQTTClient("311", share_group="bgroup", instance_id="") for _ in range(2)]
+    # 未指定實例識別碼時自動產生，client ID 與狀態主題不會相撞
+    assert auto[0].instance_id != auto[1].instance_id
+    assert auto[0].client_id != auto[1].client_id
+    assert auto[0].status_topic != auto[1].status_topic
+
+    watcher = Recorder(broker, "watcher", f"{TOP_STATUS}/+")
+    instances = [_start_b(broker, "b1"), _start_b(broker, "b2")]
+    a = MQTTClient("311")
+    a.setup_client(client=broker.client("a"))
+    a.connect()
+    a.client.loop_start()
+    try:
+        _wait_for(lambda: a.is_connected and len(a.flow.snapshot()["sources"]) == 2)
+        assert set(a.flow.snapshot()["sources"]) == {f"{TOP_STATUS}/b1", f"{TOP_STATUS}/b2"}
+        assert a.flow.limit() == 4
+        latest = {topic: json.loads(payload) for topic, payload, _ in watcher.messages}
+        assert {t: s["load"]["instance"] for t, s in latest.items()} == {
+            f"{TOP_STATUS}/b1": "b1", f"{TOP_STATUS}/b2": "b2"}
+
+        # 共享訂閱下每個點位只由一個實例處理
+        for i in range(10):
+            assert a.send_point_and_wait(float(i), 0.0, timeout=2.0, retries=0) is not None
+        # B 送出結果後才更新處理數
+        _wait_for(lambda: sum(b.load_snapshot()["processed"] for b in instances) == 10)
+        assert all(b.load_snapshot()["processed"] for b in instances)
+        assert a.result_metrics() == {"duplicate": 0, "late": 0, "unknown": 0}
+
+        # 一個實例異常斷線：遺囑只移除它自己的 credit
+        instances[0].client.crash()
+        _wait_for(lambda: set(a.flow.snapshot()["sources"]) == {f"{TOP_STATUS}/b2"})
+        assert a.flow.limit() == 2
+    finally:
+        a.disconnect()
+        a.client.loop_stop()
+        for b in instances:
+            b.disconnect()
+            b.client.loop_stop()
@@ -0,0 +1,289 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import a_client
+import b_client_simulator
+from mini_broker import (CONNACK, PUBACK, PUBLISH, SUBACK, MiniBroker, TopicTrie, _packet, _string,
+                         topic_matches, valid_filter)
+
+
+class RawClient:
+    """最小的 v3.1.1 客戶端：直接收發封包，可刻意不回 PUBACK 以測試重送"""
+
+    def __init__(self, port: int, client_id: str, clean: bool = True, will=None, timeout: float = 2.0):
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+        self._buffer = b""
+        self._pid = 0
+        flags = 0x02 if clean else 0
+        payload = _string(client_id.encode("utf-8"))
+        if will is not None:
+            topic, message = will
+            flags |= 0x04 | (1 << 3)
+            payload += _string(topic.encode("utf-8")) + _string(message)
+        body = _string(b"MQTT") + bytes((4, flags)) + (60).to_bytes(2, "big") + payload
+        self.sock.sendall(_packet(0x10, body))
+        header, body = self.read()
+        assert header >> 4 == CONNACK and body[1] == 0
+        self.session_present = bool(body[0] & 0x01)
+
+    def _next_pid(self) -> int:
+        self._pid += 1
+        return self._pid
+
+    def read(self):
+        """讀取一個封包，回傳 (固定標頭, 內容)"""
+        while True:
+            if len(self._buffer) >= 2:
+                length, shift, i = 0, 0, 1
+                while i < len(self._buffer):
+                    byte = self._buffer[i]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    i += 1
+                    if not byte & 0x80:
+                        if len(self._buffer) >= i + length:
+                            header, body = self._buffer[0], self._buffer[i:i + length]
+                            self._buffer = self._buffer[i + length:]
+                            return header, body
+                        break
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("broker 已關閉連線")
+            self._buffer += data
+
+    def subscribe(self, topic_filter: str, qos: int = 1):
+        body = self._next_pid().to_bytes(2, "big") + _string(topic_filter.encode("utf-8")) + bytes((qos,))
+        self.sock.sendall(_packet(0x82, body))
+        header, body = self.read()
+        assert header >> 4 == SUBACK and body[2] == qos
+
+    def publish(self, topic: str, payload: bytes, qos: int = 1, retain: bool = False):
+        body = _string(topic.encode("utf-8"))
+        if qos:
+            body += self._next_pid().to_bytes(2, "big")
+        self.sock.sendall(_packet(0x30 | (qos << 1) | (1 if retain else 0), body + payload))
+        if qos:
+            header, _ = self.read()
+            assert header >> 4 == PUBACK
+
+    def receive(self, ack: bool = True):
+        """讀取下一則 PUBLISH，回傳 (主題, 內容, pid, dup, retain)"""
+        header, body = self.read()
+        assert header >> 4 == PUBLISH
+        qos = (header >> 1) & 0x03
+        size = int.from_bytes(body[:2], "big")
+        topic = body[2:2 + size].decode("utf-8")
+        pos = 2 + size
+        pid = 0
+        if qos:
+            pid = int.from_bytes(body[pos:pos + 2], "big")
+            pos += 2
+            if ack:
+                self.sock.sendall(_packet(PUBACK << 4, pid.to_bytes(2, "big")))
+        return topic, bytes(body[pos:]), pid, bool(header & 0x08), bool(header & 0x01)
+
+    def nothing_pending(self, wait: float = 0.2) -> bool:
+        self.sock.settimeout(wait)
+        try:
+            self.read()
+        except socket.timeout:
+            return True
+        finally:
+            self.sock.settimeout(2.0)
+        return False
+
+    def disconnect(self):
+        self.sock.sendall(_packet(0xE0, b""))
+        self.sock.close()
+
+    def drop(self):
+        """不送 DISCONNECT 直接關閉 socket（異常斷線）"""
+        self.sock.close()
+
+
+@pytest.fixture
+def broker():
+    broker = MiniBroker(host="127.0.0.1", port=0).start_background()
+    yield broker
+    broker.stop_background()
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+def test_trie_wildcards_and_dollar_topics():
+    trie = TopicTrie()
+    filters = ["a/b", "a/+", "a/#", "+/b", "#", "$SYS/#", "$SYS/+/load"]
+    sessions = {f: object() for f in filters}
+    for topic_filter, session in sessions.items():
+        trie.add(topic_filter, session, 1)
+    assert trie.count == len(filters)
+
+    def matched(topic):
+        return {f for node in trie.match(topic) for f, s in sessions.items() if s in node.subscribers}
+
+    assert matched("a/b") == {"a/b", "a/+", "a/#", "+/b", "#"}
+    assert matched("a") == {"a/#", "#"}          # "a/#" 也比對上一層
+    assert matched("a/b/c") == {"a/#", "#"}
+    # $ 開頭的主題不被頂層萬用字元比對
+    assert matched("$SYS/broker/load") == {"$SYS/#", "$SYS/+/load"}
+    for topic in ("a/b", "a", "a/b/c", "$SYS/broker/load"):
+        assert {f for f in filters if topic_matches(f, topic)} == matched(topic)
+
+    assert trie.remove("a/+", sessions["a/+"])
+    assert not trie.remove("a/+", sessions["a/+"])
+    assert matched("a/x") == {"a/#", "#"}
+    for topic_filter, session in sessions.items():
+        trie.remove(topic_filter, session)
+    assert trie.count == 0 and not trie.root.children
+
+
+@pytest.mark.parametrize("topic_filter,valid", [
+    ("a/+/c", True), ("a/#", True), ("#", True), ("$share/g/a/+", True),
+    ("a/#/c", False), ("a/b#", False), ("a+/b", False), ("", False), ("$share/g", False),
+])
+def test_valid_filter(topic_filter, valid):
+    assert valid_filter(topic_filter) is valid
+
+
+def test_retained_message_sent_on_subscribe_and_cleared(broker):
+    port = broker.ports["plain"]
+    publisher = RawClient(port, "pub")
+    publisher.publish("config/setting", b"v1", retain=True)
+    publisher.publish("config/setting", b"v2", retain=True)
+
+    subscriber = RawClient(port, "sub")
+    subscriber.subscribe("config/#")
+    assert subscriber.receive() == ("config/setting", b"v2", 1, False, True)
+
+    # 線上訂閱者收到的即時訊息不帶 retain 旗標
+    publisher.publish("config/setting", b"v3", retain=True)
+    assert subscriber.receive()[1:] == (b"v3", 2, False, False)
+
+    # 空內容清除 retained
+    publisher.publish("config/setting", b"", retain=True)
+    subscriber.receive()
+    late = RawClient(port, "late")
+    late.subscribe("config/#")
+    assert late.nothing_pending()
+    assert broker.stats()["retained"] == 0
+
+
+def test_will_published_only_on_abnormal_disconnect(broker):
+    port = broker.ports["plain"]
+    watcher = RawClient(port, "watcher")
+    watcher.subscribe("status/+")
+
+    graceful = RawClient(port, "graceful", will=("status/graceful", b"offline"))
+    graceful.disconnect()
+    assert watcher.nothing_pending()
+
+    crashed = RawClient(port, "crashed", will=("status/crashed", b"offline"))
+    crashed.drop()
+    topic, payload, *_ = watcher.receive()
+    assert (topic, payload) == ("status/crashed", b"offline")
+
+
+def test_qos1_redelivered_with_dup_after_reconnect(broker):
+    port = broker.ports["plain"]
+    subscriber = RawClient(port, "worker", clean=False)
+    subscriber.subscribe("cmd/point")
+    publisher = RawClient(port, "pub")
+    publisher.publish("cmd/point", b"p1")
+
+    topic, payload, pid, dup, _ = subscriber.receive(ack=False)
+    assert (topic, payload, dup) == ("cmd/point", b"p1", False)
+    subscriber.drop()
+
+    resumed = RawClient(port, "worker", clean=False)
+    assert resumed.session_present
+    assert resumed.receive() == ("cmd/point", b"p1", pid, True, False)
+    _wait_for(lambda: not broker.sessions["worker"].inflight)
+    resumed.disconnect()
+
+    # 已確認的訊息不會再送
+    again = RawClient(port, "worker", clean=False)
+    assert again.nothing_pending()
+
+
+def test_persistent_session_queues_while_offline(broker):
+    port = broker.ports["plain"]
+    subscriber = RawClient(port, "worker", clean=False)
+    subscriber.subscribe("cmd/#")
+    subscriber.disconnect()
+
+    publisher = RawClient(port, "pub")
+    for i in range(3):
+        publisher.publish(f"cmd/{i}", str(i).encode())
+    publisher.publish("cmd/x", b"qos0", qos=0)   # 離線時 QoS 0 不排隊
+
+    resumed = RawClient(port, "worker", clean=False)
+    assert resumed.session_present
+    assert [resumed.receive()[:2] for _ in range(3)] == [(f"cmd/{i}", str(i).encode()) for i in range(3)]
+    assert resumed.nothing_pending()
+    resumed.disconnect()
+
+    # clean session 捨棄舊的訂閱
+    fresh = RawClient(port, "worker", clean=True)
+    assert not fresh.session_present
+    publisher.publish("cmd/3", b"3")
+    assert fresh.nothing_pending()
+
+
+def test_shared_subscription_distributes_once_per_message(broker):
+    port = broker.ports["plain"]
+    members = [RawClient(port, f"member-{i}") for i in range(3)]
+    for member in members:
+        member.subscribe("$share/workers/cmd/+")
+    observer = RawClient(port, "observer")
+    observer.subscribe("cmd/#")
+
+    publisher = RawClient(port, "pub")
+    total = 30
+    for i in range(total):
+        publisher.publish(f"cmd/{i % 2}", str(i).encode())
+
+    observed = [observer.receive()[1] for _ in range(total)]
+    assert observed == [str(i).encode() for i in range(total)]
+    received = []
+    for member in members:
+        payloads = [member.receive()[1] for _ in range(total // len(members))]
+        assert member.nothing_pending()
+        received.extend(payloads)
+    # 每則訊息只交給群組內一個成員，且平均分攤
+    assert sorted(received) == sorted(observed)
+
+
+@pytest.mark.parametrize("protocol", ["311", "5"])
+def test_a_and_b_round_trip(broker, monkeypatch, protocol):
+    port = broker.ports["plain"]
+    for module in (a_client, b_client_simulator):
+        monkeypatch.setattr(module, "BROKER_HOST", "127.0.0.1")
+        monkeypatch.setattr(module, "PORT", port)
+
+    b = b_client_simulator.BMQTTClient(protocol)
+    b.processing_delay = 0.0
+    b.setup_client()
+    a = a_client.MQTTClient(protocol)
+    a.setup_client()
+    assert b.connect() and a.connect()
+    b.client.loop_start()
+    threading.Thread(target=a.start_loop, daemon=True).start()
+    try:
+        _wait_for(lambda: a.is_connected and b.is_connected, timeout=5)
+        time.sleep(0.3)   # 等待訂閱生效與 B 的設定送達
+        result = a.send_point_and_wait(1.0, 2.0, timeout=5.0, retries=0)
+        assert result is not None
+        assert a.result_metrics() == {"duplicate": 0, "late": 0, "unknown": 0}
+    finally:
+        a.disconnect()
+        b.disconnect()
+        b.client.loop_stop()
+    assert broker.stats()["published"] > 0
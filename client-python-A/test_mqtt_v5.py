@@ -0,0 +1,101 @@
+import threading
+import uuid
+
+import pytest
+
+import mqtt_v5
+from mqtt_v5 import TopicAliasTable
+
+
+class RecordingClient:
+    """記錄 publish 的呼叫順序"""
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, getattr(properties, "TopicAlias", None)))
+
+
+def test_parse_protocol():
+    assert mqtt_v5.parse_protocol("v5") == mqtt_v5.PROTOCOL_V5
+    assert mqtt_v5.parse_protocol(" 3.1.1 ") == mqtt_v5.PROTOCOL_V311
+    with pytest.raises(ValueError):
+        mqtt_v5.parse_protocol("4")
+
+
+def test_correlation_round_trip():
+    req_id = str(uuid.uuid4())
+    data = mqtt_v5.encode_correlation(req_id)
+    assert len(data) == 16
+    assert mqtt_v5.decode_correlation(data) == req_id
+    # 非 UUID 以 UTF-8 傳送
+    assert mqtt_v5.encode_correlation("job-7") == b"job-7"
+    assert mqtt_v5.decode_correlation(bytearray(b"job-7")) == "job-7"
+
+
+def test_request_and_response_properties():
+    req_id = str(uuid.uuid4())
+    props = mqtt_v5.request_properties(req_id, "v1/x/telemetry/result/A", 2.2)
+    assert props.ResponseTopic == "v1/x/telemetry/result/A"
+    assert props.MessageExpiryInterval == 3
+    assert mqtt_v5.decode_correlation(props.CorrelationData) == req_id
+    assert not hasattr(props, "TopicAlias")
+    assert mqtt_v5.response_properties(None) is None
+    assert mqtt_v5.response_properties(props.CorrelationData).CorrelationData == props.CorrelationData
+
+
+def test_resolve_establishes_alias_once():
+    table = TopicAliasTable()
+    table.reset(2)
+    assert table.resolve("a") == ("a", 1)
+    assert table.resolve("a") == ("", 1)
+    assert table.resolve("b") == ("b", 2)
+    assert table.resolve("c") == ("c", None)      # 超過上限原樣送出
+
+
+def test_qos1_never_aliased():
+    table = TopicAliasTable()
+    table.reset(10)
+    assert table.resolve("a", qos=1) == ("a", None)
+    client = RecordingClient()
+    for _ in range(3):
+        table.publish(client, "a", b"", 1, lambda alias: mqtt_v5.response_properties(b"x", alias))
+    assert client.published == [("a", None)] * 3
+
+
+def test_reset_starts_new_connection_and_lowers_maximum():
+    table = TopicAliasTable()
+    table.reset(3)
+    for topic in ("a", "b", "c"):
+        table.resolve(topic)
+        table.resolve(topic)
+    table.reset(2)
+    # alias 只在原連線有效：重連後第一次仍送完整主題
+    assert table.resolve("a") == ("a", 1)
+    assert table.resolve("b") == ("b", 2)
+    # 新上限之外的 alias 不再使用
+    assert table.resolve("c") == ("c", None)
+    table.reset(0)
+    assert table.resolve("a") == ("a", None)
+
+
+def test_publish_sends_full_topic_before_alias_only():
+    table = TopicAliasTable()
+    table.reset(10)
+    client = RecordingClient()
+    start = threading.Barrier(8)
+
+    def sender():
+        start.wait()
+        for _ in range(50):
+            table.publish(client, "v1/x/cmd/point", b"", 0,
+                          lambda alias: mqtt_v5.response_properties(None, alias))
+
+    threads = [threading.Thread(target=sender) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert client.published[0] == ("v1/x/cmd/point", 1)
+    assert client.published[1:] == [("", 1)] * 399
@@ -0,0 +1,115 @@
+import pstats
+import threading
+import time
+
+import pytest
+
+from local_bus import LocalBroker
+from profiling import Profiler
+
+
+def _wait_for(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+def _alive(name: str) -> bool:
+    return any(t.name == name for t in threading.enumerate())
+
+
+def busy_marker(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sum(range(100))
+
+
+def test_sample_mode_writes_folded_stacks(tmp_path):
+    path = tmp_path / "a.prof"
+    profiler = Profiler(str(path), window=0.3, mode="sample", interval=0.005, ping_interval=0)
+    worker = threading.Thread(target=busy_marker, args=(0.4,), name="busy")
+    worker.start()
+    # 擷取時間窗結束後取樣線程自行寫出並結束
+    _wait_for(path.exists)
+    _wait_for(lambda: not _alive("profiler"))
+    worker.join()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    stacks = dict(line.rsplit(" ", 1) for line in lines)
+    busy = [stack for stack in stacks if stack.startswith("busy;") and "busy_marker (test_profiling.py:" in stack]
+    assert busy and all(int(count) > 0 for count in stacks.values())
+
+    profiler.stop()
+    assert path.with_name("a.prof.txt").exists()
+
+
+def test_stop_before_window_ends(tmp_path):
+    path = tmp_path / "a.prof"
+    profiler = Profiler(str(path), window=60, mode="sample", interval=0.005, ping_interval=0)
+    wrapped = profiler.wrap("A.process", lambda x: x * 2)
+    assert wrapped(21) == 42 and wrapped.__wrapped__ is not None
+    profiler.stop()
+    _wait_for(lambda: not _alive("profiler"))
+    assert path.exists()
+    summary = path.with_name("a.prof.txt").read_text(encoding="utf-8")
+    assert "A.process" in summary
+    # 重複呼叫不再寫出
+    path.with_name("a.prof.txt").unlink()
+    profiler.stop()
+    assert not path.with_name("a.prof.txt").exists()
+
+
+def test_cprofile_mode_profiles_callbacks(tmp_path):
+    path = tmp_path / "a.pstats"
+    profiler = Profiler(str(path), window=60, mode="cprofile", ping_interval=0)
+
+    def on_message(client, userdata, msg):
+        busy_marker(0.01)
+
+    def failing(client, userdata, msg):
+        raise RuntimeError("boom")
+
+    callback = profiler.wrap_callback("A.on_message", on_message)
+    for _ in range(3):
+        callback(None, None, object())
+    with pytest.raises(RuntimeError):
+        profiler.wrap_callback("A.failing", failing)(None, None, object())
+    profiler.stop()
+
+    stats = pstats.Stats(str(path))
+    assert any(func[2] == "busy_marker" for func in stats.stats)
+    snapshot = profiler.snapshot()
+    assert snapshot["A.on_message"]["count"] == 3 and snapshot["A.on_message"]["errors"] == 0
+    assert snapshot["A.failing"]["errors"] == 1
+    with pytest.raises(ValueError):
+        Profiler(str(path), mode="trace")
+
+
+def test_loop_lag_ping(tmp_path):
+    path = tmp_path / "a.prof"
+    profiler = Profiler(str(path), window=60, mode="sample", ping_interval=0.02)
+    client = LocalBroker().client("A-test")
+    received = []
+    client.on_message = lambda c, userdata, msg: received.append(msg.topic)
+    profiler.instrument(client, "A.")
+    assert _alive("profiler-ping-A.")
+    client.connect()
+    client.loop_start()
+    client.subscribe("data", qos=0)
+    try:
+        _wait_for(lambda: profiler.snapshot().get("A.loop_lag", {}).get("count", 0) >= 3)
+        client.publish("data", "x")
+        _wait_for(lambda: received)
+        # ping 由包裝的 on_message 攔截，不交給原本的回調
+        assert received == ["data"]
+        snapshot = profiler.snapshot()
+        assert snapshot["A.ping_rtt"]["count"] == snapshot["A.loop_lag"]["count"]
+        assert snapshot["A.loop_lag"]["p50_ms"] <= snapshot["A.ping_rtt"]["max_ms"]
+    finally:
+        profiler.stop()
+        client.disconnect()
+        client.loop_stop()
+    _wait_for(lambda: not _alive("profiler-ping-A."))
+    summary = path.with_name("a.prof.txt").read_text(encoding="utf-8")
+    assert "A.loop_lag" in summary and "A.on_message" in summary
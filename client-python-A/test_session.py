@@ -0,0 +1,205 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from b_client_simulator import TOP_CMD_POINT, TOP_RESULT, BMQTTClient
+from session import ControlLane, Session, SessionAborted, SessionManager, abort_payload
+
+
+def test_session_cancel_wakes_waiters():
+    session = Session("s1")
+    ev = threading.Event()
+    session.track("r1", ev)
+    assert session.pending() == ["r1"]
+    session.check()
+    assert session.cancel("operator")
+    assert not session.cancel("again")
+    assert ev.is_set() and session.reason == "operator"
+    with pytest.raises(SessionAborted):
+        session.check()
+    # 中止後才開始等待的請求立即返回
+    late = threading.Event()
+    session.track("r2", late)
+    assert late.is_set()
+    session.untrack("r1")
+    session.untrack("r2")
+    assert session.pending() == []
+
+
+def test_duplicate_start_rejected():
+    manager = SessionManager()
+    session, superseded = manager.start("s1", "job")
+    assert session.session_id == "s1" and superseded is None
+    # QoS 1 重複投遞的 START
+    assert manager.start("s1", "job") == (None, None)
+    # 相同 job_id 的新 session 視為重複觸發
+    assert manager.start("s2", "job") == (None, None)
+    assert manager.current is session
+    manager.finish(session)
+    # 已結束的 session_id 不再啟動
+    assert manager.start("s1", "job") == (None, None)
+
+
+def test_start_without_session_id_always_new():
+    manager = SessionManager()
+    first, _ = manager.start()
+    second, superseded = manager.start()
+    assert first.session_id != second.session_id
+    assert superseded is first and first.cancelled
+
+
+def test_supersede_cancels_running_session():
+    cancelled = []
+    manager = SessionManager(on_cancel=cancelled.append)
+    old, _ = manager.start("s1", "job-a")
+    new, superseded = manager.start("s2", "job-b")
+    assert superseded is old and old.cancelled
+    assert old.reason == "superseded by s2"
+    assert cancelled == [old]
+    # supersede=True 時相同 job_id 也取代
+    newer, superseded = manager.start("s3", "job-b", supersede=True)
+    assert superseded is new and manager.current is newer
+    # 被取代的 session 結束時不清掉目前的 session
+    manager.finish(old)
+    assert manager.current is newer
+
+
+def test_abort_current_and_unknown_sessions():
+    cancelled = []
+    manager = SessionManager(on_cancel=cancelled.append)
+    session, _ = manager.start("s1")
+    ev = threading.Event()
+    session.track("r1", ev)
+    assert manager.abort("other") is None
+    assert not session.cancelled
+    assert manager.abort("s1", "operator") is session
+    assert ev.is_set() and cancelled == [session]
+    # 已中止的 session 不再觸發 on_cancel
+    assert manager.abort("s1") is None
+    assert cancelled == [session]
+    # 尚未開始的 session 先被中止，之後到達的 START 直接忽略
+    assert manager.abort("s9") is None
+    manager.finish(session)
+    assert manager.start("s9") == (None, None)
+
+
+def test_finish_clears_current_and_allows_next_run():
+    manager = SessionManager()
+    session, _ = manager.start("s1", "job")
+    manager.abort()
+    manager.finish(session)
+    assert manager.current is None
+    next_session, superseded = manager.start("s2", "job")
+    assert next_session is not None and superseded is None
+
+
+class FakeClient:
+    """paho Client 的替身：記錄 subscribe/publish 與連線操作"""
+
+    def __init__(self):
+        self.calls = []
+        self.published = []
+
+    def subscribe(self, topic, qos=0):
+        self.calls.append(("subscribe", topic, qos))
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.published.append((topic, payload, qos))
+
+    def connect(self, host, port, keepalive=60):
+        self.calls.append(("connect", host, port, keepalive))
+
+    def loop_start(self):
+        self.calls.append(("loop_start",))
+
+    def disconnect(self):
+        self.calls.append(("disconnect",))
+
+    def loop_stop(self):
+        self.calls.append(("loop_stop",))
+
+
+def test_control_lane():
+    client = FakeClient()
+    received = []
+    lane = ControlLane(client, "v1/x/ctrl/abort", received.append)
+    assert client.on_connect == lane._on_connect and client.on_message == lane._on_message
+
+    lane.connect("127.0.0.1", 1883, 30)
+    client.on_connect(client, None, None, 5)
+    client.on_connect(client, None, None, 0)
+    assert client.calls == [("connect", "127.0.0.1", 1883, 30), ("loop_start",),
+                            ("subscribe", "v1/x/ctrl/abort", 1)]
+
+    payload = abort_payload("s1", "A", "operator")
+    lane.publish(payload)
+    assert client.published == [("v1/x/ctrl/abort", payload, 1)]
+
+    # 只把可解析的物件交給 handler
+    for raw in (payload.encode(), b"not json", b"[1, 2]"):
+        client.on_message(client, None, SimpleNamespace(topic=lane.topic, payload=raw))
+    assert [d["session_id"] for d in received] == ["s1"]
+    assert received[0]["type"] == "abort" and received[0]["sender"] == "A"
+
+    lane.close()
+    assert client.calls[-2:] == [("disconnect",), ("loop_stop",)]
+
+
+@pytest.fixture
+def b_client():
+    b = BMQTTClient("311", max_concurrency=1)
+    b.client = FakeClient()
+    b.is_connected = True
+    b.spectrum_format = "json"
+    b.processing_delay = 0.5
+    return b
+
+
+def _command(req_id, session_id):
+    return {"type": "move_point", "req_id": req_id, "session_id": session_id,
+            "point": {"x": 1.0, "y": 2.0}, "sender": "A"}
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待逾時"
+        time.sleep(0.01)
+
+
+def _results(b):
+    return [json.loads(payload)["req_id"] for topic, payload, _ in b.client.published if topic == TOP_RESULT]
+
+
+def test_b_drops_queued_commands_of_aborted_session(b_client):
+    running = threading.Thread(target=b_client.process_point_command, args=(_command("r1", "s1"),))
+    running.start()
+    _wait_for(lambda: b_client.in_flight == 1)
+    queued = threading.Thread(target=b_client.process_point_command, args=(_command("r2", "s1"),))
+    queued.start()
+    _wait_for(lambda: b_client.queued == 1)
+
+    b_client._on_abort(json.loads(abort_payload("s1", "A")))
+    # 排隊中的指令立即放棄等待，不必等處理中的點位完成
+    queued.join(timeout=0.3)
+    assert not queued.is_alive() and running.is_alive()
+    assert b_client.dropped == 1 and b_client.queued == 0
+
+    # 之後才到達的同 session 指令在 on_message 就丟棄，不啟動處理線程
+    msg = SimpleNamespace(topic=TOP_CMD_POINT, payload=json.dumps(_command("r3", "s1")).encode(),
+                          properties=None)
+    b_client.on_message(b_client.client, None, msg)
+    assert b_client.dropped == 2
+
+    running.join(timeout=2)
+    assert not running.is_alive()
+    # 處理中的點位完成後也不送出已中止 session 的結果，並釋放名額
+    assert _results(b_client) == []
+    assert b_client.load_snapshot()["in_flight"] == 0
+
+    b_client.processing_delay = 0.0
+    b_client.process_point_command(_command("r4", "s2"))
+    assert _results(b_client) == ["r4"]
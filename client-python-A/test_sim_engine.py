@@ -0,0 +1,139 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from sim_engine import (BatchGenerator, FixedLatency, LatencyModel, LognormalLatency, SimulatorEngine,
+                        TailSpikeLatency, TravelLatency, parse_latency_model)
+
+POINTS = [(0.0, 0.0), (3.0, 4.0), (-2.5, 1.0), (10.0, -7.0)]
+
+
+def test_latency_model_is_abstract():
+    with pytest.raises(TypeError):
+        LatencyModel()
+
+    class Incomplete(LatencyModel):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def _run(seed, feature_set="vibration"):
+    engine = SimulatorEngine(seed=seed, feature_set=feature_set, spectrum_size=64,
+                             latency=parse_latency_model("spike:0.3,10+lognormal:0.5,0.3"))
+    latencies = [engine.sample_latency(x, y) for x, y in POINTS]
+    batch = engine.generate_batch(POINTS)
+    return latencies, batch
+
+
+@pytest.mark.parametrize("feature_set", ["basic", "vibration"])
+def test_seeded_engine_is_reproducible(feature_set):
+    latencies, batch = _run(7, feature_set)
+    again_latencies, again = _run(7, feature_set)
+    assert latencies == again_latencies
+    np.testing.assert_array_equal(batch["values"], again["values"])
+    np.testing.assert_array_equal(batch["spectrum"], again["spectrum"])
+    assert batch["values"].shape == (len(POINTS), len(SimulatorEngine(feature_set=feature_set).features))
+    assert batch["spectrum"].shape == (len(POINTS), 64) and batch["spectrum"].dtype == np.float32
+
+    other_latencies, other = _run(8, feature_set)
+    assert other_latencies != latencies
+    assert not np.array_equal(other["values"], batch["values"])
+
+
+def test_sample_latency_tracks_position():
+    engine = SimulatorEngine(seed=1, latency=TravelLatency(speed=10.0, analysis=0.2, min_move=0.1))
+    assert engine.sample_latency(0.0, 0.0) == pytest.approx(0.3)    # 未移動：min_move + 分析時間
+    assert engine.sample_latency(30.0, 40.0) == pytest.approx(5.2)  # 移動 50 單位
+    assert engine.sample_latency(30.0, 40.0) == pytest.approx(0.3)
+    assert SimulatorEngine().sample_latency(1.0, 1.0, default=2.0) == 2.0
+
+
+def test_unknown_feature_set():
+    with pytest.raises(ValueError):
+        SimulatorEngine(feature_set="audio")
+
+
+def test_parse_latency_model_valid():
+    model = parse_latency_model(" Fixed:2.5 ")
+    assert isinstance(model, FixedLatency) and model.seconds == 2.5
+    model = parse_latency_model("lognormal:0.5")
+    assert isinstance(model, LognormalLatency) and model.sigma == 0.25
+    model = parse_latency_model("travel:100,0.2,0.05")
+    assert (model.speed, model.analysis, model.min_move) == (100.0, 0.2, 0.05)
+    model = parse_latency_model("spike:0.01,10+travel:50")
+    assert isinstance(model, TailSpikeLatency) and isinstance(model.inner, TravelLatency)
+    assert (model.probability, model.factor, model.inner.speed) == (0.01, 10.0, 50.0)
+    # 尖峰機率 1 時一定放大
+    rng = np.random.default_rng(0)
+    assert parse_latency_model("spike:1,4+fixed:0.5").sample(rng, 0, 0, (0, 0)) == 2.0
+
+
+@pytest.mark.parametrize("spec", [
+    "", "gamma:1", "fixed", "fixed:", "fixed:abc", "fixed:1,2", "lognormal:0", "lognormal:1,2,3",
+    "spike:0.1", "spike:0.1,2+", "spike:x+fixed:1", "spike:0.1+gamma:1",
+])
+def test_parse_latency_model_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_latency_model(spec)
+
+
+def test_batch_generator_single_request_matches_engine():
+    generator = BatchGenerator(SimulatorEngine(seed=3, spectrum_size=16))
+    direct = SimulatorEngine(seed=3, spectrum_size=16)
+    for x, y in POINTS:
+        values, spectrum = generator.generate(x, y)
+        expected_values, expected_spectrum = direct.generate(x, y)
+        assert values == expected_values
+        np.testing.assert_array_equal(spectrum, expected_spectrum)
+    assert generator.stats() == {"batches": len(POINTS), "generated": len(POINTS), "mean_batch": 1.0}
+
+
+class SlowEngine(SimulatorEngine):
+    """generate_batch 較慢，讓同時到達的請求排入同一批"""
+
+    def generate_batch(self, points):
+        time.sleep(0.05)
+        return super().generate_batch(points)
+
+
+def test_batch_generator_merges_concurrent_requests():
+    generator = BatchGenerator(SlowEngine(seed=5), max_batch=8)
+    results = {}
+    start = threading.Barrier(32)
+
+    def worker(i):
+        start.wait()
+        results[i] = generator.generate(float(i), 0.0)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(32)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert len(results) == 32
+    for i, (values, spectrum) in results.items():
+        assert len(values) == 4 and spectrum is None
+        # 溫度隨 |x| 上升，結果對應到自己的點位
+        assert 15 + i * 0.1 <= values[0] <= 35 + i * 0.1
+    stats = generator.stats()
+    assert stats["generated"] == 32
+    assert 4 <= stats["batches"] < 32
+    assert stats["mean_batch"] <= 8
+
+
+def test_batch_generator_propagates_errors():
+    class BrokenEngine(SimulatorEngine):
+        def generate_batch(self, points):
+            raise RuntimeError("boom")
+
+    generator = BatchGenerator(BrokenEngine())
+    with pytest.raises(RuntimeError, match="boom"):
+        generator.generate(0.0, 0.0)
+    # 失敗後仍可處理下一個請求
+    generator.engine = SimulatorEngine(seed=0)
+    values, _ = generator.generate(0.0, 0.0)
+    assert len(values) == 4
@@ -0,0 +1,65 @@
+import math
+import random
+
+import pytest
+
+from spatial_index import AUTO_CELLS, SpatialIndex
+
+
+def brute_nearest(points, x, y, k):
+    return sorted(math.hypot(px - x, py - y) for px, py in points)[:k]
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(1)
+    points = [(rng.uniform(-50, 50), rng.uniform(-50, 50)) for _ in range(500)]
+    index = SpatialIndex(cell_size=3.0)
+    for x, y in points:
+        index.insert(x, y, {"v": x + y})
+    assert len(index) == 500
+    for _ in range(20):
+        qx, qy = rng.uniform(-80, 80), rng.uniform(-80, 80)
+        got = [n.distance for n in index.nearest(qx, qy, k=5)]
+        assert got == pytest.approx(brute_nearest(points, qx, qy, 5))
+
+
+def test_within_radius():
+    index = SpatialIndex(cell_size=1.0)
+    for i in range(10):
+        index.insert(i, 0, {})
+    found = index.within(4.2, 0, 1.5)
+    assert [n.x for n in found] == [4.0, 5.0, 3.0]
+    assert index.within(100, 100, 1) == []
+    assert SpatialIndex().nearest(0, 0) == []
+
+
+def test_interpolate_idw():
+    index = SpatialIndex(cell_size=1.0)
+    index.insert(0, 0, {"t": 10.0, "bad": float("nan")})
+    index.insert(2, 0, {"t": 20.0})
+    est = index.interpolate(1, 0, k=2)
+    assert est["values"] == {"t": pytest.approx(15.0)}      # 非有限值不存入
+    assert est["spread"]["t"] == pytest.approx(5.0)
+    assert est["neighbors"] == 2 and est["nearest"] == 1.0
+    # 與量測點重合時直接使用該點
+    assert index.interpolate(2, 0)["values"]["t"] == 20.0
+    assert index.interpolate(10, 10, radius=1.0) is None
+
+
+def test_configure_rebuckets_and_reset():
+    index = SpatialIndex()
+    index.insert(3.5, 3.5, {"t": 1.0})
+    index.configure({"scan_area": {"x_min": 0, "x_max": 128, "y_min": 0, "y_max": 64}})
+    assert index.cell_size == 128 / AUTO_CELLS
+    assert index.nearest(3, 3)[0].x == 3.5
+    # 跨執行保留，只有明確 reset 才清除
+    assert index.per_run is False
+    index.reset()
+    assert len(index) == 0
+
+
+def test_update_as_aggregator():
+    index = SpatialIndex(cell_size=1.0)
+    index.update(1, 2, ["t", "p"], [3.0, 4.0])
+    assert index.nearest(1, 2)[0].values == {"t": 3.0, "p": 4.0}
+    assert index.snapshot() == {"points": 1, "cells": 1, "cell_size": 1.0}
@@ -0,0 +1,85 @@
+import os
+import shutil
+import ssl
+import subprocess
+
+import paho.mqtt.client as mqtt
+import pytest
+
+import tls
+from bench_tls import CERT_SCRIPT, _wait, measure_connect
+from mini_broker import MiniBroker
+
+pytestmark = pytest.mark.skipif(shutil.which("openssl") is None, reason="需要 openssl 生成自簽憑證")
+
+
+@pytest.fixture(scope="module")
+def certs(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("certs"))
+    subprocess.run(["bash", CERT_SCRIPT, directory], check=True, stdout=subprocess.DEVNULL)
+    return directory
+
+
+@pytest.fixture(scope="module")
+def broker(certs):
+    server_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_ctx.load_cert_chain(os.path.join(certs, "server.crt"), os.path.join(certs, "server.key"))
+    broker = MiniBroker(port=0, ssl_context=server_ctx, tls_port=0).start_background()
+    yield broker
+    broker.stop_background()
+
+
+def test_session_resumed_on_reconnect(certs, broker):
+    context = tls.create_context(os.path.join(certs, "ca.crt"))
+    # 第一條連線完整握手，之後的新連線都續用保存的 session
+    measure_connect("localhost", broker.ports["tls"], context, rounds=3, insecure=False, warmup=1)
+    assert context.stats() == {"handshakes": 4, "resumed": 3, "sessions": 1}
+
+    # 不同的主機名是不同的 key，不續用 localhost 的 session
+    context.check_hostname = False
+    measure_connect("127.0.0.1", broker.ports["tls"], context, rounds=1, insecure=True, warmup=0)
+    assert context.stats() == {"handshakes": 5, "resumed": 3, "sessions": 2}
+
+    context.forget()
+    measure_connect("localhost", broker.ports["tls"], context, rounds=1, insecure=False, warmup=0)
+    assert context.stats()["resumed"] == 3
+
+
+def test_resume_disabled(certs, broker):
+    context = tls.create_context(os.path.join(certs, "ca.crt"), resume=False)
+    measure_connect("localhost", broker.ports["tls"], context, rounds=2, insecure=False)
+    assert context.stats() == {"handshakes": 0, "resumed": 0, "sessions": 0}
+
+
+def test_untrusted_certificate_rejected(broker):
+    context = tls.create_context()   # 系統 CA 不信任自簽憑證
+    with pytest.raises(ssl.SSLCertVerificationError):
+        measure_connect("localhost", broker.ports["tls"], context, rounds=1, insecure=False, warmup=0)
+    assert context.stats()["resumed"] == 0
+
+
+def test_apply_shares_context_between_clients(certs, broker, monkeypatch):
+    context = tls.create_context(os.path.join(certs, "ca.crt"))
+    monkeypatch.setattr(tls, "_context", context)
+    assert tls.enabled() and tls.port(4883) == tls.TLS_PORT
+
+    # A 的主連線與控制通道共用 context，第二條連線續用第一條的 session
+    for name in ("A-test", "A-test-ctrl"):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=name)
+        tls.apply(client)
+        connected = []
+        client.on_connect = lambda c, u, f, rc, p=None: connected.append(rc)
+        client.connect("localhost", broker.ports["tls"], keepalive=30)
+        _wait(client, lambda: connected, 10.0)
+        assert not connected[0].is_failure
+        client.disconnect()
+        client.loop(0.01)
+    assert tls.stats() == {"handshakes": 2, "resumed": 1, "sessions": 1}
+
+
+def test_disabled_tls_leaves_client_untouched(monkeypatch):
+    monkeypatch.setattr(tls, "_context", None)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id="plain")
+    tls.apply(client)
+    assert client._ssl_context is None
+    assert not tls.enabled() and tls.port(4883) == 4883 and tls.stats() is None
@@ -0,0 +1,187 @@
+"""
+MQTT over TLS 與 TLS session 續用（選用）
+以 MQTT_TLS=1 或各工具的 --tls 啟用，連線改用 MQTT_TLS_PORT（默認 4884）：
+- 同一程序內的連線共用一個 SSLContext，並保存 broker 發出的 session ticket；
+  重新連線、控制通道與同程序的多個 client 以 session 續用略過憑證交換與金鑰協商
+- TLS 1.3 的 ticket 在握手完成後才送達，因此於第一次讀取後才保存
+未啟用時 apply() 不修改 client，連線維持純 TCP
+"""
+
+import logging
+import os
+import ssl
+import threading
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TLS_ENABLED = os.getenv("MQTT_TLS", "0") != "0"
+TLS_PORT = int(os.getenv("MQTT_TLS_PORT", "4884"))
+CA_FILE = os.getenv("MQTT_TLS_CA", "")           # 空字串表示使用系統信任的 CA
+CERT_FILE = os.getenv("MQTT_TLS_CERT", "")       # 客戶端憑證（broker 要求雙向驗證時）
+KEY_FILE = os.getenv("MQTT_TLS_KEY", "")
+INSECURE = os.getenv("MQTT_TLS_INSECURE", "0") != "0"   # 不比對主機名（仍驗證憑證鏈）
+RESUME = os.getenv("MQTT_TLS_RESUME", "1") != "0"       # 0 表示每次連線都完整握手
+
+
+class _ResumingSocket(ssl.SSLSocket):
+    """握手後與第一次讀取後把 session 交給 context 保存"""
+
+    _resume_key: Optional[Tuple] = None
+
+    def do_handshake(self, *args, **kwargs):
+        super().do_handshake(*args, **kwargs)
+        if self._resume_key is not None:
+            self.context._handshake_done(self)
+
+    def recv(self, *args, **kwargs):
+        data = super().recv(*args, **kwargs)
+        if self._resume_key is not None:
+            self.context._remember(self)
+        return data
+
+
+class ResumingContext(ssl.SSLContext):
+    """
+    保存各 broker（主機名 + 位址）最近一次的 TLS session，新連線時帶入
+    session 過期或被 broker 拒絕時 OpenSSL 自動退回完整握手
+    """
+
+    sslsocket_class = _ResumingSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT, resume: bool = True):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT, resume: bool = True):
+        self.resume = resume
+        self._sessions: Dict[Tuple, ssl.SSLSession] = {}
+        self._session_lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        key = None
+        if self.resume and not server_side:
+            try:
+                key = (server_hostname, sock.getpeername())
+            except OSError:
+                key = None
+            if session is None and key is not None:
+                with self._session_lock:
+                    session = self._sessions.get(key)
+        ssock = super().wrap_socket(sock, server_side, do_handshake_on_connect,
+                                    suppress_ragged_eofs, server_hostname, session=session)
+        if key is not None:
+            ssock._resume_key = key
+            if do_handshake_on_connect:
+                self._handshake_done(ssock)
+        return ssock
+
+    def _handshake_done(self, ssock: _ResumingSocket):
+        with self._session_lock:
+            self.handshakes += 1
+            if ssock.session_reused:
+                self.resumed += 1
+        self._remember(ssock)
+
+    def _remember(self, ssock: _ResumingSocket):
+        session = ssock.session
+        if session is None or not session.has_ticket:
+            return
+        with self._session_lock:
+            self._sessions[ssock._resume_key] = session
+        # 每條連線只需保存一次
+        ssock._resume_key = None
+
+    def forget(self):
+        with self._session_lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._session_lock:
+            return {"handshakes": self.handshakes, "resumed": self.resumed,
+                    "sessions": len(self._sessions)}
+
+
+def create_context(cafile: str = "", certfile: str = "", keyfile: str = "",
+                   insecure: bool = False, resume: bool = True) -> ResumingContext:
+    context = ResumingContext(ssl.PROTOCOL_TLS_CLIENT, resume=resume)
+    if cafile:
+        context.load_verify_locations(cafile)
+    else:
+        context.load_default_certs()
+    if certfile:
+        context.load_cert_chain(certfile, keyfile or None)
+    context.check_hostname = not insecure
+    return context
+
+
+_context: Optional[ResumingContext] = None
+_insecure = INSECURE
+
+
+def configure(enabled: bool = TLS_ENABLED, cafile: str = CA_FILE, certfile: str = CERT_FILE,
+              keyfile: str = KEY_FILE, insecure: bool = INSECURE,
+              resume: bool = RESUME) -> Optional[ResumingContext]:
+    """啟用 TLS；已啟用時沿用同一個 context（保留已取得的 session）"""
+    global _context, _insecure
+    if enabled and _context is None:
+        _context = create_context(cafile, certfile, keyfile, insecure, resume)
+        _insecure = insecure
+        logger.info(f"TLS 已啟用（CA: {cafile or '系統預設'}，session 續用: {'開' if resume else '關'}）")
+    return _context
+
+
+def enabled() -> bool:
+    return _context is not None
+
+
+def get() -> Optional[ResumingContext]:
+    return _context
+
+
+def port(default: int) -> int:
+    """TLS 啟用時回傳 TLS 端口，否則回傳 default"""
+    return TLS_PORT if _context is not None else default
+
+
+def apply(client):
+    """TLS 啟用時讓 paho client 使用共用的 context"""
+    if _context is None:
+        return
+    client.tls_set_context(_context)
+    if _insecure:
+        client.tls_insecure_set(True)
+
+
+def stats() -> Optional[Dict[str, int]]:
+    return _context.stats() if _context is not None else None
+
+
+def add_arguments(parser):
+    """各工具共用的命令列參數"""
+    parser.add_argument('--tls', action='store_true', default=TLS_ENABLED,
+                        help=f'以 TLS 連線 (端口 MQTT_TLS_PORT，默認: {TLS_PORT})')
+    parser.add_argument('--cafile', default=CA_FILE or None,
+                        help='驗證 broker 憑證的 CA 檔案，例如 broker/certs/ca.crt (默認: 系統 CA)')
+    parser.add_argument('--tls-insecure', action='store_true', default=INSECURE,
+                        help='不比對 broker 主機名（以 IP 連線而憑證只含主機名時）')
+    parser.add_argument('--no-tls-resume', action='store_true', default=not RESUME,
+                        help='停用 TLS session 續用，每次連線都完整握手')
+
+
+def configure_from_args(args) -> Optional[ResumingContext]:
+    """依命令列參數啟用，並寫回環境變數讓子程序沿用"""
+    if not args.tls:
+        return _context
+    os.environ["MQTT_TLS"] = "1"
+    if args.cafile:
+        os.environ["MQTT_TLS_CA"] = args.cafile
+    os.environ["MQTT_TLS_INSECURE"] = "1" if args.tls_insecure else "0"
+    os.environ["MQTT_TLS_RESUME"] = "0" if args.no_tls_resume else "1"
+    return configure(True, args.cafile or "", CERT_FILE, KEY_FILE, args.tls_insecure,
+                     not args.no_tls_resume)
+
+
+configure()